@@ -5,9 +5,7 @@ from operator import itemgetter
 import ROOT
 import array
 
-BIT0_4 = 31
-BIT5 = 1 << 5
-BIT7 = 1 << 7
+from muonic.analysis.decoding import EDGE_TICKS, TRIGGER_FLAGS
 
 # For DAQ status
 BIT0 = 1 # 1 PPS interrupt pending
@@ -128,7 +126,7 @@ def analyze_files(filelist):
                     print "PPS:",onepps_count - last_onepps_count
                 last_onepps_count = onepps_count
 
-            trigger = (int(fields[1],16) & BIT7) != 0
+            trigger = TRIGGER_FLAGS[fields[1]]
 
             time = fields[10]
             correction = fields[15]
@@ -141,44 +139,44 @@ def analyze_files(filelist):
                 pulse2.invalidate()
                 pulse3.invalidate()
            
-            re0 = int(fields[1],16)
-            if re0 & BIT5 != 0:
-                time = line_time + (re0 & BIT0_4) * MINI_TICK
+            re0 = EDGE_TICKS[fields[1]]
+            if re0 is not None:
+                time = line_time + re0 * MINI_TICK
                 pulse0.rise(time)
                 if verbose: print "0> %10.12f"%(time,)
-            fe0 = int(fields[2],16)
-            if fe0 & BIT5 != 0:
-                time = line_time + (fe0 & BIT0_4) * MINI_TICK
+            fe0 = EDGE_TICKS[fields[2]]
+            if fe0 is not None:
+                time = line_time + fe0 * MINI_TICK
                 pulse0.fall(time)
                 if verbose: print "0< %10.12f"%(time,)
-            re1 = int(fields[3],16)
-            if re1 & BIT5 != 0:
-                time = line_time + (re1 & BIT0_4) * MINI_TICK
+            re1 = EDGE_TICKS[fields[3]]
+            if re1 is not None:
+                time = line_time + re1 * MINI_TICK
                 pulse1.rise(time)
                 if verbose: print "1> %10.12f"%(time,)
-            fe1 = int(fields[4],16)
-            if fe1 & BIT5 != 0:
-                time = line_time + (fe1 & BIT0_4) * MINI_TICK
+            fe1 = EDGE_TICKS[fields[4]]
+            if fe1 is not None:
+                time = line_time + fe1 * MINI_TICK
                 pulse1.fall(time)
                 if verbose: print "1< %10.12f"%(time,)
-            re2 = int(fields[5],16)
-            if re2 & BIT5 != 0:
-                time = line_time + (re2 & BIT0_4) * MINI_TICK
+            re2 = EDGE_TICKS[fields[5]]
+            if re2 is not None:
+                time = line_time + re2 * MINI_TICK
                 pulse2.rise(time)
                 if verbose: print "2> %10.12f"%(time,)
-            fe2 = int(fields[6],16)
-            if fe2 & BIT5 != 0:
-                time = line_time + (fe2 & BIT0_4) * MINI_TICK
+            fe2 = EDGE_TICKS[fields[6]]
+            if fe2 is not None:
+                time = line_time + fe2 * MINI_TICK
                 pulse2.fall(time)
                 if verbose: print "2< %10.12f"%(time,)
-            re3 = int(fields[7],16)
-            if re3 & BIT5 != 0:
-                time = line_time + (re3 & BIT0_4) * MINI_TICK
+            re3 = EDGE_TICKS[fields[7]]
+            if re3 is not None:
+                time = line_time + re3 * MINI_TICK
                 pulse3.rise(time)
                 if verbose: print "3> %10.12f"%(time,)
-            fe3 = int(fields[8],16)
-            if fe3 & BIT5 != 0:
-                time = line_time + (fe3 & BIT0_4) * MINI_TICK
+            fe3 = EDGE_TICKS[fields[8]]
+            if fe3 is not None:
+                time = line_time + fe3 * MINI_TICK
                 pulse3.fall(time)
                 if verbose: print "3< %10.12f"%(time,)
 
@@ -1,52 +1,125 @@
 #!/usr/bin/env python
 """
 Script for histograming the pulseswidth
-Usage python plot_pulses.py PULSEFILE
+Usage python plot_pulses.py PULSEFILE [PULSEFILE ...]
+
+The pulse files are read line by line into a histogram and a quantile
+sketch per channel, so the memory needed does not depend on the size of
+the files. The sketches can be saved and merged with sketches of other
+runs, e.g. the ones saved by muonic on exit.
 """
 from __future__ import print_function
-import sys
+import argparse
+import re
 
-import matplotlib.pylab as p
 import numpy as n
 
+try:
+    from muonic.analysis.histogram import FineHistogram
+    from muonic.analysis.quantiles import QuantileSketch
+except ImportError:
+    import os.path
+    muonic_path = os.path.abspath('../../muonic')
+    if not os.path.exists(muonic_path):
+        raise ImportError("Make sure muonic is properly installed or " +
+                          "set your PYTHONPATH or add a .pth file")
+    else:
+        import sys
+        sys.path.append(muonic_path)
+        from muonic.analysis.histogram import FineHistogram
+        from muonic.analysis.quantiles import QuantileSketch
+
+# pulse lists of the four channels and the pulses within
+PULSE_LIST_PATTERN = re.compile(r"\[([^\]]*)\]")
+PULSE_PATTERN = re.compile(r"\(\s*([-+.\deE]+)\s*,\s*([-+.\deE]+)\s*\)")
+
+COLORS = ['b', 'r', 'g', 'm']
+
+
+def read_pulse_widths(filename):
+    """
+    Iterate over the pulse widths of the events in a pulse file.
+
+    :param filename: pulse file
+    :type filename: str
+    :returns: generator of lists -- pulse widths of the four channels
+    """
+    with open(filename) as pulse_file:
+        for line in pulse_file:
+            if line.startswith("#"):
+                continue
+
+            pulse_lists = PULSE_LIST_PATTERN.findall(line)
+
+            if len(pulse_lists) != 4:
+                continue
+
+            yield [[float(fe) - float(re_) for re_, fe
+                    in PULSE_PATTERN.findall(pulses)]
+                   for pulses in pulse_lists]
+
 
 def plot_pulses():
-    f = open(sys.argv[1])
-
-    chan0 = []
-    chan1 = []
-
-    for line in f.readlines():
-        try:
-            line = line.split()
-            fe0 = line[2].split(')')[0]
-            fe1 = line[4].split(')')[0]
-            re0 = line[1].split('(')[1][:-1]
-            re1 = line[3].split('(')[1][:-1]
-            chan0.append(float(fe0) - float(re0))
-            chan1.append(float(fe1) - float(re1))
-        except:
-            pass
-
-    print(chan0, "Pulsewidths chan0")
-    print(chan1, "Pulsewidths chan1")
-
-    xmax = max([max(chan0), max(chan1)])
-    pulsebins = n.linspace(0, xmax, xmax+1)
-    hist0 = n.histogram(n.array(chan0), bins=pulsebins)
-    hist1 = n.histogram(n.array(chan1), bins=pulsebins)
-
-    # print(xmax)
-    # print(pulsebins)
-
-    baredges0 = n.linspace(0, hist0[1][-1], len(hist0[0]))
-    baredges1 = n.linspace(0, hist1[1][-1], len(hist1[0]))
-
-    p.ylim(ymax=1.2 * max([max(hist0[0]), max(hist1[0])]))
-    p.bar(baredges0, hist0[0], width=pulsebins[1] - pulsebins[0],
-          color='b', label='chan0')
-    p.bar(baredges1, hist1[0], width=pulsebins[1] - pulsebins[0],
-          color='r', alpha=0.5, label='chan1')
+    parser = argparse.ArgumentParser(
+            description="Histogram the pulse widths of pulse files")
+    parser.add_argument("files", nargs="*", help="pulse files")
+    parser.add_argument("-m", "--merge", nargs="*", default=[],
+                        help="pulse width sketches to merge")
+    parser.add_argument("-s", "--save", default=None,
+                        help="save the merged pulse width sketches")
+    parser.add_argument("--max-width", type=float, default=200.,
+                        help="upper limit of the histogram in ns")
+    parser.add_argument("--no-plot", action="store_true",
+                        help="only print the quantiles")
+    args = parser.parse_args()
+
+    sketches = [QuantileSketch() for _ in range(4)]
+    histograms = [FineHistogram(0, args.max_width, 1.) for _ in range(4)]
+
+    for filename in args.files:
+        for widths in read_pulse_widths(filename):
+            for chan, chan_widths in enumerate(widths):
+                if chan_widths:
+                    sketches[chan].extend(chan_widths)
+                    histograms[chan].fill(chan_widths)
+
+    for filename in args.merge:
+        for name, sketch in QuantileSketch.load(filename).items():
+            sketches[int(name[2:])].merge(sketch)
+
+    for chan, sketch in enumerate(sketches):
+        if not sketch.count:
+            continue
+
+        summary = sketch.summary()
+        print(("Pulsewidths chan%d: %d pulses, median %.1f ns, " +
+               "5%% %.1f ns, 95%% %.1f ns, min %.1f ns, max %.1f ns") %
+              (chan, summary["count"], summary["median"], summary["p5"],
+               summary["p95"], summary["min"], summary["max"]))
+
+    if args.save is not None:
+        QuantileSketch.save(args.save, dict(("ch%d" % chan, sketch)
+                                            for chan, sketch
+                                            in enumerate(sketches)))
+
+    if args.no_plot or not any(h.entries for h in histograms):
+        return
+
+    import matplotlib.pylab as p
+
+    edges = histograms[0].edges
+
+    for chan, hist in enumerate(histograms):
+        if not hist.entries:
+            continue
+
+        p.bar(edges[:-1], hist.counts, width=edges[1] - edges[0],
+              color=COLORS[chan], alpha=0.5, align='edge',
+              label='chan%d' % chan)
+        p.axvline(sketches[chan].median, color=COLORS[chan], ls='--')
+
+    p.xlim(0, edges[max(n.flatnonzero(h.counts).max()
+                        for h in histograms if h.entries) + 1])
     p.grid()
     p.legend()
     p.xlabel("Pulsewidth in ns")
@@ -3,9 +3,8 @@ import gzip
 import bz2
 from operator import itemgetter
 
-BIT0_4 = 31
-BIT5 = 1 << 5
-BIT7 = 1 << 7
+from muonic.analysis.coincidence import CoincidenceEngine
+from muonic.analysis.decoding import EDGE_TICKS, TRIGGER_FLAGS
 
 # For DAQ status
 BIT0 = 1 # 1 PPS interrupt pending
@@ -58,49 +57,8 @@ class Pulse(object):
         else:
             raise ValueError()
 
-def coroutine(func):
-    def start(*args,**kwargs):
-        cr = func(*args,**kwargs)
-        cr.next()
-        return cr
-    return start
-
-@coroutine
-def muon_finder(muon_callback, muon=((0,2),(0,3),(1,2),(1,3))):
-    def reset(d):
-        for key in d.iterkeys():
-            d[key] = 0.
-    
-    def coincidence_found(channels, muon):
-        for comb in muon:
-            coinc = True
-            for ch in comb:
-                if channels[ch] == 0.:
-                    coinc = False
-                    break
-            if coinc:
-                return True
-        return False
-
-    channels = {0:0.,1:0.,2:0.,3:0.}
-    lastpulse_time = 0.
-    while True:
-        pulse = (yield)
-        ch = pulse[0]
-        time = pulse[1]
-        if 0 < time - lastpulse_time < MUON_WIND or lastpulse_time == 0.:
-            channels[ch] = time
-            lastpulse_time = time
-        else:
-            if coincidence_found(channels, muon):
-                muon_callback(channels)
-            reset(channels)
-            channels[ch] = time
-            lastpulse_time = time
-
-def muon_printer(channels):
-    muon_time = min([t for t in channels.itervalues() if t != 0.])
-    print "MUON %10.3f"%muon_time,[k for k,v in channels.iteritems() if v != 0.0]
+def muon_printer(muon_time, channels):
+    print "MUON %10.3f"%(muon_time * 1e-9,),sorted(channels.keys())
 
 def analyze_files(filelist, callback=muon_printer):
 
@@ -111,7 +69,9 @@ def analyze_files(filelist, callback=muon_printer):
     pulse3 = Pulse(3)
 
     pulse_counter = 0
-    muon_decay = muon_finder(callback, muon=((0,2),(0,3),(1,2),(1,3)))
+    muon_finder = CoincidenceEngine(window=MUON_WIND * 1e9,
+                                    combinations=((0,2),(0,3),(1,2),(1,3)),
+                                    callback=callback)
     last_onepps_count = 0
     gps_valid = True
 
@@ -166,7 +126,7 @@ def analyze_files(filelist, callback=muon_printer):
                     print "PPS:",onepps_count - last_onepps_count
                 last_onepps_count = onepps_count
 
-            trigger = (int(fields[1],16) & BIT7) != 0
+            trigger = TRIGGER_FLAGS[fields[1]]
 
             time = fields[10]
             correction = fields[15]
@@ -179,44 +139,44 @@ def analyze_files(filelist, callback=muon_printer):
                 pulse2.invalidate()
                 pulse3.invalidate()
            
-            re0 = int(fields[1],16)
-            if re0 & BIT5 != 0:
-                time = line_time + (re0 & BIT0_4) * MINI_TICK
+            re0 = EDGE_TICKS[fields[1]]
+            if re0 is not None:
+                time = line_time + re0 * MINI_TICK
                 pulse0.rise(time)
                 if verbose: print "0> %10.12f"%(time,)
-            fe0 = int(fields[2],16)
-            if fe0 & BIT5 != 0:
-                time = line_time + (fe0 & BIT0_4) * MINI_TICK
+            fe0 = EDGE_TICKS[fields[2]]
+            if fe0 is not None:
+                time = line_time + fe0 * MINI_TICK
                 pulse0.fall(time)
                 if verbose: print "0< %10.12f"%(time,)
-            re1 = int(fields[3],16)
-            if re1 & BIT5 != 0:
-                time = line_time + (re1 & BIT0_4) * MINI_TICK
+            re1 = EDGE_TICKS[fields[3]]
+            if re1 is not None:
+                time = line_time + re1 * MINI_TICK
                 pulse1.rise(time)
                 if verbose: print "1> %10.12f"%(time,)
-            fe1 = int(fields[4],16)
-            if fe1 & BIT5 != 0:
-                time = line_time + (fe1 & BIT0_4) * MINI_TICK
+            fe1 = EDGE_TICKS[fields[4]]
+            if fe1 is not None:
+                time = line_time + fe1 * MINI_TICK
                 pulse1.fall(time)
                 if verbose: print "1< %10.12f"%(time,)
-            re2 = int(fields[5],16)
-            if re2 & BIT5 != 0:
-                time = line_time + (re2 & BIT0_4) * MINI_TICK
+            re2 = EDGE_TICKS[fields[5]]
+            if re2 is not None:
+                time = line_time + re2 * MINI_TICK
                 pulse2.rise(time)
                 if verbose: print "2> %10.12f"%(time,)
-            fe2 = int(fields[6],16)
-            if fe2 & BIT5 != 0:
-                time = line_time + (fe2 & BIT0_4) * MINI_TICK
+            fe2 = EDGE_TICKS[fields[6]]
+            if fe2 is not None:
+                time = line_time + fe2 * MINI_TICK
                 pulse2.fall(time)
                 if verbose: print "2< %10.12f"%(time,)
-            re3 = int(fields[7],16)
-            if re3 & BIT5 != 0:
-                time = line_time + (re3 & BIT0_4) * MINI_TICK
+            re3 = EDGE_TICKS[fields[7]]
+            if re3 is not None:
+                time = line_time + re3 * MINI_TICK
                 pulse3.rise(time)
                 if verbose: print "3> %10.12f"%(time,)
-            fe3 = int(fields[8],16)
-            if fe3 & BIT5 != 0:
-                time = line_time + (fe3 & BIT0_4) * MINI_TICK
+            fe3 = EDGE_TICKS[fields[8]]
+            if fe3 is not None:
+                time = line_time + fe3 * MINI_TICK
                 pulse3.fall(time)
                 if verbose: print "3< %10.12f"%(time,)
 
@@ -246,7 +206,9 @@ def analyze_files(filelist, callback=muon_printer):
             pulses.sort(key=itemgetter(1))
             for pulse in pulses:
                 if pulse[2] > 2.0:
-                    muon_decay.send(pulse)
+                    muon_finder.process_pulse(pulse[1] * 1e9, pulse[0])
+
+    muon_finder.flush()
 
 def main(argv=None):
     if argv is None:
@@ -16,7 +16,7 @@ DOC_PATH = path.abspath(path.join(
 
 DATA_PATH = path.join(getenv('HOME'), 'muonic_data')
 
-__all__ = ["util", "daq", "analysis", "gui"]
+__all__ = ["util", "daq", "analysis", "gui", "headless"]
 
 __version__ = "3.0.0"
 __author__ = ", ".join([author[0] for author in AUTHORS])
@@ -3,3 +3,14 @@ scripts and classes used for data analysis
 """
 from .analyzer import *
 from .fit import fit, gaussian_fit
+from .fit_engine import FitEngine, FitResult, BackgroundFitter
+from .fit_engine import ExponentialModel, GaussianModel
+from .histogram import FineHistogram
+from .lifetime import OnlineLifetimeEstimator, UnbinnedFitWorker
+from .lifetime import fit_lifetime, read_decay_times
+from .quantiles import QuantileSketch
+from .rate_archive import RateArchive, RateSeries, read_rate_file
+from .rates import RateRecorder
+from .resampling import resample, LifetimeFitter, GaussianFitter
+from .registry import AnalysisRegistry, PulseWidthAnalysis
+from .registry import VelocityAnalysis, DecayAnalysis, StreamingDecayAnalysis
@@ -8,31 +8,23 @@ import datetime
 import os
 import time
 
+import numpy as np
+
 from muonic.util import rename_muonic_file, get_hours_from_duration
-from muonic.util import WrappedFile
+from muonic.util import LockedFile
+from muonic.analysis.decoding import EDGE_TIMES, TRIGGER_FLAGS
+from muonic.analysis.batch import ACCEPTED
+from muonic.analysis.cuts import pulse_width, decay_cuts, velocity_cuts
+from muonic.analysis.cuts import rejection_reason, rejection_reasons
 
 __all__ = ["PulseExtractor", "DecayTriggerThorough", "VelocityTrigger"]
 
-# for the pulses 
-# 8 bits give a hex number
-# but only the first 5 bits are used for the pulses time,
-# the fifth bit flags if the pulse is considered valid
-# the seventh bit should be the trigger flag...
-
-BIT0_4 = 31
-BIT5 = 1 << 5
-BIT7 = 1 << 7
-
 # For DAQ status
 BIT0 = 1       # 1 PPS interrupt pending
 BIT1 = 1 << 1  # Trigger interrupt pending
 BIT2 = 1 << 2  # GPS data possible corrupted
 BIT3 = 1 << 3  # Current or last 1PPS rate not within range
 
-# tick size of tmc internal clock
-# documentation says 0.75, measurement says 1.25
-# TODO: find out if tmc is coupled to cpld!
-TMC_TICK = 1.25  # nsec
 # MAX_TRIGGER_WINDOW = 60.0  # nsec
 MAX_TRIGGER_WINDOW = 9960.0  # nsec for mudecay!
 DEFAULT_FREQUENCY = 25.0e6
@@ -50,9 +42,15 @@ class PulseExtractor:
     :type filename: str
     """
 
+    # attributes carried from one DAQ line to the next, see _update_counters
+    COUNTER_STATE = ("ini", "trigger_count", "last_trigger_count",
+                     "last_one_pps", "prev_last_one_pps", "last_time",
+                     "passed_one_pps", "last_one_pps_poll",
+                     "calculated_frequency")
+
     def __init__(self, logger, filename):
         self.logger = logger
-        self.pulse_file = WrappedFile(filename)
+        self.pulse_file = LockedFile(filename)
         self._write_pulses = False
 
         # start time and duration
@@ -71,6 +69,10 @@ class PulseExtractor:
         self.last_one_pps = 0
         self.last_trigger_time = 0
         self.trigger_count = 0
+
+        # trigger time of the event returned last
+        # in seconds since day start
+        self.last_event_time = 0
         self.last_time = 0
 
         # store the actual value of the trigger counter
@@ -155,24 +157,18 @@ class PulseExtractor:
         :type counter_diff: int
         :return: None
         """
-        
-        rising_edges = {
-            "ch0": int(line[1], 16), "ch1": int(line[3], 16),
-            "ch2": int(line[5], 16), "ch3": int(line[7], 16)
-        }
-        falling_edges = {
-            "ch0": int(line[2], 16), "ch1": int(line[4], 16),
-            "ch2": int(line[6], 16), "ch3": int(line[8], 16)
-        }
+        # look up all fields first, so that a malformed line
+        # does not leave a half decoded event behind
+        edge_times = [EDGE_TIMES[field] for field in line[1:9]]
 
-        for ch in ["ch0", "ch1", "ch2", "ch3"]:
-            re = rising_edges[ch]
-            fe = falling_edges[ch]
+        for index, ch in enumerate(["ch0", "ch1", "ch2", "ch3"]):
+            re = edge_times[2 * index]
+            fe = edge_times[2 * index + 1]
 
-            if re & BIT5:
-                self.re[ch].append(counter_diff + (re & BIT0_4) * TMC_TICK)
-            if fe & BIT5:
-                self.fe[ch].append(counter_diff + (fe & BIT0_4) * TMC_TICK)
+            if re is not None:
+                self.re[ch].append(counter_diff + re)
+            if fe is not None:
+                self.fe[ch].append(counter_diff + fe)
 
     def _order_and_clean_pulses(self):
         """
@@ -234,29 +230,32 @@ class PulseExtractor:
                                      self.calculated_frequency)
         return line_time
 
-    def extract(self, line):
+    def _update_counters(self, trigger_count, one_pps, time, trigger):
         """
-        Analyze subsequent lines (one per call)
-        and check if pulses are related to triggers
-        For each new trigger,
-        return the set of pulses which belong to that trigger,
-        otherwise return None
-
-        :param line: DAQ message
-        :type line: str
-        :returns: tuple
+        Advance the trigger counter, 1PPS and frequency bookkeeping by one
+        DAQ line. Besides the edges of the current event this is all the
+        state which is carried from one line to the next.
+
+        :param trigger_count: trigger counter of the line
+        :type trigger_count: int
+        :param one_pps: 1PPS counter of the line
+        :type one_pps: int
+        :param time: GPS time field of the line
+        :type time: str
+        :param trigger: True if the line carries the trigger flag
+        :type trigger: bool
+        :returns: tuple -- 1PPS counter to calculate the line time with and
+                  the time in ns since the previous line, the latter is None
+                  for trigger lines and lines before the first trigger
         """
-        line = line.split()
-
-        one_pps = int(line[9], 16)
-        trigger_count = int(line[0], 16)
-        time = line[10]
+        raw_one_pps = one_pps
 
         # correct for trigger count rollover
         if trigger_count < self.last_trigger_count:
             trigger_count += int(0xFFFFFFFF)  # counter offset
 
         self.trigger_count = trigger_count
+        evt_one_pps = one_pps
 
         if one_pps != self.last_one_pps:
             self.passed_one_pps += 1
@@ -280,15 +279,9 @@ class PulseExtractor:
 
             if time == self.last_time:
                 # correcting for delayed one_pps switch
-                line_time = self._get_evt_time(line[10], line[15],
-                                               trigger_count,
-                                               self.last_one_pps)
+                evt_one_pps = self.last_one_pps
             else:
-                line_time = self._get_evt_time(line[10], line[15],
-                                               trigger_count, one_pps)
-        else:
-            line_time = self._get_evt_time(line[10], line[15],
-                                           trigger_count, one_pps)
+                evt_one_pps = one_pps
 
         # storing the last two one_pps switches
         self.prev_last_one_pps = self.last_one_pps
@@ -296,17 +289,91 @@ class PulseExtractor:
 
         self.last_time = time
 
-        if int(line[1], 16) & BIT7:  # a trigger flag!
+        counter_diff = None
+
+        if trigger:
             self.ini = False
-             
+        elif self.ini:
+            self.last_one_pps = raw_one_pps
+        else:
+            counter_diff = (self.trigger_count - self.last_trigger_count)
+            # print(counter_diff, counter_diff > int(0xffffffff))
+            # FIXME: is this correct?
+            if counter_diff > int(0xffffffff):
+                counter_diff -= int(0xffffffff)
+
+            counter_diff /= self.calculated_frequency
+            counter_diff *= 1e9
+
+        self.last_trigger_count = trigger_count
+
+        return evt_one_pps, counter_diff
+
+    def get_counter_state(self):
+        """
+        Get the state carried from one DAQ line to the next, apart from the
+        edges of the current event.
+
+        :returns: dict
+        """
+        return dict((key, getattr(self, key)) for key in self.COUNTER_STATE)
+
+    def set_counter_state(self, state):
+        """
+        Restore a state obtained by get_counter_state, e.g. to continue
+        the extraction in the middle of a RAW file.
+
+        :param state: counter state
+        :type state: dict
+        :returns: None
+        """
+        for key in self.COUNTER_STATE:
+            setattr(self, key, state[key])
+
+    def _close_event(self):
+        """
+        Close the current event and get its pulses.
+
+        :returns: tuple
+        """
+        self.last_re = self.re
+        self.last_fe = self.fe
+        self.last_event_time = self.last_trigger_time
+
+        pulses = self._order_and_clean_pulses()
+
+        return (str(datetime.datetime.utcnow()), pulses["ch0"],
+                pulses["ch1"], pulses["ch2"], pulses["ch3"])
+
+    def extract(self, line):
+        """
+        Analyze subsequent lines (one per call)
+        and check if pulses are related to triggers
+        For each new trigger,
+        return the set of pulses which belong to that trigger,
+        otherwise return None
+
+        :param line: DAQ message
+        :type line: str
+        :returns: tuple
+        """
+        line = line.split()
+
+        one_pps = int(line[9], 16)
+        trigger_count = int(line[0], 16)
+        time = line[10]
+        trigger = TRIGGER_FLAGS[line[1]]
+
+        evt_one_pps, counter_diff = self._update_counters(
+                trigger_count, one_pps, time, trigger)
+
+        line_time = self._get_evt_time(line[10], line[15],
+                                       self.trigger_count, evt_one_pps)
+
+        if trigger:  # a trigger flag!
             # a new trigger! we have to evaluate the
             # last one and get the new pulses
-            self.last_re = self.re
-            self.last_fe = self.fe
-
-            pulses = self._order_and_clean_pulses()
-            extracted_pulses = (str(datetime.datetime.utcnow()), pulses["ch0"],
-                                pulses["ch1"], pulses["ch2"], pulses["ch3"])
+            extracted_pulses = self._close_event()
 
             if self._write_pulses:
                 self.pulse_file.write(repr(extracted_pulses) + '\n')
@@ -320,27 +387,12 @@ class PulseExtractor:
 
             # calculate edges of the new pulses
             self._calculate_edges(line)
-            self.last_trigger_count = trigger_count
-        
+
             return extracted_pulses
-        else:    
+        elif counter_diff is not None:
             # we do have a previous trigger and are now
             # adding more pulses to the event
-            if self.ini:
-                self.last_one_pps = int(line[9], 16)
-            else:
-                counter_diff = (self.trigger_count - self.last_trigger_count)
-                # print(counter_diff, counter_diff > int(0xffffffff))
-                # FIXME: is this correct?
-                if counter_diff > int(0xffffffff):
-                    counter_diff -= int(0xffffffff)
-        
-                counter_diff /= self.calculated_frequency
-
-                self._calculate_edges(line, counter_diff=counter_diff * 1e9)
-
-        # end of if trigger flag
-        self.last_trigger_count = trigger_count
+            self._calculate_edges(line, counter_diff=counter_diff)
 
 
 class VelocityTrigger:
@@ -368,26 +420,46 @@ class VelocityTrigger:
         :returns: float or None
         """
         # remember that index 0 is the trigger time
-        upper_pulses = len(pulses[upper_channel])
-        lower_pulses = len(pulses[lower_channel])
-        
-        if upper_pulses and lower_pulses:
-            if (len(pulses[upper_channel][0]) > 1 and
-                    len(pulses[lower_channel][0]) > 1):
-                pulse_width_upper = (pulses[upper_channel][0][1] -
-                                     pulses[upper_channel][0][0])
-                pulse_width_lower = (pulses[lower_channel][0][1] -
-                                     pulses[lower_channel][0][0])
-
-                if (pulse_width_upper - pulse_width_lower < -15. or
-                        pulse_width_upper - pulse_width_lower > 45.):
-                    return None
-            else:
-                return None
+        upper = pulses[upper_channel]
+        lower = pulses[lower_channel]
+
+        width_diff = np.nan
+        if upper and lower:
+            width_diff = pulse_width(upper[0]) - pulse_width(lower[0])
+
+        if rejection_reason(velocity_cuts(len(upper), len(lower),
+                                          width_diff)) != ACCEPTED:
+            return None
+
+        # always use rising edge since fe might be virtual
+        return lower[0][0] - upper[0][0]
+
+    def trigger_batch(self, batch, upper_channel=1, lower_channel=2):
+        """
+        Apply the cuts of trigger to all events of a batch at once.
+
+        :param batch: extracted events
+        :type batch: muonic.analysis.batch.EventBatch
+        :param upper_channel: index of the upper channel
+        :type upper_channel: int
+        :param lower_channel: index of the lower channel
+        :type lower_channel: int
+        :returns: tuple of numpy.ndarray -- flight times, NaN for rejected
+                  events, and the rejection reason of every event
+        """
+        upper = batch.column(upper_channel)
+        lower = batch.column(lower_channel)
 
-            # always use rising edge since fe might be virtual
-            return pulses[lower_channel][0][0] - pulses[upper_channel][0][0]
-        return None
+        reasons = rejection_reasons(velocity_cuts(
+                batch.multiplicity[:, upper], batch.multiplicity[:, lower],
+                batch.first_pulse_width(upper_channel) -
+                batch.first_pulse_width(lower_channel)), len(batch))
+
+        # always use rising edge since fe might be virtual
+        flight_times = np.where(reasons == ACCEPTED,
+                                batch.first_re[:, lower] -
+                                batch.first_re[:, upper], np.nan)
+        return flight_times, reasons
 
 
 class DecayTriggerThorough:
@@ -435,79 +507,75 @@ class DecayTriggerThorough:
         :type max_double_pulse_width: int
         :returns: int or None
         """ 
-
-        ttp = trigger_pulses
-        pulses1 = len(ttp[single_channel])  # single pulse
-        pulses2 = len(ttp[double_channel])  # double pulse
-        pulses3 = len(ttp[veto_channel])    # veto pulses
-
-        # reject events with too few pulses in some setups good value
-        # will be three (single pulse + double pulse required) and no hits
-        # in the veto channel3 change this if only one channel is available
-        if (pulses1 + pulses2 < 2) or pulses3:
-            # reject event if it has to few pulses or veto pulses
-            self.logger.debug(("Rejecting decay with single pulses %s, " +
-                              "double pulses %s and veto pulses %s") %
-                              (repr(pulses1), repr(pulses2), repr(pulses3)))
+        single = trigger_pulses[single_channel]
+        double = trigger_pulses[double_channel]
+
+        decay_time = np.nan
+        if double:
+            # subtract rising edges, falling edges might be virtual
+            decay_time = double[-1][0] - double[0][0]
+
+        cuts = decay_cuts(len(single), len(double),
+                          len(trigger_pulses[veto_channel]),
+                          pulse_width(single[0] if single else None),
+                          pulse_width(double[-1] if double else None),
+                          decay_time, single_channel == double_channel,
+                          min_decay_time, min_single_pulse_width,
+                          max_single_pulse_width, min_double_pulse_width,
+                          max_double_pulse_width, self.trigger_window)
+
+        if rejection_reason(cuts) != ACCEPTED:
             return None
+        return decay_time
 
-        # muon it might have entered the second channel then we do
-        # not want to have more than one hit in the first.
-        # again: use selfveto to adjust the behavior
-        if single_channel == double_channel:
-            if pulses2 >= 2 and pulses1 >= 2:
-                # check if the width of the pulses is as required
-                single_pulse_width = (ttp[single_channel][0][1] -
-                                      ttp[single_channel][0][0])
-                double_pulse_width = (ttp[double_channel][-1][1] -
-                                      ttp[double_channel][-1][0])
-
-                if ((min_single_pulse_width < single_pulse_width <
-                        max_single_pulse_width) and
-                        (min_double_pulse_width < double_pulse_width <
-                         max_double_pulse_width)):
-                    # subtract rising edges, falling edges might be virtual
-                    decay_time = (ttp[double_channel][-1][0] -
-                                  ttp[double_channel][0][0])
-                else:
-                    self.logger.debug('Rejected event.')
-                    return None
-            else:
-                self.logger.debug('Rejected event.')
-                return None
-        else:
-            if pulses2 >= 2 and pulses1 == 1:
-                # check if the width of the pulses is as required
-                single_pulse_width = (ttp[single_channel][0][1] -
-                                      ttp[single_channel][0][0])
-                double_pulse_width = (ttp[double_channel][-1][1] -
-                                      ttp[double_channel][-1][0])
-
-                if ((min_single_pulse_width < single_pulse_width <
-                        max_single_pulse_width) and
-                        (min_double_pulse_width < double_pulse_width <
-                         max_double_pulse_width)):
-                    # subtract rising edges, falling edges might be virtual
-                    decay_time = (ttp[double_channel][-1][0] -
-                                  ttp[double_channel][0][0])
-                else:
-                    self.logger.debug('Rejected event.')
-                    return None
-            else:
-                self.logger.debug('Rejected event.')
-                return None
-
-        # perform sanity checks
-        # there is an artifact at the end of the trigger window, so -1000
-        if ((decay_time > min_decay_time) and
-                (decay_time < self.trigger_window - 1000)):
-            self.logger.debug("Decay with decay time %d found " % decay_time)
-            return decay_time
-
-        self.logger.debug(("Rejecting decay with single pulses %s, " +
-                          "double pulses %s and veto pulses %s") %
-                          (repr(pulses1), repr(pulses2), repr(pulses3)))
-        return None
+    def trigger_batch(self, batch, single_channel=2, double_channel=3,
+                      veto_channel=4, min_decay_time=0,
+                      min_single_pulse_width=0, max_single_pulse_width=12000,
+                      min_double_pulse_width=0, max_double_pulse_width=12000):
+        """
+        Apply the cuts of trigger to all events of a batch at once.
+
+        :param batch: extracted events
+        :type batch: muonic.analysis.batch.EventBatch
+        :param single_channel: channel index
+        :type single_channel: int
+        :param double_channel: channel index
+        :type double_channel: int
+        :param veto_channel: channel index
+        :type veto_channel: int
+        :param min_decay_time: minimum decay time
+        :type min_decay_time: int
+        :param min_single_pulse_width: minimum single pulse width
+        :type min_single_pulse_width: int
+        :param max_single_pulse_width: maximum single pulse width
+        :type max_single_pulse_width: int
+        :param min_double_pulse_width: minimum double pulse width
+        :type min_double_pulse_width: int
+        :param max_double_pulse_width: maximum double pulse width
+        :type max_double_pulse_width: int
+        :returns: tuple of numpy.ndarray -- decay times, NaN for rejected
+                  events, and the rejection reason of every event
+        """
+        single = batch.column(single_channel)
+        double = batch.column(double_channel)
+        veto = batch.column(veto_channel)
+
+        # subtract rising edges, falling edges might be virtual
+        decay_times = batch.last_re[:, double] - batch.first_re[:, double]
+
+        cuts = decay_cuts(batch.multiplicity[:, single],
+                          batch.multiplicity[:, double],
+                          batch.multiplicity[:, veto],
+                          batch.first_pulse_width(single_channel),
+                          batch.last_pulse_width(double_channel),
+                          decay_times, single_channel == double_channel,
+                          min_decay_time, min_single_pulse_width,
+                          max_single_pulse_width, min_double_pulse_width,
+                          max_double_pulse_width, self.trigger_window)
+        reasons = rejection_reasons(cuts, len(batch))
+
+        decay_times = np.where(reasons == ACCEPTED, decay_times, np.nan)
+        return decay_times, reasons
 
 
 if __name__ == '__main__':
@@ -0,0 +1,176 @@
+"""
+Columnar representation of many extracted events, so that the triggers can
+be evaluated on whole runs with numpy instead of one event at a time.
+
+An event is the tuple returned by PulseExtractor.extract, the trigger time
+followed by the (sorted) pulses of channel 0 to 3. The triggers only look at
+the number of pulses in a channel and at the first and last pulse of a
+channel, so these are the columns of the batch.
+"""
+import numpy as np
+
+__all__ = ["EventBatch", "ACCEPTED", "REJECT_TOO_FEW_PULSES", "REJECT_VETO",
+           "REJECT_MULTIPLICITY", "REJECT_PULSE_WIDTH", "REJECT_DECAY_TIME",
+           "REJECT_MISSING_PULSES", "REJECTION_REASONS", "reject"]
+
+# rejection reasons of the batch triggers, the first failed cut wins
+ACCEPTED = 0
+REJECT_TOO_FEW_PULSES = 1
+REJECT_VETO = 2
+REJECT_MULTIPLICITY = 3
+REJECT_PULSE_WIDTH = 4
+REJECT_DECAY_TIME = 5
+REJECT_MISSING_PULSES = 6
+
+REJECTION_REASONS = {
+    ACCEPTED: "accepted",
+    REJECT_TOO_FEW_PULSES: "too few pulses",
+    REJECT_VETO: "veto pulses",
+    REJECT_MULTIPLICITY: "wrong number of pulses",
+    REJECT_PULSE_WIDTH: "pulse width out of range",
+    REJECT_DECAY_TIME: "decay time out of range",
+    REJECT_MISSING_PULSES: "missing pulses"
+}
+
+
+class EventBatch(object):
+    """
+    Columnar batch of extracted events. All columns have the shape
+    (events, 4) with one column per channel, edge times of channels
+    without pulses are NaN.
+
+    Channels are addressed like in the event tuples, index 1 to 4 for
+    channel 0 to 3, see column.
+
+    :param multiplicity: number of pulses per channel
+    :type multiplicity: numpy.ndarray
+    :param first_re: rising edge of the first pulse per channel
+    :type first_re: numpy.ndarray
+    :param first_fe: falling edge of the first pulse per channel
+    :type first_fe: numpy.ndarray
+    :param last_re: rising edge of the last pulse per channel
+    :type last_re: numpy.ndarray
+    :param last_fe: falling edge of the last pulse per channel
+    :type last_fe: numpy.ndarray
+    :param timestamps: trigger times of the events
+    :type timestamps: numpy.ndarray
+    """
+
+    def __init__(self, multiplicity, first_re, first_fe, last_re, last_fe,
+                 timestamps=None):
+        self.multiplicity = np.asarray(multiplicity, dtype=np.int64)
+        self.first_re = np.asarray(first_re, dtype=np.float64)
+        self.first_fe = np.asarray(first_fe, dtype=np.float64)
+        self.last_re = np.asarray(last_re, dtype=np.float64)
+        self.last_fe = np.asarray(last_fe, dtype=np.float64)
+
+        if timestamps is not None:
+            timestamps = np.asarray(timestamps, dtype=object)
+        self.timestamps = timestamps
+
+    @classmethod
+    def from_pulses(cls, events):
+        """
+        Create a batch from events in the format of PulseExtractor.extract.
+
+        :param events: extracted events
+        :type events: list of tuples
+        :returns: EventBatch
+        """
+        n = len(events)
+
+        multiplicity = np.zeros((n, 4), dtype=np.int64)
+        edges = np.full((4, n, 4), np.nan)
+        timestamps = np.empty(n, dtype=object)
+
+        for index, event in enumerate(events):
+            timestamps[index] = event[0]
+
+            for ch in range(4):
+                pulses = event[ch + 1]
+
+                if pulses:
+                    multiplicity[index, ch] = len(pulses)
+                    edges[0, index, ch], edges[1, index, ch] = pulses[0]
+                    edges[2, index, ch], edges[3, index, ch] = pulses[-1]
+
+        return cls(multiplicity, edges[0], edges[1], edges[2], edges[3],
+                   timestamps)
+
+    def __len__(self):
+        return len(self.multiplicity)
+
+    def __getitem__(self, index):
+        """
+        Select events, e.g. by a boolean mask.
+
+        :param index: index, slice or mask
+        :type index: int or slice or numpy.ndarray
+        :returns: EventBatch
+        """
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, index + 1 or None)
+
+        timestamps = None
+        if self.timestamps is not None:
+            timestamps = self.timestamps[index]
+
+        return EventBatch(self.multiplicity[index], self.first_re[index],
+                          self.first_fe[index], self.last_re[index],
+                          self.last_fe[index], timestamps)
+
+    @staticmethod
+    def column(channel):
+        """
+        Column of a channel index as used in the event tuples.
+
+        Raises IndexError if the channel index is out of range.
+
+        :param channel: channel index, 1 to 4 for channel 0 to 3
+        :type channel: int
+        :returns: int
+        :raises: IndexError
+        """
+        if not 1 <= channel <= 4:
+            raise IndexError("channel index %s out of range" % repr(channel))
+        return channel - 1
+
+    def first_pulse_width(self, channel):
+        """
+        Width of the first pulse of a channel, NaN for events without
+        pulses in this channel.
+
+        :param channel: channel index, 1 to 4 for channel 0 to 3
+        :type channel: int
+        :returns: numpy.ndarray
+        """
+        col = self.column(channel)
+        return self.first_fe[:, col] - self.first_re[:, col]
+
+    def last_pulse_width(self, channel):
+        """
+        Width of the last pulse of a channel, NaN for events without
+        pulses in this channel.
+
+        :param channel: channel index, 1 to 4 for channel 0 to 3
+        :type channel: int
+        :returns: numpy.ndarray
+        """
+        col = self.column(channel)
+        return self.last_fe[:, col] - self.last_re[:, col]
+
+
+def reject(reasons, mask, reason):
+    """
+    Set the rejection reason of all events in the mask which
+    are not rejected yet.
+
+    :param reasons: rejection reasons, changed in place
+    :type reasons: numpy.ndarray
+    :param mask: events failing the cut
+    :type mask: numpy.ndarray
+    :param reason: rejection reason of the cut
+    :type reason: int
+    :returns: None
+    """
+    reasons[mask & (reasons == ACCEPTED)] = reason
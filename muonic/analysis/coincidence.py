@@ -0,0 +1,282 @@
+"""
+Streaming coincidence finder working on time ordered pulses.
+
+The pulses are fed one by one with their absolute time, either from the
+events of PulseExtractor or from an offline reader. Two things are tracked:
+
+* a 4x4 matrix counting the pulse pairs of every channel pair which lie
+  within the coincidence window, the diagonal counts the single pulses.
+  It is updated with a sliding window, so every pulse costs O(1) amortized.
+* coincidences of configurable channel combinations. Pulses belong to the
+  same coincidence as long as each follows the previous one within the
+  window. A coincidence is found if the channels of such a group contain
+  one of the combinations.
+
+The pulses have to be time ordered. If the time jumps back, e.g. because of
+a glitch in the GPS time, the stream starts over at the new time without
+losing the counts collected so far.
+
+Times are in ns, channels are numbered 0 to 3.
+"""
+from __future__ import print_function
+from collections import deque
+
+import numpy as np
+
+__all__ = ["EventTimeline", "CoincidenceEngine", "DEFAULT_COMBINATIONS"]
+
+CHANNELS = 4
+SECONDS_PER_DAY = 86400
+
+# upper and lower scintillator pairs of the usual detector setup
+DEFAULT_COMBINATIONS = ((0, 2), (0, 3), (1, 2), (1, 3))
+
+
+class EventTimeline(object):
+    """
+    Converts the events of PulseExtractor into time ordered pulses with
+    absolute times. The event times start over at midnight, so they are
+    counted on from the day the timeline started.
+    """
+
+    def __init__(self):
+        self._day_offset = 0
+        self._last_event_time = None
+
+    def pulses(self, pulses, event_time):
+        """
+        Get the pulses of an event in time order.
+
+        :param pulses: extracted pulses
+        :type pulses: tuple
+        :param event_time: trigger time of the event in seconds since day
+                           start, see PulseExtractor.last_event_time
+        :type event_time: float
+        :returns: list of tuples -- time of the rising edge in ns, channel
+                  number and pulse width in ns
+        """
+        if (self._last_event_time is not None and
+                event_time < self._last_event_time - SECONDS_PER_DAY / 2):
+            self._day_offset += SECONDS_PER_DAY
+        self._last_event_time = event_time
+
+        start = (event_time + self._day_offset) * 1e9
+
+        return sorted((start + re, channel, fe - re)
+                      for channel in range(CHANNELS)
+                      for re, fe in pulses[channel + 1])
+
+
+class CoincidenceEngine(object):
+    """
+    Find coincidences in a stream of time ordered pulses.
+
+    :param window: coincidence window in ns
+    :type window: float
+    :param combinations: channel combinations counted as coincidence
+    :type combinations: iterable of iterables of int
+    :param callback: called with the time of the first pulse and a dict
+                     of the first pulse time per channel for each coincidence
+    :type callback: callable
+    """
+
+    def __init__(self, window=200., combinations=DEFAULT_COMBINATIONS,
+                 callback=None):
+        self.window = window
+        self.combinations = [frozenset(combination)
+                             for combination in combinations]
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all counters and the pulses in the window.
+
+        :returns: None
+        """
+        # pulses within the window of the newest pulse and their
+        # number per channel
+        self._window_pulses = deque()
+        self._in_window = [0] * CHANNELS
+
+        # pulse pairs per channel pair, single pulses on the diagonal
+        self.counts = [[0] * CHANNELS for _ in range(CHANNELS)]
+
+        # found coincidences, in total and per combination
+        self.coincidences = 0
+        self.combination_counts = [0] * len(self.combinations)
+
+        # number of times the stream went back in time
+        self.discontinuities = 0
+
+        # time of the last pulse and time covered by the stream
+        self.last_time = None
+        self.elapsed = 0.
+
+        # open group of pulses for the combinations
+        self._group = dict()
+        self._group_start = None
+
+        # state of the last poll
+        self._poll_counts = np.zeros((CHANNELS, CHANNELS))
+        self._poll_elapsed = 0.
+
+        self._timeline = EventTimeline()
+
+    def process_pulse(self, time, channel):
+        """
+        Add the next pulse of the stream.
+
+        :param time: time of the rising edge in ns
+        :type time: float
+        :param channel: channel number
+        :type channel: int
+        :returns: None
+        """
+        last_time = self.last_time
+        window = self._window_pulses
+        in_window = self._in_window
+
+        if last_time is None:
+            last_time = time
+        elif time < last_time:
+            # start over at the new time
+            self.flush()
+            window.clear()
+            self._in_window = in_window = [0] * CHANNELS
+            self.discontinuities += 1
+            last_time = time
+
+        self.elapsed += time - last_time
+        self.last_time = time
+
+        # drop pulses which left the window
+        while window and time - window[0][0] > self.window:
+            in_window[window.popleft()[1]] -= 1
+
+        row = self.counts[channel]
+        row[channel] += 1
+
+        for other in range(CHANNELS):
+            if other != channel and in_window[other]:
+                row[other] += in_window[other]
+                self.counts[other][channel] += in_window[other]
+
+        window.append((time, channel))
+        in_window[channel] += 1
+
+        # close the group if the pulse does not follow within the window
+        if self._group and time - last_time > self.window:
+            self._close_group()
+
+        if not self._group:
+            self._group_start = time
+
+        if channel not in self._group:
+            self._group[channel] = time
+
+    def process_event(self, pulses, event_time):
+        """
+        Add the pulses of an event from PulseExtractor.extract.
+
+        :param pulses: extracted pulses
+        :type pulses: tuple
+        :param event_time: trigger time of the event in seconds since day
+                           start, see PulseExtractor.last_event_time
+        :type event_time: float
+        :returns: None
+        """
+        for time, channel, width in self._timeline.pulses(pulses,
+                                                          event_time):
+            self.process_pulse(time, channel)
+
+    def _close_group(self):
+        """
+        Check the open group of pulses for the channel combinations.
+
+        :returns: None
+        """
+        channels = set(self._group)
+        found = False
+
+        for index, combination in enumerate(self.combinations):
+            if combination <= channels:
+                self.combination_counts[index] += 1
+                found = True
+
+        if found:
+            self.coincidences += 1
+            if self.callback is not None:
+                self.callback(self._group_start, self._group)
+
+        self._group = dict()
+
+    def flush(self):
+        """
+        Check the open group of pulses at the end of the stream.
+
+        :returns: None
+        """
+        if self._group:
+            self._close_group()
+
+    def duration(self):
+        """
+        Time span of the processed pulses in seconds.
+
+        :returns: float
+        """
+        return self.elapsed * 1e-9
+
+    def count_matrix(self):
+        """
+        Get the pulse pair counts per channel pair, the
+        diagonal holds the single pulse counts.
+
+        :returns: numpy.ndarray
+        """
+        return np.array(self.counts, dtype=float)
+
+    def rate_matrix(self):
+        """
+        Get the coincidence rates in Hz over the whole stream.
+
+        :returns: numpy.ndarray
+        """
+        duration = self.duration()
+
+        if duration <= 0:
+            return np.zeros((CHANNELS, CHANNELS))
+        return self.count_matrix() / duration
+
+    def poll(self):
+        """
+        Get the coincidence rates in Hz since the previous poll. The time
+        is taken from the pulses, so this works for offline data as well.
+
+        :returns: numpy.ndarray
+        """
+        counts = self.count_matrix()
+        rates = np.zeros((CHANNELS, CHANNELS))
+
+        if self.elapsed > self._poll_elapsed:
+            rates = ((counts - self._poll_counts) /
+                     ((self.elapsed - self._poll_elapsed) * 1e-9))
+            self._poll_elapsed = self.elapsed
+            self._poll_counts = counts
+
+        return rates
+
+    def export(self, filename):
+        """
+        Write the coincidence rate matrix to a text file.
+
+        :param filename: name of the file
+        :type filename: str
+        :returns: None
+        """
+        np.savetxt(filename, self.rate_matrix(), fmt="%.6f",
+                   header=("coincidence rates in Hz, window %.1f ns, " +
+                           "duration %.3f s, rows and columns are the " +
+                           "channels 0 to 3") % (self.window,
+                                                 self.duration()))
@@ -0,0 +1,145 @@
+"""
+Cuts of the decay and velocity triggers.
+
+The cuts are defined once here and shared by the per event triggers of
+muonic.analysis.analyzer, their batch versions and the analyses of
+muonic.analysis.registry. The cut functions take the features of a single
+event as numbers or of many events as numpy arrays, edge times and widths
+of missing pulses are NaN. They return the cuts in the order they are
+applied, an event is rejected for the first cut it fails.
+"""
+import numpy as np
+
+from muonic.analysis.batch import ACCEPTED, REJECT_TOO_FEW_PULSES
+from muonic.analysis.batch import REJECT_VETO, REJECT_MULTIPLICITY
+from muonic.analysis.batch import REJECT_PULSE_WIDTH, REJECT_DECAY_TIME
+from muonic.analysis.batch import REJECT_MISSING_PULSES, reject
+
+__all__ = ["pulse_width", "decay_cuts", "velocity_cuts",
+           "rejection_reason", "rejection_reasons"]
+
+
+def pulse_width(pulse):
+    """
+    Width of a single pulse, NaN if there is no pulse or
+    it has no falling edge.
+
+    :param pulse: rising and falling edge
+    :type pulse: tuple or None
+    :returns: float
+    """
+    if pulse is None or pulse[1] is None:
+        return np.nan
+    return pulse[1] - pulse[0]
+
+
+def decay_cuts(pulses1, pulses2, pulses3, single_pulse_width,
+               double_pulse_width, decay_time, same_channel,
+               min_decay_time=0, min_single_pulse_width=0,
+               max_single_pulse_width=12000, min_double_pulse_width=0,
+               max_double_pulse_width=12000, trigger_window=10000):
+    """
+    Cuts of the decay trigger.
+
+    :param pulses1: number of pulses in the single pulse channel
+    :type pulses1: int or numpy.ndarray
+    :param pulses2: number of pulses in the double pulse channel
+    :type pulses2: int or numpy.ndarray
+    :param pulses3: number of pulses in the veto channel
+    :type pulses3: int or numpy.ndarray
+    :param single_pulse_width: width of the first single channel pulse
+    :type single_pulse_width: float or numpy.ndarray
+    :param double_pulse_width: width of the last double channel pulse
+    :type double_pulse_width: float or numpy.ndarray
+    :param decay_time: time between the rising edges of the first and the
+                       last double channel pulse
+    :type decay_time: float or numpy.ndarray
+    :param same_channel: single and double channel are the same
+    :type same_channel: bool
+    :param min_decay_time: minimum decay time
+    :type min_decay_time: int
+    :param min_single_pulse_width: minimum single pulse width
+    :type min_single_pulse_width: int
+    :param max_single_pulse_width: maximum single pulse width
+    :type max_single_pulse_width: int
+    :param min_double_pulse_width: minimum double pulse width
+    :type min_double_pulse_width: int
+    :param max_double_pulse_width: maximum double pulse width
+    :type max_double_pulse_width: int
+    :param trigger_window: trigger window in ns
+    :type trigger_window: int
+    :returns: list of tuples -- failed flag or mask and rejection reason
+              of every cut
+    """
+    # with a single channel the muon has to stop in it, otherwise
+    # we do not want more than one hit in the single pulse channel
+    if same_channel:
+        multiplicity = pulses2 < 2
+    else:
+        multiplicity = (pulses2 < 2) | (pulses1 != 1)
+
+    widths = ((min_single_pulse_width < single_pulse_width) &
+              (single_pulse_width < max_single_pulse_width) &
+              (min_double_pulse_width < double_pulse_width) &
+              (double_pulse_width < max_double_pulse_width))
+
+    # there is an artifact at the end of the trigger window, so -1000
+    decay = ((decay_time > min_decay_time) &
+             (decay_time < trigger_window - 1000))
+
+    return [(pulses1 + pulses2 < 2, REJECT_TOO_FEW_PULSES),
+            (pulses3 > 0, REJECT_VETO),
+            (multiplicity, REJECT_MULTIPLICITY),
+            (np.logical_not(widths), REJECT_PULSE_WIDTH),
+            (np.logical_not(decay), REJECT_DECAY_TIME)]
+
+
+def velocity_cuts(upper_pulses, lower_pulses, width_diff):
+    """
+    Cuts of the velocity trigger.
+
+    :param upper_pulses: number of pulses in the upper channel
+    :type upper_pulses: int or numpy.ndarray
+    :param lower_pulses: number of pulses in the lower channel
+    :type lower_pulses: int or numpy.ndarray
+    :param width_diff: width of the first upper channel pulse minus the
+                       width of the first lower channel pulse
+    :type width_diff: float or numpy.ndarray
+    :returns: list of tuples -- failed flag or mask and rejection reason
+              of every cut
+    """
+    return [((upper_pulses == 0) | (lower_pulses == 0),
+             REJECT_MISSING_PULSES),
+            (np.logical_not((-15. <= width_diff) & (width_diff <= 45.)),
+             REJECT_PULSE_WIDTH)]
+
+
+def rejection_reason(cuts):
+    """
+    Rejection reason of a single event.
+
+    :param cuts: cuts of the event
+    :type cuts: list of tuples
+    :returns: int
+    """
+    for failed, reason in cuts:
+        if failed:
+            return reason
+    return ACCEPTED
+
+
+def rejection_reasons(cuts, size):
+    """
+    Rejection reasons of many events.
+
+    :param cuts: cuts of the events
+    :type cuts: list of tuples
+    :param size: number of events
+    :type size: int
+    :returns: numpy.ndarray
+    """
+    reasons = np.zeros(size, dtype=np.int8)
+
+    for failed, reason in cuts:
+        reject(reasons, failed, reason)
+    return reasons
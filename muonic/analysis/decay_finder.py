@@ -0,0 +1,216 @@
+"""
+Muon decay finder working on the continuous pulse stream.
+
+DecayTriggerThorough only sees the pulses of a single trigger window. This
+finder works on absolute pulse times instead, so the muon and the decay
+electron may be recorded with different triggers, e.g. when the card runs
+with single channel coincidences.
+
+Pulses following each other within the coincidence window are grouped. A
+group with a single pulse and a pulse in the double pulse channel and no veto
+pulse is a stopped muon, it waits for its decay for at most max_decay_time.
+A later group with pulses in the double pulse channel only is the decay of
+the oldest waiting muon. Decays within the coincidence window are taken
+from the last pulse in the double pulse channel of the muon's group, like
+DecayTriggerThorough does. Muons waiting longer than max_decay_time are
+dropped, so the look-back memory is bounded.
+
+Times are in ns, channels are numbered 0 to 3.
+"""
+from __future__ import print_function
+from collections import deque
+
+from muonic.analysis.coincidence import EventTimeline
+
+__all__ = ["StreamingDecayFinder"]
+
+
+class StreamingDecayFinder(object):
+    """
+    Find muon decays in a stream of time ordered pulses.
+
+    The cuts correspond to the ones of DecayTriggerThorough. With
+    single_channel equal to double_channel a pulse in that channel is a
+    stopped muon and the next one its decay.
+
+    :param single_channel: channel number of the single pulse
+    :type single_channel: int
+    :param double_channel: channel number of the muon and decay pulses
+    :type double_channel: int
+    :param veto_channel: channel number of the veto, None for no veto
+    :type veto_channel: int
+    :param min_decay_time: minimum decay time in ns
+    :type min_decay_time: float
+    :param max_decay_time: maximum decay time in ns
+    :type max_decay_time: float
+    :param min_single_pulse_width: minimum single pulse width
+    :type min_single_pulse_width: float
+    :param max_single_pulse_width: maximum single pulse width
+    :type max_single_pulse_width: float
+    :param min_double_pulse_width: minimum double pulse width
+    :type min_double_pulse_width: float
+    :param max_double_pulse_width: maximum double pulse width
+    :type max_double_pulse_width: float
+    :param window: coincidence window in ns
+    :type window: float
+    :param max_waiting: maximum number of muons waiting for their decay
+    :type max_waiting: int
+    :param callback: called with the decay time and the time of the muon
+                     for every decay found
+    :type callback: callable
+    """
+
+    def __init__(self, single_channel=1, double_channel=2, veto_channel=3,
+                 min_decay_time=0, max_decay_time=20000,
+                 min_single_pulse_width=0, max_single_pulse_width=12000,
+                 min_double_pulse_width=0, max_double_pulse_width=12000,
+                 window=200., max_waiting=100, callback=None):
+        self.single_channel = single_channel
+        self.double_channel = double_channel
+        self.veto_channel = veto_channel
+        self.min_decay_time = min_decay_time
+        self.max_decay_time = max_decay_time
+        self.min_single_pulse_width = min_single_pulse_width
+        self.max_single_pulse_width = max_single_pulse_width
+        self.min_double_pulse_width = min_double_pulse_width
+        self.max_double_pulse_width = max_double_pulse_width
+        self.window = window
+        self.callback = callback
+
+        # stopped muons waiting for their decay, oldest first
+        self._waiting = deque(maxlen=max_waiting)
+
+        # open group of pulses as (time, channel, width)
+        self._group = []
+        self._last_time = None
+
+        self._timeline = EventTimeline()
+
+        self.muons = 0
+        self.decays = 0
+
+    def process_pulse(self, time, channel, width):
+        """
+        Add the next pulse of the stream.
+
+        :param time: time of the rising edge in ns
+        :type time: float
+        :param channel: channel number
+        :type channel: int
+        :param width: pulse width in ns
+        :type width: float
+        :returns: None
+        """
+        last_time = self._last_time
+
+        if last_time is not None:
+            if time < last_time:
+                # the stream went back in time, nothing can be matched
+                self._group = []
+                self._waiting.clear()
+            elif time - last_time > self.window:
+                self._close_group()
+
+        self._last_time = time
+        self._group.append((time, channel, width))
+
+    def process_event(self, pulses, event_time):
+        """
+        Add the pulses of an event from PulseExtractor.extract.
+
+        :param pulses: extracted pulses
+        :type pulses: tuple
+        :param event_time: trigger time of the event in seconds since day
+                           start, see PulseExtractor.last_event_time
+        :type event_time: float
+        :returns: None
+        """
+        for time, channel, width in self._timeline.pulses(pulses,
+                                                          event_time):
+            self.process_pulse(time, channel, width)
+
+    def _decay(self, decay_time, muon_time, width):
+        """
+        Publish a decay if it passes the cuts.
+
+        :param decay_time: decay time in ns
+        :type decay_time: float
+        :param muon_time: time of the muon in ns
+        :type muon_time: float
+        :param width: width of the decay pulse
+        :type width: float
+        :returns: bool -- True if the decay passed the cuts
+        """
+        if not (self.min_decay_time < decay_time < self.max_decay_time and
+                self.min_double_pulse_width < width <
+                self.max_double_pulse_width):
+            return False
+
+        self.decays += 1
+
+        if self.callback is not None:
+            self.callback(decay_time, muon_time)
+        return True
+
+    def _close_group(self):
+        """
+        Check the open group of pulses for a decay or a stopped muon.
+
+        :returns: None
+        """
+        group = self._group
+        self._group = []
+
+        double = [pulse for pulse in group
+                  if pulse[1] == self.double_channel]
+
+        if not double:
+            return
+
+        start = double[0][0]
+        waiting = self._waiting
+
+        # drop muons which waited too long
+        while waiting and start - waiting[0] >= self.max_decay_time:
+            waiting.popleft()
+
+        if len(double) == len(group) and waiting:
+            # decay of the oldest waiting muon
+            if self._decay(start - waiting[0], waiting[0], double[0][2]):
+                waiting.popleft()
+                return
+
+        # check for a stopped muon
+        if self.single_channel == self.double_channel:
+            single = double[:1]
+        else:
+            single = [pulse for pulse in group
+                      if pulse[1] == self.single_channel]
+
+            if len(single) != 1:
+                return
+
+        if self.veto_channel is not None and any(
+                pulse[1] == self.veto_channel for pulse in group):
+            return
+
+        if not (self.min_single_pulse_width < single[0][2] <
+                self.max_single_pulse_width):
+            return
+
+        self.muons += 1
+
+        if len(double) >= 2:
+            # the decay happened within the coincidence window
+            self._decay(double[-1][0] - start, start, double[-1][2])
+        else:
+            waiting.append(start)
+
+    def flush(self):
+        """
+        Check the open group of pulses at the end of the stream.
+
+        :returns: None
+        """
+        if self._group:
+            self._close_group()
@@ -0,0 +1,176 @@
+"""
+Precomputed lookup tables to decode the TMC edge bytes of DAQ trigger lines.
+
+Each trigger line carries eight edge bytes (rising and falling edge for
+channel 0 to 3), every byte written as a pair of hex digits. Only the first
+5 bits are used for the pulse time, the sixth bit flags if the edge is
+considered valid and the eighth bit of the first byte is the trigger flag.
+
+Instead of parsing and masking every field of every line, the decoded values
+for all 256 possible bytes are computed once at import time. The scalar
+tables are keyed by the hex pair as it appears in the DAQ message, the numpy
+tables are indexed by the byte value (or by a rising/falling byte pair) and
+serve the vectorized path.
+"""
+import numpy as np
+
+__all__ = ["BIT0_4", "BIT5", "BIT7", "TMC_TICK", "HEX_PAIR_VALUE",
+           "EDGE_VALID", "EDGE_TICK_TIME", "EDGE_TICKS", "EDGE_TIMES",
+           "TRIGGER_FLAGS", "EDGE_PAIR_VALID", "EDGE_PAIR_TIME", "decode_edge",
+           "hex_to_bytes", "decode_edge_bytes"]
+
+# for the pulses
+# 8 bits give a hex number
+# but only the first 5 bits are used for the pulses time,
+# the fifth bit flags if the pulse is considered valid
+# the seventh bit should be the trigger flag...
+BIT0_4 = 31
+BIT5 = 1 << 5
+BIT7 = 1 << 7
+
+# tick size of tmc internal clock
+# documentation says 0.75, measurement says 1.25
+# TODO: find out if tmc is coupled to cpld!
+TMC_TICK = 1.25  # nsec
+
+
+class _HexPairTable(dict):
+    """
+    Lookup table keyed by hex pairs. Keys which are not in the table,
+    e.g. hex numbers with more than two digits, are decoded on the fly
+    without being added to the table.
+
+    Raises ValueError for keys which are no hex numbers.
+
+    :param decode: function mapping a byte value to the table value
+    :type decode: function
+    """
+
+    def __init__(self, decode):
+        dict.__init__(self)
+        self._decode = decode
+
+        for value in range(256):
+            decoded = decode(value)
+            self["%02X" % value] = decoded
+            self["%02x" % value] = decoded
+
+    def __missing__(self, key):
+        return self._decode(int(key, 16))
+
+
+def _edge_ticks(value):
+    """
+    Number of TMC ticks of an edge byte, None if the edge is invalid.
+
+    :param value: edge byte
+    :type value: int
+    :returns: int or None
+    """
+    if value & BIT5:
+        return value & BIT0_4
+    return None
+
+
+def _edge_time(value):
+    """
+    Time of an edge byte in ns, None if the edge is invalid.
+
+    :param value: edge byte
+    :type value: int
+    :returns: float or None
+    """
+    if value & BIT5:
+        return (value & BIT0_4) * TMC_TICK
+    return None
+
+
+# hex pair -> byte value
+HEX_PAIR_VALUE = _HexPairTable(lambda value: value)
+
+# byte value -> valid flag and tick time
+EDGE_VALID = np.array([bool(value & BIT5) for value in range(256)])
+EDGE_TICK_TIME = np.array([(value & BIT0_4) * TMC_TICK
+                           for value in range(256)])
+
+# hex pair -> number of ticks, time in ns or trigger flag,
+# None for invalid edges
+EDGE_TICKS = _HexPairTable(_edge_ticks)
+EDGE_TIMES = _HexPairTable(_edge_time)
+TRIGGER_FLAGS = _HexPairTable(lambda value: bool(value & BIT7))
+
+# (rising byte << 8 | falling byte) -> valid flags and times in ns of
+# both edges, invalid edges have a time of NaN
+_pair_index = np.arange(1 << 16)
+EDGE_PAIR_VALID = np.column_stack((EDGE_VALID[_pair_index >> 8],
+                                   EDGE_VALID[_pair_index & 0xFF]))
+EDGE_PAIR_TIME = np.where(EDGE_PAIR_VALID,
+                          np.column_stack((EDGE_TICK_TIME[_pair_index >> 8],
+                                           EDGE_TICK_TIME[_pair_index & 0xFF])),
+                          np.nan)
+del _pair_index
+
+# two ascii characters viewed as uint16 -> byte value, -1 for non-hex
+# characters. The keys are built with the same view, so byte order does
+# not matter
+_ASCII_PAIR_VALUE = np.full(1 << 16, -1, dtype=np.int16)
+_ASCII_PAIR_VALUE[np.array(list(HEX_PAIR_VALUE.keys()),
+                           dtype="S2").view(np.uint16)] = \
+    list(HEX_PAIR_VALUE.values())
+
+
+def decode_edge(hex_pair):
+    """
+    Decode a single edge field of a DAQ trigger line.
+
+    Raises ValueError if the field is not a hex number.
+
+    :param hex_pair: edge field, e.g. 'A3'
+    :type hex_pair: str
+    :returns: float or None -- edge time in ns, None if the edge is invalid
+    :raises: ValueError
+    """
+    return EDGE_TIMES[hex_pair]
+
+
+def hex_to_bytes(fields):
+    """
+    Convert an array of hex pairs to their byte values at once.
+
+    Raises ValueError if any of the fields is not a two digit hex number.
+
+    :param fields: hex pairs, e.g. the edge fields of many trigger lines
+    :type fields: array_like of str
+    :returns: numpy.ndarray of uint8 with the shape of fields
+    :raises: ValueError
+    """
+    fields = np.asarray(fields)
+
+    # refuse longer strings instead of silently truncating them
+    if (fields.dtype.kind not in "SU" or
+            fields.dtype.itemsize > np.dtype(fields.dtype.kind + "2").itemsize):
+        raise ValueError("found fields which are no two digit hex numbers")
+
+    fields = fields.astype("S2")
+    values = _ASCII_PAIR_VALUE[np.ascontiguousarray(fields).view(np.uint16)
+                               .reshape(fields.shape)]
+
+    if (values < 0).any():
+        raise ValueError("found fields which are no two digit hex numbers")
+    return values.astype(np.uint8)
+
+
+def decode_edge_bytes(edge_bytes):
+    """
+    Decode the edge bytes of many trigger lines at once.
+
+    :param edge_bytes: edge bytes in DAQ line order (rising and falling
+                       edge of channel 0 to 3) with shape (lines, 8)
+    :type edge_bytes: numpy.ndarray
+    :returns: tuple of numpy.ndarray -- rising and falling edge times in ns
+              with shape (lines, 4), NaN for invalid edges
+    """
+    edge_bytes = np.asarray(edge_bytes, dtype=np.uint16)
+    pairs = (edge_bytes[:, 0::2] << 8) | edge_bytes[:, 1::2]
+    times = EDGE_PAIR_TIME[pairs]
+    return times[..., 0], times[..., 1]
@@ -1,32 +1,54 @@
 """
-Script for performing a fit to a histogramm of recorded 
+Script for performing a fit to a histogramm of recorded
 time differences for the use with QNet
 """
 from __future__ import print_function
 import sys
 
-from matplotlib import pylab
 import numpy
-import scipy.optimize as optimize
 
+from muonic.analysis.fit_engine import ExponentialModel, GaussianModel
+from muonic.analysis.fit_engine import FitEngine
 
-def fit(bincontent=None, binning=(0, 10, 21), fitrange=None):
+
+def _legacy_result(result, binning):
+    """
+    Convert a fit result into the tuple returned by the fit functions.
+
+    :param result: fit result
+    :type result: muonic.analysis.fit_engine.FitResult
+    :param binning: binning as arguments of numpy.linspace
+    :type binning: tuple
+    :returns: tuple
     """
-    Fit function
+    fitx = result.curve()[0]
+    return (result.bin_centers, result.bincontent, fitx, result.model,
+            result.parameters, result.covariance, result.chisquare,
+            binning[2])
+
 
-    :param bincontent:
-    :param binning:
-    :param fitrange:
-    :returns:
+def fit(bincontent=None, binning=(0, 10, 21), fitrange=None):
     """
-    def decay(p, x):
-        return p[0] * numpy.exp(-x / p[1]) + p[2]
-    
-    def error(p, x, y):
-        return decay(p, x) - y
-    
+    Fit an exponential decay on a flat background to the decay time
+    histogram. The bins before the highest bin are not fitted.
+
+    Without bin contents the decay times are read from the file
+    given on the command line and the fit is saved to 'fit.png'.
+
+    :param bincontent: bin contents
+    :type bincontent: numpy.ndarray
+    :param binning: binning as arguments of numpy.linspace
+    :type binning: tuple
+    :param fitrange: lower and upper limit of the fitted bin centers
+    :type fitrange: tuple
+    :returns: tuple or None -- bin centers, bin contents, x values of the
+              fit curve, model, parameters, covariance matrix, chi-square
+              and number of bins
+    """
+    engine = FitEngine(ExponentialModel(), cut_to_maximum=True)
+    bins = numpy.linspace(binning[0], binning[1], binning[2])
+
     if bincontent is None:
-        nbins = 10
         xmin = 1.0
         xmax = 20.0
 
@@ -35,50 +57,30 @@ def fit(bincontent=None, binning=(0, 10, 21), fitrange=None):
 
         print(len(times), "decay times")
 
-        # nbins = optimalbins.optbinsize(times, 1, 80)
-        # print(nbins, "Optimalbins selects nbins")
-        # nbins = optimalbins.optbinsize(times, 1, 30)
+        hist, edges = numpy.histogram(times, bins)
+        result = engine.fit(hist, bins)
 
-        print("Nbins:", nbins)
-        
-        bin_edges = numpy.linspace(binning[0], binning[1], binning[2])
-        bin_centers = bin_edges[:-1] + 0.5 * (bin_edges[1] - bin_edges[0])
-        
-        hist, edges = numpy.histogram(times, bin_edges)
-        
-        # hist = hist[:-1]
-        p0 = numpy.array([200, 2.0, 5])
-        
-        output = optimize.leastsq(error, p0, args=(bin_centers, hist),
-                                  full_output=1)
-        p = output[0]
-        covar = output[1]
-        
-        print("Fit parameters:", p)
-        print("Covariance matrix:", covar)
-        
-        chisquare=0.
-        deviations=error(p, bin_centers, hist)
+        if result is None:
+            print("WARNING: Empty bins.")
+            return None
 
-        for i, d in enumerate(deviations):
-            chisquare += d * d / decay(p, bin_centers[i])
-        
-        params = {"legend.fontsize": 13}
+        print("Fit parameters:", result.parameters)
+        print("Covariance matrix:", result.covariance)
 
-        pylab.rcParams.update(params)
-        
-        fitx = numpy.linspace(xmin, xmax, 100)
+        # plotting is only needed here
+        from matplotlib import pylab
 
-        pylab.plot(bin_centers, hist, "b^", fitx, decay(p, fitx), "b-")
+        fitx, fity = result.curve()
+
+        pylab.plot(result.bin_centers, result.bincontent, "b^",
+                   fitx, fity, "b-")
         pylab.ylim(0, max(hist) + 100)
         pylab.xlabel("Decay time in microseconds")
         pylab.ylabel("Events in time bin")
-        # pylab.legend(("Data","Fit: (%4.2f +- %4.2f) microsec," +
-        #               "chisq / ndf=%4.2f" % (p[1], numpy.sqrt(covar[1][1]),
-        #                                      chisquare / (nbins - len(p)))))
-        pylab.legend(("Data","Fit: (%4.2f) microsec," +
-                      "chisq/ndf=%4.2f" % p[1], chisquare / (nbins - len(p))))
-
+        pylab.legend(("Data", "Fit: (%4.2f +- %4.2f) microsec, " %
+                      (result.value, result.error) +
+                      "chisq/ndf=%4.2f" % result.reduced_chisquare),
+                     prop={"size": 13})
         pylab.grid()
         pylab.savefig("fit.png")
     else:
@@ -87,198 +89,45 @@ def fit(bincontent=None, binning=(0, 10, 21), fitrange=None):
         if len(bincontent) == 0:
             print("WARNING: Empty bins.")
             return None
-    
-        bins = numpy.linspace(binning[0], binning[1], binning[2])
-        bin_centers = bins[:-1] + 0.5 * (bins[1] - bins[0])
-        if fitrange is not None:
-            if fitrange[0] < binning[0]:
-                fitrange = (binning[0], fitrange[1])
-            if fitrange[1] > binning[1]:
-                fitrange = (fitrange[0], binning[1])
-
-            bin_mask = [(bin_centers <= fitrange[1]) &
-                        (bin_centers >= fitrange[0])]
-            bin_centers_ = numpy.asarray([x for x in bin_centers
-                                          if fitrange[0] <= x <= fitrange[1]])
-
-            if len(bin_centers_) < 3:
-                print("WARNING: fit range too small. " +
-                      "Skipping fitting. Try with larger fit range.")
-                return None
-            else:
-                bin_centers = bin_centers_
-                bincontent = bincontent[bin_mask]
-
-        # we cut the leading edge of the distribution away for the fit 
-        glob_max = max(bincontent)
-        cut = 0
-        for i in enumerate(bincontent):
-            if i[1] == glob_max:
-                cut = i[0]
-
-        cut_bincontent = bincontent[cut:]
-        # cut_bincenter = bin_centers[cut]
-        cut_bincenters = bin_centers[cut:]
-
-        # # maybe something for the future..
-        # nbins = optimalbins.optbinsize(cut_bincontent, 1, 20)
-        # fit_bins = numpy.linspace(cut_bincenter, 20, nbins)
-        # fit_bin_centers = fit_bins[:-1] + 0.5 * (fit_bins[1] - fit_bins[0])
-        # fit_bincontent = numpy.zeros(len(fit_bin_centers))
-
-        # # the bincontent must be redistributed to fit_bincontent
-        # for binindex_fit in xrange(len(fit_bincontent)):
-        #     for binindex,content in enumerate(bincontent):
-        #         if bin_centers[binindex] <= fit_bin_centers[binindex_fit]:
-        #             fit_bincontent[binindex_fit] += content
-
-        p0 = numpy.array([200, 2.0, 5])
-
-        # output = optimize.leastsq(error, p0,
-        #                           args=(fit_bin_centers,fitbincontent),
-        #                           full_output=1)
-        output = optimize.leastsq(error, p0,
-                                  args=(cut_bincenters, cut_bincontent),
-                                  full_output=1)
 
-        p = output[0]
-        covar = output[1]
-        
-        print("Fit parameters:", p)
-        print("Covariance matrix:", covar)
-        
-        chisquare = 0.
-        deviations = error(p, cut_bincenters, cut_bincontent)
+        result = engine.fit(bincontent, bins, fitrange)
 
-        for i, d in enumerate(deviations):
-            chisquare += d * d / decay(p, cut_bincenters[i])
-        
-        params = {"legend.fontsize": 13}
-
-        pylab.rcParams.update(params)
-        
-        # nbins = 84
-        nbins = len(bins)
-        xmin = cut_bincenters[0]
-        xmax = cut_bincenters[-1]
+        if result is None:
+            print("WARNING: fit range too small. " +
+                  "Skipping fitting. Try with larger fit range.")
+            return None
 
-        fitx = numpy.linspace(xmin, xmax, 100)
+        return _legacy_result(result, binning)
 
-        # return (bin_centers, bincontent, fitx,
-        #         decay, p, covar, chisquare, nbins)
-        return (cut_bincenters, cut_bincontent, fitx,
-                decay, p, covar, chisquare, nbins)
-     
 
 def gaussian_fit(bincontent, binning=(0, 2, 10), fitrange=None):
     """
-    Guassian fit function
-
-    :param bincontent:
-    :param binning:
-    :param fitrange:
-    :returns:
+    Fit a gaussian to the histogram.
+
+    :param bincontent: bin contents
+    :type bincontent: numpy.ndarray
+    :param binning: binning as arguments of numpy.linspace
+    :type binning: tuple
+    :param fitrange: lower and upper limit of the fitted bin centers
+    :type fitrange: tuple
+    :returns: tuple or None -- bin centers, bin contents, x values of the
+              fit curve, model, parameters, covariance matrix, chi-square
+              and number of bins
     """
-    def gauss(p, x):
-        return (p[0] * (1 / (p[1] * numpy.sqrt(2 * numpy.pi))) *
-                numpy.exp(-0.5 * (((x - p[2]) / p[1]) ** 2)))
-    
-    def error(p, x, y):
-        return gauss(p, x) - y
-    
     if len(bincontent) == 0:
         print("WARNING: Empty bins.")
         return None
-    
-    # this is then used for the mudecay window in muonic.
-    # we have to adjust the bins to the values of the used histogram.
 
     bins = numpy.linspace(binning[0], binning[1], binning[2])
-    bin_centers = bins[:-1] + 0.5 * (bins[1] - bins[0])
-
-    if fitrange is not None:
-        if fitrange[0] < binning[0]:
-            fitrange = (binning[0], fitrange[1])
-        if fitrange[1] > binning[1]:
-            fitrange = (fitrange[0], binning[1])
-        bin_mask = [(bin_centers <= fitrange[1]) &
-                    (bin_centers >= fitrange[0])]
-        bin_centers_ = numpy.asarray([x for x in bin_centers
-                                      if fitrange[0] <= x <= fitrange[1]])
-        if len(bin_centers_) < 3:
-            print("WARNING: fit range too small. " +
-                  "Skipping fitting. Try with larger fit range.")
-            return None
-        else:
-            bin_centers = bin_centers_
-            bincontent = bincontent[bin_mask]
-
-    # # we cut the leading edge of the distribution away for the fit
-    # glob_max = max(bincontent)
-    # cut = 0
-    # for i in enumerate(bincontent):
-    #     if i[1] == glob_max:
-    #         cut = i[0]
+    result = FitEngine(GaussianModel()).fit(bincontent, bins, fitrange)
 
-    cut_bincontent = bincontent  # [cut:]
-    # cut_bincenter = bin_centers  # [cut]
-    cut_bincenters = bin_centers  # [cut:]
-
-    # # maybe something for the future..
-    # nbins = optimalbins.optbinsize(cut_bincontent, 1, 20)
-    # fit_bins = numpy.linspace(cut_bincenter, 20, nbins)
-    # fit_bin_centers = fit_bins[:-1] + 0.5 * (fit_bins[1] - fit_bins[0])
-    # fit_bincontent = numpy.zeros(len(fit_bin_centers))
-
-    # # the bincontent must be redistributed to fit_bincontent
-    # for binindex_fit in xrange(len(fit_bincontent)):
-    #     for binindex, content in enumerate(bincontent):
-    #         if bin_centers[binindex] <= fit_bin_centers[binindex_fit]:
-    #             fit_bincontent[binindex_fit] += content
-
-    wsum = cut_bincontent.sum()
-    mean = (cut_bincontent * cut_bincenters).sum() / wsum
-    meansquared = (cut_bincontent * cut_bincenters ** 2).sum() / wsum
-
-    var = meansquared - mean ** 2
-
-    # p0 = numpy.array([20, 1.0, 5])
-    p0 = numpy.array([max(cut_bincontent), var, mean])
-
-    # output = optimize.leastsq(error, p0,
-    #                           args=(fit_bin_centers, fitbincontent),
-    #                           full_output=1)
-    output = optimize.leastsq(error, p0,
-                              args=(cut_bincenters, cut_bincontent),
-                              full_output=1)
-
-    p = output[0]
-    covar = output[1]
-    
-    print("Fit parameters:", p)
-    print("Covariance matrix:", covar)
-    
-    chisquare = 0.
-    deviations = error(p, cut_bincenters, cut_bincontent)
-
-    for i, d in enumerate(deviations):
-        chisquare += d*d/gauss(p,cut_bincenters[i])
-    
-    params = {"legend.fontsize": 13}
-
-    pylab.rcParams.update(params)
-    
-    # nbins = 84
-    nbins = len(bins)
-    xmin = cut_bincenters[0]
-    xmax = cut_bincenters[-1]
+    if result is None:
+        print("WARNING: fit range too small. " +
+              "Skipping fitting. Try with larger fit range.")
+        return None
 
-    fitx = numpy.linspace(xmin, xmax, 100)
+    return _legacy_result(result, binning)
 
-    # return (bin_centers, bincontent, fitx, decay, p, covar, chisquare, nbins)
-    return (cut_bincenters, cut_bincontent, fitx,
-            gauss, p, covar, chisquare, nbins)
-     
 
 if __name__ == '__main__':
     fit()
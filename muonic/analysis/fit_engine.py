@@ -0,0 +1,664 @@
+"""
+Fit engine for the histograms of muonic without plotting dependencies.
+
+The bin contents are fitted with a binned Poisson likelihood, which stays
+valid for bins with few or no entries. The likelihood is minimized with a
+damped Fisher scoring (Levenberg-Marquardt) iteration using the analytic
+gradients of the models. A FitEngine keeps its last result and starts the
+next fit from it, so refitting a histogram that changed a little takes just
+a few iterations. Everything is vectorized with numpy, nothing is printed or
+plotted, so it is safe to fit at a high rate.
+
+BackgroundFitter runs the fits of a FitEngine in a worker thread. A new fit
+cancels the one still running, and results are cached by histogram state
+and fit range, so fitting unchanged data again returns at once.
+"""
+from __future__ import print_function
+from collections import OrderedDict
+import hashlib
+import queue
+import threading
+
+import numpy as np
+
+__all__ = ["FitModel", "ExponentialModel", "GaussianModel", "FitResult",
+           "FitEngine", "BackgroundFitter", "poisson_fit"]
+
+
+class FitModel(object):
+    """
+    Base class for the models of the expected bin contents.
+
+    :param name: name of the model
+    :type name: str
+    :param parameter_names: names of the parameters
+    :type parameter_names: tuple of str
+    :param primary: index of the parameter reported as fit result
+    :type primary: int
+    """
+
+    def __init__(self, name, parameter_names, primary):
+        self.name = name
+        self.parameter_names = parameter_names
+        self.primary = primary
+
+    def evaluate(self, p, x):
+        """
+        Expected bin contents.
+
+        :param p: parameters
+        :type p: numpy.ndarray
+        :param x: bin centers
+        :type x: numpy.ndarray
+        :returns: numpy.ndarray
+        """
+        raise NotImplementedError("implement this method")
+
+    def gradient(self, p, x):
+        """
+        Derivatives of the expected bin contents with respect to the
+        parameters, one row per parameter.
+
+        :param p: parameters
+        :type p: numpy.ndarray
+        :param x: bin centers
+        :type x: numpy.ndarray
+        :returns: numpy.ndarray
+        """
+        raise NotImplementedError("implement this method")
+
+    def initial(self, x, y):
+        """
+        Starting values of the parameters estimated from the data.
+
+        :param x: bin centers
+        :type x: numpy.ndarray
+        :param y: bin contents
+        :type y: numpy.ndarray
+        :returns: numpy.ndarray
+        """
+        raise NotImplementedError("implement this method")
+
+    def valid(self, p):
+        """
+        Check if the parameters are allowed.
+
+        :param p: parameters
+        :type p: numpy.ndarray
+        :returns: bool
+        """
+        return bool(np.all(np.isfinite(p)))
+
+    def __call__(self, p, x):
+        return self.evaluate(p, x)
+
+
+class ExponentialModel(FitModel):
+    """
+    Exponential decay on a flat background, amplitude * exp(-x / lifetime)
+    + background. The lifetime is reported as fit result.
+    """
+
+    def __init__(self):
+        FitModel.__init__(self, "exponential",
+                          ("amplitude", "lifetime", "background"), 1)
+
+    def evaluate(self, p, x):
+        return p[0] * np.exp(-x / p[1]) + p[2]
+
+    def gradient(self, p, x):
+        exponential = np.exp(-x / p[1])
+        return np.vstack((exponential,
+                          p[0] * exponential * x / p[1] ** 2,
+                          np.ones_like(x)))
+
+    def initial(self, x, y):
+        background = max(y.min(), 0.)
+        signal = np.clip(y - background, 0., None)
+        lifetime = ((signal * (x - x[0])).sum() / max(signal.sum(), 1.))
+
+        if lifetime <= 0:
+            lifetime = max(x[-1] - x[0], 1.)
+
+        amplitude = max(signal[0], 1.) * np.exp(x[0] / lifetime)
+        return np.array([amplitude, lifetime, background], dtype=float)
+
+    def valid(self, p):
+        return FitModel.valid(self, p) and p[1] > 0
+
+
+class GaussianModel(FitModel):
+    """
+    Gaussian, area / (sigma * sqrt(2 pi)) * exp(-(x - mean)^2 / (2 sigma^2)).
+    The mean is reported as fit result.
+    """
+
+    def __init__(self):
+        FitModel.__init__(self, "gaussian", ("area", "sigma", "mean"), 2)
+
+    def evaluate(self, p, x):
+        z = (x - p[2]) / p[1]
+        return p[0] / (p[1] * np.sqrt(2 * np.pi)) * np.exp(-0.5 * z ** 2)
+
+    def gradient(self, p, x):
+        z = (x - p[2]) / p[1]
+        value = (1. / (p[1] * np.sqrt(2 * np.pi))) * np.exp(-0.5 * z ** 2)
+        return np.vstack((value,
+                          p[0] * value * (z ** 2 - 1) / p[1],
+                          p[0] * value * z / p[1]))
+
+    def initial(self, x, y):
+        total = max(y.sum(), 1.)
+        mean = (y * x).sum() / total
+        sigma = np.sqrt(max((y * x ** 2).sum() / total - mean ** 2, 0.))
+
+        if sigma <= 0:
+            sigma = max(x[-1] - x[0], 1.) / 4.
+
+        area = y.sum() * (x[-1] - x[0]) / max(len(x) - 1, 1)
+        return np.array([max(area, 1.), sigma, mean], dtype=float)
+
+    def valid(self, p):
+        return FitModel.valid(self, p) and p[1] > 0
+
+
+class FitResult(object):
+    """
+    Result of a fit.
+
+    :param model: fitted model
+    :type model: FitModel
+    :param parameters: best fit parameters
+    :type parameters: numpy.ndarray
+    :param covariance: covariance matrix of the parameters, None if the
+                       Fisher information is singular
+    :type covariance: numpy.ndarray
+    :param bin_centers: centers of the fitted bins
+    :type bin_centers: numpy.ndarray
+    :param bincontent: contents of the fitted bins
+    :type bincontent: numpy.ndarray
+    :param deviance: Poisson deviance of the fit
+    :type deviance: float
+    :param iterations: number of iterations needed
+    :type iterations: int
+    :param converged: the fit converged
+    :type converged: bool
+    """
+
+    def __init__(self, model, parameters, covariance, bin_centers,
+                 bincontent, deviance, iterations, converged):
+        self.model = model
+        self.parameters = parameters
+        self.covariance = covariance
+        self.bin_centers = bin_centers
+        self.bincontent = bincontent
+        self.deviance = deviance
+        self.iterations = iterations
+        self.converged = converged
+
+        expected = model.evaluate(parameters, bin_centers)
+        self.chisquare = float(((bincontent - expected) ** 2 /
+                                expected).sum())
+        self.ndf = len(bin_centers) - len(parameters)
+
+    @property
+    def errors(self):
+        """
+        Uncertainties of the parameters, NaN if not available.
+
+        :returns: numpy.ndarray
+        """
+        if self.covariance is None:
+            return np.full(len(self.parameters), np.nan)
+        return np.sqrt(np.absolute(np.diag(self.covariance)))
+
+    @property
+    def value(self):
+        """
+        The primary parameter of the model, e.g. the lifetime.
+
+        :returns: float
+        """
+        return self.parameters[self.model.primary]
+
+    @property
+    def error(self):
+        """
+        Uncertainty of the primary parameter, NaN if not available.
+
+        :returns: float
+        """
+        return self.errors[self.model.primary]
+
+    @property
+    def reduced_chisquare(self):
+        """
+        Chi-square per degree of freedom, NaN without degrees of freedom.
+
+        :returns: float
+        """
+        if self.ndf <= 0:
+            return np.nan
+        return self.chisquare / self.ndf
+
+    def evaluate(self, x):
+        """
+        Evaluate the fitted model.
+
+        :param x: bin centers
+        :type x: numpy.ndarray
+        :returns: numpy.ndarray
+        """
+        return self.model.evaluate(self.parameters, np.asarray(x, dtype=float))
+
+    def curve(self, points=100):
+        """
+        Sample the fitted model over the fitted bins, e.g. for plotting.
+
+        :param points: number of points
+        :type points: int
+        :returns: tuple of numpy.ndarray -- x and y values
+        """
+        x = np.linspace(self.bin_centers[0], self.bin_centers[-1], points)
+        return x, self.evaluate(x)
+
+
+def _deviance(y, mu):
+    """
+    Poisson deviance, twice the negative log-likelihood ratio to the
+    saturated model.
+
+    :param y: bin contents
+    :type y: numpy.ndarray
+    :param mu: expected bin contents
+    :type mu: numpy.ndarray
+    :returns: float
+    """
+    positive = y > 0
+    return 2. * ((mu - y).sum() +
+                 (y[positive] * np.log(y[positive] / mu[positive])).sum())
+
+
+def poisson_fit(model, x, y, start=None, max_iterations=100,
+                tolerance=1e-8, should_stop=None):
+    """
+    Fit the model to the bin contents with a binned Poisson likelihood.
+
+    :param model: the model
+    :type model: FitModel
+    :param x: bin centers
+    :type x: numpy.ndarray
+    :param y: bin contents
+    :type y: numpy.ndarray
+    :param start: starting values, estimated from the data if None
+    :type start: numpy.ndarray
+    :param max_iterations: maximum number of iterations
+    :type max_iterations: int
+    :param tolerance: relative change of the deviance at convergence
+    :type tolerance: float
+    :param should_stop: called before every iteration, the fit is
+                        abandoned if it returns True
+    :type should_stop: callable
+    :returns: FitResult or None -- None if the fit was abandoned
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    p = model.initial(x, y) if start is None else np.array(start, dtype=float)
+    mu = model.evaluate(p, x)
+
+    if not model.valid(p) or np.any(mu <= 0):
+        p = model.initial(x, y)
+        mu = model.evaluate(p, x)
+
+    deviance = _deviance(y, np.clip(mu, 1e-300, None))
+    damping = 1e-3
+    converged = False
+    iterations = 0
+
+    while iterations < max_iterations and not converged:
+        if should_stop is not None and should_stop():
+            return None
+
+        iterations += 1
+
+        jacobian = model.gradient(p, x)
+        gradient = np.dot(jacobian, 1. - y / mu)
+        information = np.dot(jacobian / mu, jacobian.T)
+        scale = np.diag(np.diag(information))
+
+        while damping < 1e12:
+            try:
+                step = np.linalg.solve(information + damping * scale,
+                                       -gradient)
+            except np.linalg.LinAlgError:
+                damping *= 10
+                continue
+
+            candidate = p + step
+
+            if model.valid(candidate):
+                candidate_mu = model.evaluate(candidate, x)
+
+                if np.all(candidate_mu > 0):
+                    candidate_deviance = _deviance(y, candidate_mu)
+
+                    if candidate_deviance <= deviance:
+                        converged = (deviance - candidate_deviance <=
+                                     tolerance * (1. + candidate_deviance))
+                        p, mu, deviance = (candidate, candidate_mu,
+                                           candidate_deviance)
+                        damping = max(damping / 10., 1e-9)
+                        break
+
+            damping *= 10
+        else:
+            # no step improves the likelihood, we are at the minimum
+            converged = True
+
+    jacobian = model.gradient(p, x)
+    information = np.dot(jacobian / mu, jacobian.T)
+
+    try:
+        covariance = np.linalg.inv(information)
+    except np.linalg.LinAlgError:
+        covariance = None
+
+    return FitResult(model, p, covariance, x, y, deviance, iterations,
+                     converged)
+
+
+class FitEngine(object):
+    """
+    Fits histograms with a model, starting each fit from the previous
+    result.
+
+    :param model: the model
+    :type model: FitModel
+    :param cut_to_maximum: ignore the bins before the highest bin, e.g. to
+                           cut away the leading edge of a decay spectrum
+    :type cut_to_maximum: bool
+    :param min_bins: minimum number of bins to fit
+    :type min_bins: int
+    """
+
+    def __init__(self, model, cut_to_maximum=False, min_bins=3):
+        self.model = model
+        self.cut_to_maximum = cut_to_maximum
+        self.min_bins = min_bins
+        self.last_result = None
+
+    def reset(self):
+        """
+        Forget the previous result, the next fit starts
+        from values estimated from the data.
+
+        :returns: None
+        """
+        self.last_result = None
+
+    def select(self, bincontent, bin_edges, fit_range=None):
+        """
+        Get the bins used for the fit.
+
+        :param bincontent: bin contents
+        :type bincontent: numpy.ndarray
+        :param bin_edges: bin edges
+        :type bin_edges: numpy.ndarray
+        :param fit_range: lower and upper limit of the bin centers
+        :type fit_range: tuple of floats
+        :returns: tuple of numpy.ndarray -- bin centers and contents
+        """
+        bincontent = np.asarray(bincontent, dtype=float)
+        bin_edges = np.asarray(bin_edges, dtype=float)
+        bin_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
+
+        if fit_range is not None:
+            mask = ((bin_centers >= fit_range[0]) &
+                    (bin_centers <= fit_range[1]))
+            bin_centers = bin_centers[mask]
+            bincontent = bincontent[mask]
+
+        if self.cut_to_maximum and len(bincontent):
+            # the last of the highest bins, like the original fit
+            cut = len(bincontent) - 1 - np.argmax(bincontent[::-1])
+            bin_centers = bin_centers[cut:]
+            bincontent = bincontent[cut:]
+
+        return bin_centers, bincontent
+
+    def fit(self, bincontent, bin_edges, fit_range=None, should_stop=None):
+        """
+        Fit the histogram.
+
+        :param bincontent: bin contents
+        :type bincontent: numpy.ndarray
+        :param bin_edges: bin edges
+        :type bin_edges: numpy.ndarray
+        :param fit_range: lower and upper limit of the bin centers
+        :type fit_range: tuple of floats
+        :param should_stop: called before every iteration, the fit is
+                            abandoned if it returns True
+        :type should_stop: callable
+        :returns: FitResult or None -- None if there are too few bins
+                  or no entries, or if the fit was abandoned
+        """
+        bin_centers, bincontent = self.select(bincontent, bin_edges,
+                                              fit_range)
+
+        if len(bin_centers) < self.min_bins or not bincontent.any():
+            return None
+
+        result = None
+
+        if self.last_result is not None:
+            result = poisson_fit(self.model, bin_centers, bincontent,
+                                 start=self.last_result.parameters,
+                                 should_stop=should_stop)
+
+        if result is None or not result.converged:
+            if should_stop is not None and should_stop():
+                return None
+
+            result = poisson_fit(self.model, bin_centers, bincontent,
+                                 should_stop=should_stop)
+
+            if result is None:
+                return None
+
+        self.last_result = result
+        return result
+
+
+class _FitJob(object):
+    """
+    A fit waiting for or running in the worker thread of BackgroundFitter.
+    """
+
+    def __init__(self, key, bincontent, bin_edges, fit_range):
+        self.key = key
+        self.bincontent = bincontent
+        self.bin_edges = bin_edges
+        self.fit_range = fit_range
+        self.cancelled = threading.Event()
+
+
+class BackgroundFitter(object):
+    """
+    Runs the fits of a FitEngine in a worker thread. Only the latest fit
+    matters, submitting a fit cancels the previous one. The results are
+    cached by histogram state and fit range.
+
+    The callback is called with the FitResult, or None if the histogram can
+    not be fitted. It is called from the worker thread, or from the thread
+    calling submit if the result was cached, so GUI code has to pass the
+    result on to its own thread, e.g. with a Qt signal.
+
+    :param engine: the fit engine, it must not be used by others meanwhile
+    :type engine: FitEngine
+    :param callback: called with the result of every completed fit
+    :type callback: callable
+    :param cache_size: number of cached results
+    :type cache_size: int
+    """
+
+    def __init__(self, engine, callback=None, cache_size=16):
+        self.engine = engine
+        self.callback = callback
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._current = None
+        self._thread = None
+
+    @staticmethod
+    def key(bincontent, bin_edges, fit_range=None):
+        """
+        Cache key of a fit.
+
+        :param bincontent: bin contents
+        :type bincontent: numpy.ndarray
+        :param bin_edges: bin edges
+        :type bin_edges: numpy.ndarray
+        :param fit_range: lower and upper limit of the bin centers
+        :type fit_range: tuple of floats
+        :returns: tuple
+        """
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(bincontent, dtype=float).tobytes())
+        digest.update(np.ascontiguousarray(bin_edges, dtype=float).tobytes())
+
+        if fit_range is not None:
+            fit_range = tuple(float(limit) for limit in fit_range)
+        return digest.hexdigest(), fit_range
+
+    def cached(self, key):
+        """
+        Get a cached result.
+
+        :param key: cache key, see key
+        :type key: tuple
+        :returns: tuple of bool and FitResult -- whether the result was
+                  cached and the result
+        """
+        with self._lock:
+            if key not in self._cache:
+                return False, None
+
+            # move to the end, the oldest results are dropped first
+            result = self._cache.pop(key)
+            self._cache[key] = result
+            return True, result
+
+    def submit(self, bincontent, bin_edges, fit_range=None):
+        """
+        Fit the histogram. A fit still running is cancelled.
+
+        :param bincontent: bin contents
+        :type bincontent: numpy.ndarray
+        :param bin_edges: bin edges
+        :type bin_edges: numpy.ndarray
+        :param fit_range: lower and upper limit of the bin centers
+        :type fit_range: tuple of floats
+        :returns: bool -- True if the result was cached and the callback
+                  has been called already
+        """
+        key = self.key(bincontent, bin_edges, fit_range)
+        self.cancel()
+
+        found, result = self.cached(key)
+
+        if found:
+            if self.callback is not None:
+                self.callback(result)
+            return True
+
+        job = _FitJob(key, np.array(bincontent, dtype=float),
+                      np.array(bin_edges, dtype=float), fit_range)
+        self._current = job
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run,
+                                            name="BackgroundFitter")
+            self._thread.daemon = True
+            self._thread.start()
+
+        self._jobs.put(job)
+        return False
+
+    def busy(self):
+        """
+        Check if a fit is waiting or running.
+
+        :returns: bool
+        """
+        job = self._current
+        return job is not None and not job.cancelled.is_set()
+
+    def cancel(self):
+        """
+        Cancel the fit waiting or running, its callback is not called.
+
+        :returns: None
+        """
+        job = self._current
+        self._current = None
+
+        if job is not None:
+            job.cancelled.set()
+
+    def clear(self):
+        """
+        Remove all cached results.
+
+        :returns: None
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        """
+        Cancel the current fit and stop the worker thread.
+
+        :returns: None
+        """
+        self.cancel()
+
+        if self._thread is not None and self._thread.is_alive():
+            self._jobs.put(None)
+
+    def _run(self):
+        """
+        Worker thread fitting the submitted histograms.
+
+        :returns: None
+        """
+        while True:
+            job = self._jobs.get()
+
+            if job is None:
+                return
+
+            if job.cancelled.is_set():
+                continue
+
+            result = self.engine.fit(job.bincontent, job.bin_edges,
+                                     job.fit_range,
+                                     should_stop=job.cancelled.is_set)
+
+            if job.cancelled.is_set():
+                continue
+
+            with self._lock:
+                self._cache[job.key] = result
+
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+            if self._current is job:
+                self._current = None
+
+            if self.callback is not None:
+                self.callback(result)
@@ -0,0 +1,185 @@
+"""
+Fine grained histogram from which coarser histograms are derived.
+
+The entries are counted in an integer array with a high resolution, e.g.
+10 ns for decay times or 1 ns for pulse widths, plus underflow and overflow
+counters. Any coarser binning on the same grid is derived by summing the
+fine bins, which takes O(number of coarse bins) using cumulative sums. So
+the display binning or the fit range can change at any time without
+collecting the data again, and plots and fits see the same counts.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+__all__ = ["FineHistogram"]
+
+
+class FineHistogram(object):
+    """
+    Histogram with equal fine bins between low and high.
+
+    Raises ValueError if the range or the resolution are invalid.
+
+    :param low: lower edge of the first bin
+    :type low: float
+    :param high: upper edge of the last bin
+    :type high: float
+    :param resolution: bin width
+    :type resolution: float
+    :raises: ValueError
+    """
+
+    def __init__(self, low, high, resolution):
+        if resolution <= 0 or high <= low:
+            raise ValueError("histogram range and resolution have to " +
+                             "be positive")
+
+        self.low = float(low)
+        self.resolution = float(resolution)
+        self.nbins = int(round((high - low) / resolution))
+
+        if self.nbins < 1:
+            raise ValueError("histogram range is smaller than the resolution")
+
+        self.high = self.low + self.nbins * self.resolution
+        self.counts = np.zeros(self.nbins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+        self._cumulative = None
+
+    @property
+    def edges(self):
+        """
+        Edges of the fine bins.
+
+        :returns: numpy.ndarray
+        """
+        return self.low + np.arange(self.nbins + 1) * self.resolution
+
+    @property
+    def entries(self):
+        """
+        Number of entries within the range.
+
+        :returns: int
+        """
+        return int(self._get_cumulative()[-1])
+
+    def reset(self):
+        """
+        Remove all entries.
+
+        :returns: None
+        """
+        self.counts[:] = 0
+        self.underflow = 0
+        self.overflow = 0
+        self._cumulative = None
+
+    def fill_one(self, value):
+        """
+        Add a single entry.
+
+        :param value: the value
+        :type value: float
+        :returns: None
+        """
+        index = int(np.floor((value - self.low) / self.resolution))
+
+        if index < 0:
+            self.underflow += 1
+        elif index >= self.nbins:
+            self.overflow += 1
+        else:
+            self.counts[index] += 1
+
+        self._cumulative = None
+
+    def fill(self, values):
+        """
+        Add entries.
+
+        :param values: the values
+        :type values: iterable of floats
+        :returns: None
+        """
+        values = np.asarray(values, dtype=float).ravel()
+
+        if not len(values):
+            return
+
+        indices = np.floor((values - self.low) /
+                           self.resolution).astype(np.int64)
+        underflow = indices < 0
+        overflow = indices >= self.nbins
+
+        self.underflow += int(underflow.sum())
+        self.overflow += int(overflow.sum())
+        self.counts += np.bincount(indices[~(underflow | overflow)],
+                                   minlength=self.nbins)
+        self._cumulative = None
+
+    def _get_cumulative(self):
+        """
+        Cumulative sum of the counts, cached until the next fill.
+
+        :returns: numpy.ndarray
+        """
+        if self._cumulative is None:
+            self._cumulative = np.concatenate(([0], np.cumsum(self.counts)))
+        return self._cumulative
+
+    def edge_indices(self, bin_edges):
+        """
+        Get the indices of the fine bin edges nearest to the given edges,
+        limited to the histogram range.
+
+        :param bin_edges: bin edges
+        :type bin_edges: numpy.ndarray
+        :returns: numpy.ndarray
+        """
+        indices = np.round((np.asarray(bin_edges, dtype=float) - self.low) /
+                           self.resolution).astype(np.int64)
+        return np.clip(indices, 0, self.nbins)
+
+    def rebin(self, bin_edges):
+        """
+        Get the counts in coarser bins. The edges are moved to the
+        nearest fine bin edges, so they should lie on the fine grid.
+
+        :param bin_edges: bin edges
+        :type bin_edges: numpy.ndarray
+        :returns: numpy.ndarray
+        """
+        cumulative = self._get_cumulative()
+        indices = self.edge_indices(bin_edges)
+        return cumulative[indices[1:]] - cumulative[indices[:-1]]
+
+    def rebin_by(self, factor):
+        """
+        Get the counts in bins combining factor fine bins each, a last
+        incomplete bin is dropped.
+
+        :param factor: number of fine bins per bin
+        :type factor: int
+        :returns: tuple of numpy.ndarray -- counts and bin edges
+        """
+        nbins = self.nbins // factor
+        counts = self.counts[:nbins * factor].reshape(nbins, factor).sum(1)
+        return counts, self.low + (np.arange(nbins + 1) * factor *
+                                   self.resolution)
+
+    def count(self, low, high):
+        """
+        Number of entries between the fine bin edges nearest to low
+        and high.
+
+        :param low: lower limit
+        :type low: float
+        :param high: upper limit
+        :type high: float
+        :returns: int
+        """
+        return int(self.rebin((low, high))[0])
@@ -0,0 +1,591 @@
+"""
+Maximum likelihood estimates of the muon lifetime.
+
+The decay times within the fit range [a, b] are described by a truncated
+exponential on top of a flat background:
+
+    p(t) = f * exp(-(t - a) / tau) / (tau * (1 - exp(-(b - a) / tau)))
+           + (1 - f) / (b - a)
+
+The upper limit b is the end of the fit range or the end of the trigger
+window, whichever comes first, so decays the card could not record do not
+bias the lifetime.
+
+OnlineLifetimeEstimator updates the estimate as the decays arrive. Adding a
+decay only increments a counter in a fine grained histogram, which is the
+sufficient statistic of the fit up to the histogram resolution. The estimate
+is computed from that histogram with a few expectation maximization steps
+started at the previous estimate, so its cost depends on the number of
+histogram bins only and not on the number of decays. It is cached until new
+decays arrive.
+
+fit_lifetime does the unbinned fit of stored decay times, e.g. read from
+the decay files with read_decay_times. UnbinnedFitWorker runs it in a
+background thread.
+
+Times are in microseconds.
+"""
+from __future__ import print_function
+from collections import namedtuple
+import argparse
+import math
+import threading
+
+import numpy as np
+
+from muonic.analysis.histogram import FineHistogram
+
+__all__ = ["LifetimeFit", "OnlineLifetimeEstimator", "read_decay_times",
+           "fit_lifetime", "UnbinnedFitWorker"]
+
+# bounds of the lifetime in units of the fit range length
+MIN_LIFETIME = 1e-3
+MAX_LIFETIME = 1e3
+
+# number of grid points integrating the Fisher information of unbinned fits
+INFORMATION_GRID_POINTS = 2000
+
+# lifetime, its uncertainty, fraction of the decays in the fit range
+# attributed to the signal and the number of decays in the fit range
+LifetimeFit = namedtuple("LifetimeFit",
+                         ["lifetime", "error", "signal_fraction", "decays"])
+
+
+def _truncated_mean(tau, length):
+    """
+    Mean of an exponential with lifetime tau truncated to [0, length]
+    and its derivative with respect to tau.
+
+    :param tau: lifetime
+    :type tau: float
+    :param length: length of the interval
+    :type length: float
+    :returns: tuple of floats
+    """
+    x = math.exp(-length / tau)
+    one_minus_x = -math.expm1(-length / tau)
+    return (tau - length * x / one_minus_x,
+            1. - (length / tau) ** 2 * x / one_minus_x ** 2)
+
+
+def _solve_lifetime(mean, length, tau=None):
+    """
+    Get the lifetime of the exponential truncated to [0, length] with the
+    given mean. This is the maximum likelihood estimate for a sample with
+    that mean. The truncated mean rises monotonically with the lifetime,
+    so the equation is solved by Newton steps in log(tau), falling back to
+    bisection if a step leaves the bracket of the solution.
+
+    :param mean: sample mean
+    :type mean: float
+    :param length: length of the interval
+    :type length: float
+    :param tau: starting value
+    :type tau: float
+    :returns: float
+    """
+    low = math.log(MIN_LIFETIME * length)
+    high = math.log(MAX_LIFETIME * length)
+
+    if mean >= _truncated_mean(math.exp(high), length)[0]:
+        return math.exp(high)
+    if mean <= _truncated_mean(math.exp(low), length)[0]:
+        return math.exp(low)
+
+    if tau is None:
+        tau = mean
+    u = min(max(math.log(tau), low), high)
+
+    for _ in range(100):
+        tau = math.exp(u)
+        value, derivative = _truncated_mean(tau, length)
+        value -= mean
+
+        if value < 0:
+            low = u
+        else:
+            high = u
+
+        step = value / (tau * derivative) if derivative > 0 else np.inf
+        new_u = u - step
+
+        if not low < new_u < high:
+            new_u = 0.5 * (low + high)
+
+        if abs(new_u - u) < 1e-12:
+            break
+        u = new_u
+
+    return math.exp(u)
+
+
+def _densities(times, length, tau):
+    """
+    Signal and background densities at the given times, which are
+    relative to the lower limit of the fit range.
+
+    :param times: times relative to the lower limit
+    :type times: numpy.ndarray
+    :param length: length of the fit range
+    :type length: float
+    :param tau: lifetime
+    :type tau: float
+    :returns: tuple of numpy.ndarray and float
+    """
+    signal = np.exp(-times / tau) / (tau * -math.expm1(-length / tau))
+    return signal, 1. / length
+
+
+def _expectation_maximization_step(times, weights, length, parameters):
+    """
+    One expectation maximization step of lifetime and signal fraction.
+
+    :param times: times relative to the lower limit of the fit range
+    :type times: numpy.ndarray
+    :param weights: number of decays at each time
+    :type weights: numpy.ndarray
+    :param length: length of the fit range
+    :type length: float
+    :param parameters: lifetime and signal fraction
+    :type parameters: numpy.ndarray
+    :returns: numpy.ndarray -- the updated parameters
+    """
+    tau, fraction = parameters
+    signal, flat = _densities(times, length, tau)
+    signal *= fraction
+    signal_weights = weights * signal / (signal + (1. - fraction) * flat)
+    signal_counts = signal_weights.sum()
+
+    if signal_counts <= 0:
+        return np.array([tau, 0.])
+
+    return np.array([_solve_lifetime(np.dot(signal_weights, times) /
+                                     signal_counts, length, tau),
+                     signal_counts / weights.sum()])
+
+
+def _maximize_likelihood(times, weights, length, tau=None, fraction=None,
+                         background=True, max_iterations=200,
+                         tolerance=1e-7):
+    """
+    Expectation maximization of the lifetime and the signal fraction. The
+    iteration is accelerated by squared extrapolation (SQUAREM), falling
+    back to plain steps if the extrapolation leaves the allowed range.
+
+    :param times: times relative to the lower limit of the fit range
+    :type times: numpy.ndarray
+    :param weights: number of decays at each time
+    :type weights: numpy.ndarray
+    :param length: length of the fit range
+    :type length: float
+    :param tau: starting value of the lifetime, None to start
+                from the lifetime without background
+    :type tau: float
+    :param fraction: starting value of the signal fraction
+    :type fraction: float
+    :param background: fit a flat background
+    :type background: bool
+    :param max_iterations: maximum number of iterations
+    :type max_iterations: int
+    :param tolerance: relative change at convergence
+    :type tolerance: float
+    :returns: tuple of floats -- lifetime and signal fraction
+    """
+    mean = np.dot(weights, times) / weights.sum()
+
+    if not background:
+        return _solve_lifetime(mean, length, tau), 1.
+
+    if tau is None:
+        tau = _solve_lifetime(mean, length)
+    if fraction is None:
+        fraction = 0.9
+
+    parameters = np.array([tau, fraction])
+
+    for _ in range(max_iterations):
+        first = _expectation_maximization_step(times, weights, length,
+                                               parameters)
+        second = _expectation_maximization_step(times, weights, length,
+                                                first)
+        r = first - parameters
+        v = second - first - r
+        new_parameters = second
+
+        if np.dot(v, v) > 0:
+            alpha = min(-np.sqrt(np.dot(r, r) / np.dot(v, v)), -1.)
+            extrapolated = parameters - 2 * alpha * r + alpha ** 2 * v
+
+            if extrapolated[0] > 0 and 0 < extrapolated[1] < 1:
+                new_parameters = _expectation_maximization_step(
+                        times, weights, length, extrapolated)
+
+        change = np.absolute(new_parameters - parameters)
+        parameters = new_parameters
+
+        if (change[0] <= tolerance * parameters[0] and
+                change[1] <= tolerance):
+            break
+
+    return parameters[0], min(max(parameters[1], 1e-6), 1. - 1e-6)
+
+
+def _covariance(grid, step, length, tau, fraction, total, background=True):
+    """
+    Covariance of lifetime and signal fraction from the expected Fisher
+    information, integrated over a grid covering the fit range.
+
+    :param grid: grid points relative to the lower limit of the fit range
+    :type grid: numpy.ndarray
+    :param step: spacing of the grid points
+    :type step: float
+    :param length: length of the fit range
+    :type length: float
+    :param tau: lifetime
+    :type tau: float
+    :param fraction: signal fraction
+    :type fraction: float
+    :param total: number of decays in the fit range
+    :type total: int
+    :param background: a flat background was fitted
+    :type background: bool
+    :returns: numpy.ndarray
+    """
+    signal, flat = _densities(grid, length, tau)
+    density = fraction * signal + (1. - fraction) * flat
+    x = np.exp(-length / tau)
+    d_log_norm = 1. / tau - length * x / (tau ** 2 * (1. - x))
+    d_tau = fraction * signal * (grid / tau ** 2 - d_log_norm) / density
+
+    probabilities = density * step
+
+    if not background:
+        information = total * (probabilities * d_tau ** 2).sum()
+        return np.array([[1. / information]])
+
+    d_fraction = (signal - flat) / density
+    scores = np.vstack((d_tau, d_fraction))
+    information = total * np.dot(scores * probabilities, scores.T)
+    return np.linalg.pinv(information)
+
+
+class OnlineLifetimeEstimator(object):
+    """
+    Maximum likelihood estimate of the lifetime, updated as the decays
+    arrive. Adding a decay is O(1), the estimate is computed on demand.
+
+    The decays are counted in a FineHistogram, which may be shared with
+    others, e.g. a histogram canvas filling it.
+
+    Raises ValueError if the fit range or the resolution are invalid.
+
+    :param fit_range: lower and upper limit of the decay times used
+    :type fit_range: tuple of floats
+    :param max_time: largest decay time recorded
+    :type max_time: float
+    :param resolution: histogram bin width
+    :type resolution: float
+    :param background: fit a flat background
+    :type background: bool
+    :param min_decays: minimum number of decays in the fit range
+                       for an estimate
+    :type min_decays: int
+    :param histogram: histogram of the decay times to use instead of an
+                      own one, max_time and resolution are taken from it
+    :type histogram: muonic.analysis.histogram.FineHistogram
+    :raises: ValueError
+    """
+
+    def __init__(self, fit_range=(0.5, 10.), max_time=20., resolution=0.01,
+                 background=True, min_decays=10, histogram=None):
+        if histogram is None:
+            histogram = FineHistogram(0., max_time, resolution)
+
+        self.histogram = histogram
+        self.background = background
+        self.min_decays = min_decays
+
+        self.fit_range = None
+        self.set_fit_range(fit_range)
+
+    @property
+    def decays(self):
+        """
+        Number of decays within the recorded range.
+
+        :returns: int
+        """
+        return self.histogram.entries
+
+    def reset(self):
+        """
+        Remove all decays.
+
+        :returns: None
+        """
+        self.histogram.reset()
+        self._invalidate()
+
+    def _invalidate(self):
+        """
+        Discard the cached estimate and the starting point.
+
+        :returns: None
+        """
+        self._estimate = None
+        self._estimated_decays = -1
+        self._tau = None
+        self._fraction = None
+
+    def set_fit_range(self, fit_range):
+        """
+        Change the fit range. The limits are moved to the
+        nearest bin edges within the recorded range.
+
+        Raises ValueError if the fit range is empty.
+
+        :param fit_range: lower and upper limit
+        :type fit_range: tuple of floats
+        :returns: None
+        :raises: ValueError
+        """
+        first, last = self.histogram.edge_indices(fit_range)
+
+        if last - first < 2:
+            raise ValueError("fit range has to cover at least two bins")
+
+        self.fit_range = tuple(fit_range)
+        self._slice = slice(first, last)
+        self._invalidate()
+
+    def add(self, decay_time):
+        """
+        Add a decay time.
+
+        :param decay_time: decay time
+        :type decay_time: float
+        :returns: None
+        """
+        self.histogram.fill_one(decay_time)
+
+    def add_many(self, decay_times):
+        """
+        Add decay times.
+
+        :param decay_times: decay times
+        :type decay_times: iterable of floats
+        :returns: None
+        """
+        self.histogram.fill(decay_times)
+
+    def estimate(self):
+        """
+        Get the current estimate. It is recomputed only if
+        decays were added since the last call.
+
+        :returns: LifetimeFit or None -- None if there are not enough
+                  decays
+        """
+        decays = self.decays
+
+        if decays == self._estimated_decays:
+            return self._estimate
+
+        self._estimated_decays = decays
+
+        counts = self.histogram.counts[self._slice]
+        total = counts.sum()
+
+        if total < self.min_decays:
+            self._estimate = None
+            return None
+
+        resolution = self.histogram.resolution
+        length = len(counts) * resolution
+        times = (np.arange(len(counts)) + 0.5) * resolution
+
+        nonzero = counts > 0
+        tau, fraction = _maximize_likelihood(
+                times[nonzero], counts[nonzero], length, self._tau,
+                self._fraction, self.background)
+
+        self._tau = tau
+        self._fraction = fraction
+
+        covariance = _covariance(times, resolution, length, tau, fraction,
+                                 total, self.background)
+
+        self._estimate = LifetimeFit(tau, np.sqrt(max(covariance[0, 0], 0.)),
+                                     fraction, int(total))
+        return self._estimate
+
+
+def read_decay_times(filenames, marker="Decay"):
+    """
+    Read the decay times from decay files written by muonic.
+
+    :param filenames: decay files
+    :type filenames: str or list of str
+    :param marker: kind of decays read, 'Decay' for the decays found
+                   within the trigger windows, 'StreamDecay' for the
+                   decays found across trigger windows
+    :type marker: str
+    :returns: numpy.ndarray -- decay times in microseconds
+    """
+    marker = " %s " % marker
+
+    if isinstance(filenames, str):
+        filenames = [filenames]
+
+    decay_times = []
+
+    for filename in filenames:
+        with open(filename) as decay_file:
+            decay_times.extend(float(line.rsplit(None, 1)[-1])
+                               for line in decay_file
+                               if marker in line and
+                               not line.startswith("#"))
+
+    return np.array(decay_times, dtype=float)
+
+
+def fit_lifetime(decay_times, fit_range=(0.5, 10.), window_end=None,
+                 background=True, min_decays=10):
+    """
+    Unbinned maximum likelihood fit of the lifetime. The fit is started
+    from the binned estimate of a fine grained histogram and refined on
+    the decay times, so it takes a few passes over the data only.
+
+    Raises ValueError if the fit range is empty.
+
+    :param decay_times: decay times
+    :type decay_times: numpy.ndarray
+    :param fit_range: lower and upper limit of the decay times used
+    :type fit_range: tuple of floats
+    :param window_end: end of the trigger window, decay times beyond
+                       can not be recorded
+    :type window_end: float
+    :param background: fit a flat background
+    :type background: bool
+    :param min_decays: minimum number of decays in the fit range
+    :type min_decays: int
+    :returns: LifetimeFit or None -- None if there are not enough decays
+    :raises: ValueError
+    """
+    low, high = fit_range
+
+    if window_end is not None:
+        high = min(high, window_end)
+
+    if high <= low:
+        raise ValueError("fit range is empty")
+
+    decay_times = np.asarray(decay_times, dtype=float)
+    times = decay_times[(decay_times >= low) & (decay_times < high)] - low
+    length = high - low
+
+    if len(times) < min_decays:
+        return None
+
+    # starting point from the histogram
+    bins = min(max(len(times) // 10, 10), 10000)
+    counts, edges = np.histogram(times, bins, (0., length))
+    centers = 0.5 * (edges[:-1] + edges[1:])
+    nonzero = counts > 0
+    tau, fraction = _maximize_likelihood(centers[nonzero],
+                                         counts[nonzero].astype(float),
+                                         length, background=background)
+
+    tau, fraction = _maximize_likelihood(times, np.ones(len(times)), length,
+                                         tau, fraction, background)
+
+    step = length / INFORMATION_GRID_POINTS
+    grid = (np.arange(INFORMATION_GRID_POINTS) + 0.5) * step
+    covariance = _covariance(grid, step, length, tau, fraction, len(times),
+                             background)
+
+    return LifetimeFit(tau, np.sqrt(max(covariance[0, 0], 0.)), fraction,
+                       len(times))
+
+
+class UnbinnedFitWorker(threading.Thread):
+    """
+    Runs an unbinned lifetime fit in a background thread. Either decay
+    times or decay files have to be given. The result is stored in
+    'result', an exception raised by the fit in 'error'.
+
+    :param decay_times: decay times
+    :type decay_times: numpy.ndarray
+    :param filenames: decay files
+    :type filenames: str or list of str
+    :param callback: called with the worker when the fit is done, from the
+                     worker thread
+    :type callback: callable
+    :param kwargs: keyword arguments of fit_lifetime
+    :type kwargs: dict
+    :raises: ValueError
+    """
+
+    def __init__(self, decay_times=None, filenames=None, callback=None,
+                 **kwargs):
+        threading.Thread.__init__(self, name="UnbinnedFitWorker")
+        self.daemon = True
+
+        if decay_times is None and filenames is None:
+            raise ValueError("decay times or decay files are required")
+
+        self.decay_times = decay_times
+        self.filenames = filenames
+        self.callback = callback
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+
+    def run(self):
+        """
+        Read the decay times if needed and fit the lifetime.
+
+        :returns: None
+        """
+        try:
+            decay_times = self.decay_times
+
+            if decay_times is None:
+                decay_times = read_decay_times(self.filenames)
+
+            self.result = fit_lifetime(decay_times, **self.kwargs)
+        except Exception as e:
+            self.error = e
+
+        if self.callback is not None:
+            self.callback(self)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="Unbinned fit of the muon lifetime on decay files")
+    parser.add_argument("files", nargs="+", help="decay files")
+    parser.add_argument("-r", "--fit-range", nargs=2, type=float,
+                        default=(0.5, 10.), metavar=("LOW", "HIGH"),
+                        help="fit range in microseconds")
+    parser.add_argument("-w", "--window-end", type=float, default=None,
+                        help="end of the trigger window in microseconds")
+    parser.add_argument("--no-background", action="store_true",
+                        help="do not fit a flat background")
+    parser.add_argument("--stream", action="store_true",
+                        help="fit the decays found across trigger windows")
+    args = parser.parse_args()
+
+    fit_result = fit_lifetime(read_decay_times(
+                                      args.files, "StreamDecay"
+                                      if args.stream else "Decay"),
+                              fit_range=args.fit_range,
+                              window_end=args.window_end,
+                              background=not args.no_background)
+
+    if fit_result is None:
+        print("not enough decays in the fit range")
+    else:
+        print("lifetime: (%.4f +- %.4f) microseconds, " %
+              fit_result[:2] + "signal fraction %.3f, %d decays" %
+              fit_result[2:])
@@ -0,0 +1,320 @@
+"""
+Offline extraction of pulses from RAW files, spread across several processes.
+
+PulseExtractor carries the trigger counter rollover, the 1PPS bookkeeping and
+the calculated DAQ frequency from one line to the next, so a RAW file can not
+simply be cut into pieces. Instead the file is processed in three steps:
+
+1. the file is split into chunks which start at lines with trigger flag and
+   the counter fields of all chunks are read in parallel
+2. the counter bookkeeping of PulseExtractor is replayed over these counters
+   in the main process, which yields the extractor state at the start of
+   every chunk. This is cheap compared to the extraction itself.
+3. the chunks are extracted in parallel by extractors starting from these
+   states. The event which is still open at the end of a chunk is closed by
+   the first trigger of the next chunk, so it is taken from the chunk it was
+   recorded in.
+
+The result is the same as extracting the file line by line with a single
+PulseExtractor.
+"""
+from __future__ import print_function
+from argparse import ArgumentParser
+import array
+import io
+import logging
+import multiprocessing as mp
+import os
+import re
+
+from muonic.analysis.analyzer import PulseExtractor
+from muonic.analysis.decoding import TRIGGER_FLAGS
+
+__all__ = ["TRIGGER_LINE_PATTERN", "is_trigger_line", "extract_file",
+           "iter_extract_file"]
+
+# DAQ lines with trigger data, only these are passed to the extractor.
+# This covers everything PulseExtractor.extract parses, so no line can
+# fail halfway through the extraction.
+TRIGGER_LINE_PATTERN = re.compile(
+        r"^\s*[0-9A-Fa-f]{8}(\s+[0-9A-Fa-f]{2}){8}\s+[0-9A-Fa-f]{8}" +
+        r"\s+\d{6}\.\d+(\s+\S+){4}\s+[+-]?\d+\s*$")
+
+CHUNKS_PER_PROCESS = 4
+
+
+def is_trigger_line(line):
+    """
+    Returns True if the line contains trigger data, False otherwise.
+
+    :param line: line of a RAW file
+    :type line: str
+    :returns: bool
+    """
+    return TRIGGER_LINE_PATTERN.match(line) is not None
+
+
+def _iter_lines(raw_file, start):
+    """
+    Iterate over the lines of a file opened in binary mode which start at
+    or after byte offset 'start'.
+
+    :param raw_file: file object
+    :type raw_file: file
+    :param start: byte offset
+    :type start: int
+    :returns: generator of (int, str) -- offset and decoded line
+    """
+    if start > 0:
+        # skip the rest of the line the previous chunk is reading
+        raw_file.seek(start - 1)
+        raw_file.readline()
+    else:
+        raw_file.seek(0)
+
+    offset = raw_file.tell()
+
+    for line in raw_file:
+        yield offset, line.decode("ascii", "replace")
+        offset += len(line)
+
+
+def _scan_chunk(args):
+    """
+    Align a byte range of the RAW file to lines with trigger flag and
+    read the counter fields of all trigger lines of the aligned chunk.
+
+    The chunk starts at the first line with trigger flag at or after 'start'
+    (or at the beginning of the file) and ends before the first line with
+    trigger flag at or after 'end'.
+
+    :param args: filename, start and end offset of the byte range
+    :type args: tuple
+    :returns: dict
+    """
+    filename, start, end = args
+
+    trigger_counts = array.array("L")
+    one_pps = array.array("L")
+    triggers = array.array("b")
+    last_time = None
+
+    chunk_start = None
+    chunk_end = None
+
+    with io.open(filename, "rb") as raw_file:
+        for offset, line in _iter_lines(raw_file, start):
+            fields = line.split() if is_trigger_line(line) else None
+            trigger = fields is not None and TRIGGER_FLAGS[fields[1]]
+
+            if trigger and offset >= end:
+                chunk_end = offset
+                break
+
+            if chunk_start is None:
+                if start > 0 and not trigger:
+                    continue
+                chunk_start = offset
+
+            if fields is not None:
+                trigger_counts.append(int(fields[0], 16))
+                one_pps.append(int(fields[9], 16))
+                triggers.append(trigger)
+                last_time = fields[10]
+
+        if chunk_end is None:
+            raw_file.seek(0, os.SEEK_END)
+            chunk_end = raw_file.tell()
+
+    if chunk_start is None:
+        chunk_start = chunk_end
+
+    return {"start": chunk_start, "end": chunk_end,
+            "trigger_counts": trigger_counts, "one_pps": one_pps,
+            "triggers": triggers, "last_time": last_time}
+
+
+def _extract_chunk(args):
+    """
+    Extract the pulses of an aligned chunk of the RAW file.
+
+    :param args: filename, start and end offset of the chunk, counter state
+                 of the extractor at the start of the chunk, drop the event
+                 closed by the first trigger, close the event which is still
+                 open at the end of the chunk
+    :type args: tuple
+    :returns: list of tuples
+    """
+    filename, start, end, state, drop_first, close_last = args
+
+    extractor = PulseExtractor(logging.getLogger(), os.devnull)
+    extractor.set_counter_state(state)
+
+    events = []
+
+    with io.open(filename, "rb") as raw_file:
+        for offset, line in _iter_lines(raw_file, start):
+            if offset >= end:
+                break
+            if not is_trigger_line(line):
+                continue
+
+            pulses = extractor.extract(line)
+
+            if pulses is not None:
+                events.append(pulses)
+
+    # the first trigger closes the last event of the previous chunk
+    if drop_first and events:
+        events.pop(0)
+
+    if close_last:
+        events.append(extractor._close_event())
+
+    return events
+
+
+def _iter_extract_sequential(filename, logger):
+    """
+    Extract all pulses of a RAW file line by line.
+
+    :param filename: RAW file
+    :type filename: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    :returns: generator of tuples
+    """
+    extractor = PulseExtractor(logger, os.devnull)
+
+    with io.open(filename, "rb") as raw_file:
+        for offset, line in _iter_lines(raw_file, 0):
+            if not is_trigger_line(line):
+                continue
+
+            pulses = extractor.extract(line)
+
+            if pulses is not None:
+                yield pulses
+
+
+def iter_extract_file(filename, processes=None,
+                      chunks_per_process=CHUNKS_PER_PROCESS, logger=None):
+    """
+    Extract all pulses of a RAW file. Lines without trigger data are
+    skipped. The events are yielded in file order, one chunk at a time.
+
+    :param filename: RAW file
+    :type filename: str
+    :param processes: number of worker processes, defaults to the number of
+                      cores, 1 extracts the file in the calling process
+    :type processes: int
+    :param chunks_per_process: number of chunks per worker process
+    :type chunks_per_process: int
+    :param logger: logger object
+    :type logger: logging.Logger
+    :returns: generator of tuples -- pulses in the format of
+              PulseExtractor.extract
+    """
+    if logger is None:
+        logger = logging.getLogger()
+
+    if processes is None:
+        processes = mp.cpu_count()
+
+    size = os.path.getsize(filename)
+    n_chunks = max(1, min(processes * chunks_per_process, size // 4096))
+
+    if processes <= 1 or n_chunks == 1:
+        for pulses in _iter_extract_sequential(filename, logger):
+            yield pulses
+        return
+
+    bounds = [size * i // n_chunks for i in range(n_chunks + 1)]
+
+    pool = mp.Pool(processes)
+
+    try:
+        chunks = pool.map(_scan_chunk, [(filename, bounds[i], bounds[i + 1])
+                                        for i in range(n_chunks)])
+
+        # replay the counter bookkeeping to get the state at every chunk
+        extractor = PulseExtractor(logger, os.devnull)
+        states = []
+
+        for chunk in chunks:
+            states.append(extractor.get_counter_state())
+
+            for trigger_count, one_pps, trigger in zip(
+                    chunk["trigger_counts"], chunk["one_pps"],
+                    chunk["triggers"]):
+                extractor._update_counters(trigger_count, one_pps, None,
+                                           trigger)
+
+            if chunk["last_time"] is not None:
+                extractor.last_time = chunk["last_time"]
+
+        # only close the last event of a chunk if a later chunk
+        # has a trigger which would close it
+        non_empty = [i for i, chunk in enumerate(chunks)
+                     if chunk["start"] < chunk["end"]]
+
+        tasks = [(filename, chunks[i]["start"], chunks[i]["end"], states[i],
+                  i > 0, i != non_empty[-1]) for i in non_empty]
+
+        logger.debug("Extracting %d chunks of %s with %d processes" %
+                     (len(tasks), filename, processes))
+
+        for events in pool.imap(_extract_chunk, tasks):
+            for pulses in events:
+                yield pulses
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def extract_file(filename, processes=None,
+                 chunks_per_process=CHUNKS_PER_PROCESS, logger=None):
+    """
+    Extract all pulses of a RAW file, see iter_extract_file.
+
+    :param filename: RAW file
+    :type filename: str
+    :param processes: number of worker processes, defaults to the number of
+                      cores, 1 extracts the file in the calling process
+    :type processes: int
+    :param chunks_per_process: number of chunks per worker process
+    :type chunks_per_process: int
+    :param logger: logger object
+    :type logger: logging.Logger
+    :returns: list of tuples -- pulses in the format of
+              PulseExtractor.extract
+    """
+    return list(iter_extract_file(filename, processes, chunks_per_process,
+                                  logger))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Extract the pulses of a RAW file " +
+                                        "and write them in the format of " +
+                                        "the pulse (P) files.")
+    parser.add_argument("raw_file", help="RAW file written by muonic")
+    parser.add_argument("-o", "--output", dest="output", default=None,
+                        help="pulse file to write, defaults to stdout")
+    parser.add_argument("-j", "--processes", dest="processes", type=int,
+                        default=None,
+                        help="number of processes, defaults to the " +
+                             "number of cores")
+
+    args = parser.parse_args()
+
+    if args.output is not None:
+        out = open(args.output, "w")
+    else:
+        out = None
+
+    try:
+        for pulses in iter_extract_file(args.raw_file, args.processes):
+            print(repr(pulses), file=out)
+    finally:
+        if out is not None:
+            out.close()
@@ -0,0 +1,410 @@
+"""
+Analysis of the DAQ messages outside of the gui thread.
+
+The AnalysisThread reads the messages from the DAQ and passes them to an
+AnalysisPipeline, which owns the pulse extractor, runs the registered
+analyses on the extracted events and feeds the file sinks. The gui only
+gets the aggregated results: as soon as the DAQ has no more data, but at
+least every publish interval during bursts, the thread hands a batch with
+the messages for the DAQ log, the control messages like thresholds and
+scalars, the results of the analyses since the last batch and the last
+event to a callback. A WakeupPipe lets an event loop wait for the batches.
+
+Nothing in here depends on Qt, so the same pipeline can run without a gui.
+"""
+from __future__ import print_function
+from collections import deque, namedtuple
+import datetime
+import os
+import threading
+import time
+
+from muonic.daq import DAQIOError
+from muonic.util import get_setting
+
+__all__ = ["AnalysisBatch", "AnalysisPipeline", "AnalysisThread",
+           "RawFileSink", "DecayFileSink", "StreamDecayFileSink",
+           "VelocityFileSink", "WakeupPipe", "is_trigger_line"]
+
+# messages of the DAQ log kept per batch
+LOG_LENGTH = 500
+
+# events kept per batch for the oscilloscope
+EVENT_HISTORY = 100
+
+# messages for the log, control messages, lists of results keyed by
+# analysis name, pulses of the last event, pulses of the latest events
+# (oldest first) and the number of messages and events processed since
+# the last batch
+AnalysisBatch = namedtuple("AnalysisBatch", ["log", "messages", "results",
+                                             "last_event", "events",
+                                             "message_count",
+                                             "event_count"])
+
+
+def is_trigger_line(msg):
+    """
+    Returns True if the DAQ message contains trigger data, False if it is
+    a control message, e.g. a status report or the answer to a command.
+
+    :param msg: DAQ message
+    :type msg: str
+    :returns: bool
+    """
+    fields = msg.split()
+    return len(fields) == 16 and len(fields[0]) == 8
+
+
+def _timestamp():
+    """
+    Current time as written to the data files.
+
+    :returns: str
+    """
+    return datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+class RawFileSink(object):
+    """
+    Writes the DAQ messages to the "RAW" file. Status messages are only
+    written if the 'write_daq_status' setting is enabled.
+
+    :param data_file: raw file, nothing is written while it is closed
+    :type data_file: muonic.util.helpers.LockedFile
+    """
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+
+    def __call__(self, msg):
+        if self.data_file.closed:
+            return
+
+        if not get_setting("write_daq_status"):
+            # only write lines containing trigger data
+            fields = msg.rstrip("\n").split(" ")
+            if not (len(fields) == 16 and len(fields[0]) == 8):
+                return
+
+        self.data_file.write(str(msg) + "\n")
+
+
+class DecayFileSink(object):
+    """
+    Writes the decay times published by the decay analysis.
+
+    :param data_file: decay file, nothing is written while it is closed
+    :type data_file: muonic.util.helpers.LockedFile
+    :param marker: word marking the decay lines
+    :type marker: str
+    """
+
+    def __init__(self, data_file, marker="Decay"):
+        self.data_file = data_file
+        self.marker = marker
+
+    def __call__(self, decay):
+        self.data_file.write("%s %s %s\n" % (repr(_timestamp()), self.marker,
+                                             repr(decay / 1000.)))
+
+
+class StreamDecayFileSink(DecayFileSink):
+    """
+    Writes the decay times published by the streaming decay analysis.
+    They are marked as 'StreamDecay', so that readers of the decays found
+    within the trigger windows do not count them twice.
+
+    :param data_file: decay file, nothing is written while it is closed
+    :type data_file: muonic.util.helpers.LockedFile
+    """
+
+    def __init__(self, data_file):
+        DecayFileSink.__init__(self, data_file, "StreamDecay")
+
+    def __call__(self, decays):
+        for decay in decays:
+            DecayFileSink.__call__(self, decay)
+
+
+class VelocityFileSink(object):
+    """
+    Writes the flight times published by the velocity analysis.
+
+    :param data_file: velocity file, nothing is written while it is closed
+    :type data_file: muonic.util.helpers.LockedFile
+    """
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+
+    def __call__(self, flight_time):
+        if flight_time > 0:
+            self.data_file.write("%s Flight time %s\n" % (_timestamp(),
+                                                          repr(flight_time)))
+
+
+class AnalysisPipeline(object):
+    """
+    Processes DAQ messages: feeds the message sinks, extracts the pulses of
+    the trigger lines and runs the registered analyses on them. The
+    results of the published analyses and the control messages are
+    collected until they are taken with take_batch.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param pulse_extractor: pulse extractor object
+    :type pulse_extractor: muonic.analysis.analyzer.PulseExtractor
+    :param registry: analyses run on the extracted pulses
+    :type registry: muonic.analysis.registry.AnalysisRegistry
+    """
+
+    def __init__(self, logger, pulse_extractor, registry):
+        self.logger = logger
+        self.pulse_extractor = pulse_extractor
+        self.registry = registry
+
+        self.message_sinks = []
+        self._published = set()
+
+        # the setting does not change while running
+        self.write_pulses = get_setting("write_pulses")
+        self._lock = threading.Lock()
+
+        self._log = deque(maxlen=LOG_LENGTH)
+        self._messages = []
+        self._results = dict()
+        self._last_event = None
+        self._events = deque(maxlen=EVENT_HISTORY)
+        self._message_count = 0
+        self._event_count = 0
+
+    def add_message_sink(self, sink):
+        """
+        Add a function which gets called with every DAQ message.
+
+        :param sink: function taking the message
+        :type sink: callable
+        :returns: None
+        """
+        if sink not in self.message_sinks:
+            self.message_sinks.append(sink)
+
+    def publish(self, name):
+        """
+        Collect the results of an analysis for the batches.
+
+        :param name: analysis name
+        :type name: str
+        :returns: None
+        """
+        with self._lock:
+            if name not in self._published:
+                self._published.add(name)
+                self.registry.subscribe(name, self._results_collector(name))
+
+    def _results_collector(self, name):
+        """
+        Get a registry subscriber collecting the results of an analysis.
+
+        :param name: analysis name
+        :type name: str
+        :returns: callable
+        """
+        return lambda result: self._results.setdefault(name, []).append(
+                result)
+
+    def process(self, msg):
+        """
+        Process a DAQ message.
+
+        :param msg: DAQ message
+        :type msg: str
+        :returns: None
+        """
+        for sink in self.message_sinks:
+            sink(msg)
+
+        with self._lock:
+            self._message_count += 1
+            self._log.append(msg)
+
+            if not is_trigger_line(msg):
+                self._messages.append(msg)
+                return
+
+            if not (self.write_pulses or self.registry.active()):
+                return
+
+            try:
+                pulses = self.pulse_extractor.extract(msg)
+            except (ValueError, KeyError, IndexError):
+                self.logger.debug("Unable to extract pulses from '%s'" % msg)
+                return
+
+            if pulses is None:
+                return
+
+            self._event_count += 1
+            self._last_event = pulses
+            self._events.append(pulses)
+            self.registry.process(pulses,
+                                  self.pulse_extractor.last_event_time)
+
+    def take_batch(self):
+        """
+        Get everything collected since the last batch.
+
+        :returns: AnalysisBatch
+        """
+        with self._lock:
+            batch = AnalysisBatch(list(self._log), self._messages,
+                                  self._results, self._last_event,
+                                  list(self._events), self._message_count,
+                                  self._event_count)
+            self._log.clear()
+            self._events.clear()
+            self._messages = []
+            self._results = dict()
+            self._message_count = 0
+            self._event_count = 0
+        return batch
+
+
+class WakeupPipe(object):
+    """
+    Wakes up an event loop from another thread. The read end of the pipe
+    is readable while a notification is pending and can be watched, e.g.
+    by a QSocketNotifier or select. Notifications are coalesced until
+    they are cleared, so the pipe never fills up.
+    """
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        self._pending = False
+        self._lock = threading.Lock()
+
+    def fileno(self):
+        """
+        Get the file descriptor to watch.
+
+        :returns: int
+        """
+        return self._read_fd
+
+    def notify(self):
+        """
+        Make the pipe readable.
+
+        :returns: None
+        """
+        with self._lock:
+            if not self._pending:
+                self._pending = True
+                os.write(self._write_fd, b"\0")
+
+    def clear(self):
+        """
+        Take the pending notification, the pipe is no longer readable.
+
+        :returns: None
+        """
+        with self._lock:
+            if self._pending:
+                self._pending = False
+                os.read(self._read_fd, 1)
+
+    def close(self):
+        """
+        Close the pipe.
+
+        :returns: None
+        """
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class AnalysisThread(threading.Thread):
+    """
+    Reads the DAQ messages, passes them to the pipeline and hands a batch
+    to the callback as soon as no more data is available, but at least
+    every publish interval while data keeps coming in.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param daq: daq card connection
+    :type daq: muonic.daq.provider.BaseDAQProvider
+    :param pipeline: pipeline processing the messages
+    :type pipeline: AnalysisPipeline
+    :param callback: function taking the batches, called from this thread
+    :type callback: callable
+    :param publish_interval: longest time between two batches while data
+                             keeps coming in, in seconds
+    :type publish_interval: float
+    """
+    # time to wait if no data is available in seconds
+    IDLE_WAIT = 0.05
+
+    def __init__(self, logger, daq, pipeline, callback,
+                 publish_interval=0.2):
+        threading.Thread.__init__(self, name="AnalysisThread")
+        self.daemon = True
+        self.logger = logger
+        self.daq = daq
+        self.pipeline = pipeline
+        self.callback = callback
+        self.publish_interval = publish_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """
+        Process DAQ messages until stopped.
+
+        :returns: None
+        """
+        next_publish = time.time() + self.publish_interval
+
+        while not self._stop_event.is_set():
+            if not self.daq.data_available():
+                # publish what we have right away, then wait for data
+                self._publish()
+                next_publish = time.time() + self.publish_interval
+                self._stop_event.wait(self.IDLE_WAIT)
+                continue
+
+            try:
+                msg = self.daq.get(0)
+            except DAQIOError:
+                msg = None
+
+            if msg is not None:
+                try:
+                    self.pipeline.process(msg)
+                except Exception:
+                    self.logger.exception("Error processing DAQ " +
+                                          "message '%s'" % msg)
+
+            if time.time() >= next_publish:
+                self._publish()
+                next_publish = time.time() + self.publish_interval
+
+    def _publish(self):
+        """
+        Hand the batch to the callback if anything was processed.
+
+        :returns: None
+        """
+        batch = self.pipeline.take_batch()
+
+        if batch.message_count:
+            self.callback(batch)
+
+    def stop(self):
+        """
+        Stop processing and wait for the thread to finish.
+
+        :returns: None
+        """
+        self._stop_event.set()
+
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,340 @@
+"""
+Streaming quantile sketches with bounded memory.
+
+QuantileSketch follows the KLL sketch (Karnin, Lang and Liberty, "Optimal
+Quantile Approximation in Streams", 2016). The values are kept in a stack
+of compactors. A value in compactor h stands for 2**h values of the stream.
+If a compactor gets full, its values are sorted and every other value,
+starting at a random offset, is moved to the next compactor, the rest is
+dropped. The capacities shrink geometrically towards the lower compactors,
+so the sketch keeps O(k) values however many values were added, and the
+rank of a quantile is off by about 1.7 / k of the count.
+
+Sketches with the same k can be merged, e.g. the sketches of several runs,
+and stored in numpy files.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+__all__ = ["QuantileSketch"]
+
+# capacity ratio of neighbouring compactors
+CAPACITY_RATIO = 2. / 3.
+
+# smallest capacity of a compactor
+MIN_CAPACITY = 2
+
+
+class QuantileSketch(object):
+    """
+    Approximate quantiles of a stream of values.
+
+    Raises ValueError if k is too small.
+
+    :param k: capacity of the top compactor, controls the accuracy
+    :type k: int
+    :param seed: random seed of the compactions
+    :type seed: int
+    :raises: ValueError
+    """
+
+    def __init__(self, k=200, seed=None):
+        if k < MIN_CAPACITY:
+            raise ValueError("k has to be at least %d" % MIN_CAPACITY)
+
+        self.k = int(k)
+        self.random_state = np.random.RandomState(seed)
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        """
+        Remove all values.
+
+        :returns: None
+        """
+        self.count = 0
+        self.minimum = np.nan
+        self.maximum = np.nan
+        self.compactors = [np.empty(0)]
+        self._retained = 0
+        self._total_capacity = self._capacity(0)
+        self._sorted = None
+
+    def _capacity(self, height):
+        """
+        Capacity of the compactor at the given height.
+
+        :param height: index of the compactor
+        :type height: int
+        :returns: int
+        """
+        depth = len(self.compactors) - height - 1
+        return max(MIN_CAPACITY,
+                   int(np.ceil(self.k * CAPACITY_RATIO ** depth)))
+
+    def _compress(self):
+        """
+        Compact full compactors until the sketch is within its capacity.
+
+        :returns: None
+        """
+        while self._retained > self._total_capacity:
+            for height, values in enumerate(self.compactors):
+                if len(values) < self._capacity(height):
+                    continue
+
+                if height + 1 == len(self.compactors):
+                    self._add_compactor()
+
+                values = np.sort(values)
+
+                # an odd value stays in this compactor
+                kept = values[:len(values) % 2]
+                promoted = values[len(kept) + self.random_state.randint(2)::2]
+
+                self.compactors[height] = kept
+                self.compactors[height + 1] = np.concatenate(
+                        (self.compactors[height + 1], promoted))
+                self._retained -= len(values) - len(kept) - len(promoted)
+                break
+
+    def _add_compactor(self):
+        """
+        Add a compactor on top, which lowers the capacities of the others.
+
+        :returns: None
+        """
+        self.compactors.append(np.empty(0))
+        self._total_capacity = sum(self._capacity(height)
+                                   for height in range(len(self.compactors)))
+
+    def update(self, value):
+        """
+        Add a value.
+
+        :param value: the value
+        :type value: float
+        :returns: None
+        """
+        self.extend((value,))
+
+    def extend(self, values):
+        """
+        Add values.
+
+        :param values: the values
+        :type values: iterable of floats
+        :returns: None
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+
+        if not len(values):
+            return
+
+        self.count += len(values)
+        self.minimum = np.fmin(self.minimum, values.min())
+        self.maximum = np.fmax(self.maximum, values.max())
+        self.compactors[0] = np.concatenate((self.compactors[0], values))
+        self._retained += len(values)
+        self._sorted = None
+        self._compress()
+
+    def merge(self, other):
+        """
+        Add the values summarized by another sketch.
+
+        Raises ValueError if the sketches have a different k.
+
+        :param other: the other sketch
+        :type other: QuantileSketch
+        :returns: None
+        :raises: ValueError
+        """
+        if other.k != self.k:
+            raise ValueError("can not merge sketches with k=%d and k=%d" %
+                             (self.k, other.k))
+
+        if not other.count:
+            return
+
+        while len(self.compactors) < len(other.compactors):
+            self._add_compactor()
+
+        for height, values in enumerate(other.compactors):
+            self.compactors[height] = np.concatenate(
+                    (self.compactors[height], values))
+            self._retained += len(values)
+
+        self.count += other.count
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        self._sorted = None
+        self._compress()
+
+    def _get_sorted(self):
+        """
+        Retained values in ascending order and their cumulative weights,
+        cached until the next change.
+
+        :returns: tuple of numpy.ndarray
+        """
+        if self._sorted is None:
+            values = np.concatenate(self.compactors)
+            weights = np.concatenate([np.full(len(compactor), 2. ** height)
+                                      for height, compactor
+                                      in enumerate(self.compactors)])
+            order = np.argsort(values, kind="mergesort")
+            self._sorted = values[order], np.cumsum(weights[order])
+        return self._sorted
+
+    def quantiles(self, fractions):
+        """
+        Get approximate quantiles. Quantile 0 and 1 are the exact minimum
+        and maximum.
+
+        :param fractions: fractions between 0 and 1
+        :type fractions: sequence of floats
+        :returns: numpy.ndarray -- nan if the sketch is empty
+        """
+        fractions = np.asarray(fractions, dtype=float)
+
+        if not self.count:
+            return np.full(fractions.shape, np.nan)
+
+        values, cumulative = self._get_sorted()
+        indices = np.searchsorted(cumulative, fractions * cumulative[-1])
+        result = values[np.clip(indices, 0, len(values) - 1)]
+
+        result[fractions <= 0] = self.minimum
+        result[fractions >= 1] = self.maximum
+        return result
+
+    def quantile(self, fraction):
+        """
+        Get an approximate quantile.
+
+        :param fraction: fraction between 0 and 1
+        :type fraction: float
+        :returns: float
+        """
+        return float(self.quantiles((fraction,))[0])
+
+    def rank(self, value):
+        """
+        Get the approximate fraction of values not above the given value.
+
+        :param value: the value
+        :type value: float
+        :returns: float
+        """
+        if not self.count:
+            return np.nan
+
+        values, cumulative = self._get_sorted()
+        index = np.searchsorted(values, value, side="right")
+
+        if not index:
+            return 0.
+        return float(cumulative[index - 1] / cumulative[-1])
+
+    @property
+    def median(self):
+        """
+        Approximate median.
+
+        :returns: float
+        """
+        return self.quantile(0.5)
+
+    def summary(self):
+        """
+        Get count, minimum, 5% quantile, median, 95% quantile and maximum.
+
+        :returns: dict
+        """
+        p5, median, p95 = self.quantiles((0.05, 0.5, 0.95))
+        return {"count": self.count, "min": float(self.minimum),
+                "p5": float(p5), "median": float(median), "p95": float(p95),
+                "max": float(self.maximum)}
+
+    def to_arrays(self):
+        """
+        Get the state of the sketch as numpy arrays.
+
+        :returns: dict
+        """
+        arrays = dict(("compactor%d" % height, values)
+                      for height, values in enumerate(self.compactors))
+        arrays["header"] = np.array([self.k, self.count, self.minimum,
+                                     self.maximum, len(self.compactors)])
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, seed=None):
+        """
+        Create a sketch from the arrays returned by to_arrays.
+
+        :param arrays: state of the sketch
+        :type arrays: dict
+        :param seed: random seed of the compactions
+        :type seed: int
+        :returns: QuantileSketch
+        """
+        k, count, minimum, maximum, height = arrays["header"]
+        sketch = cls(int(k), seed)
+        sketch.count = int(count)
+        sketch.minimum = minimum
+        sketch.maximum = maximum
+        sketch.compactors = [np.asarray(arrays["compactor%d" % height],
+                                        dtype=float)
+                             for height in range(int(height))]
+        sketch._retained = sum(len(values) for values in sketch.compactors)
+        sketch._total_capacity = sum(
+                sketch._capacity(level)
+                for level in range(len(sketch.compactors)))
+        sketch._compress()
+        return sketch
+
+    @staticmethod
+    def save(filename, sketches):
+        """
+        Save sketches to a numpy file.
+
+        :param filename: the filename
+        :type filename: str
+        :param sketches: sketches keyed by name
+        :type sketches: dict
+        :returns: None
+        """
+        arrays = dict()
+
+        for name, sketch in sketches.items():
+            for key, values in sketch.to_arrays().items():
+                arrays["%s/%s" % (name, key)] = values
+
+        with open(filename, "wb") as sketch_file:
+            np.savez(sketch_file, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load sketches saved with save.
+
+        :param filename: the filename
+        :type filename: str
+        :returns: dict -- sketches keyed by name
+        """
+        states = dict()
+
+        with np.load(filename) as arrays:
+            for key in arrays.files:
+                name, array_key = key.rsplit("/", 1)
+                states.setdefault(name, dict())[array_key] = arrays[key]
+
+        return dict((name, cls.from_arrays(state))
+                    for name, state in states.items())
@@ -0,0 +1,452 @@
+"""
+Multi-resolution archive of the channel and trigger rates.
+
+The rates are stored like in a round robin database: every level of the
+archive is a fixed size array on disk which is overwritten in a circle, so
+the archive does not grow during long runs. The raw level keeps every
+measured rate, the other levels consolidate the rates into slots of one
+minute, ten minutes and one hour. For every slot the minimum, the mean
+weighted with the measurement time, and the maximum rate of the four
+channels and the trigger are kept.
+
+Adding a rate takes constant time. Fetching a time range picks the finest
+level which covers the range with not more than the requested number of
+points, so the whole run can be shown at once and zooming in shows the
+finer levels.
+
+The levels are numpy files in the archive directory which are accessed
+as memory maps. Times are unix timestamps in seconds.
+"""
+from __future__ import print_function
+from collections import namedtuple
+import argparse
+import calendar
+import datetime
+import os
+
+import numpy as np
+
+__all__ = ["RateSeries", "RateArchive", "read_rate_file"]
+
+# number of rates per entry, four channels and the trigger
+RATES = 5
+
+# name, slot length in seconds (0 keeps every entry) and number of
+# entries of the levels: a week of raw rates measured every 5 seconds,
+# a week of minutes, a month of ten minutes and a year of hours
+DEFAULT_LEVELS = (("raw", 0, 120960),
+                  ("1min", 60, 10080),
+                  ("10min", 600, 4464),
+                  ("1h", 3600, 8784))
+
+# column layout of the level arrays
+TIME = 0
+DURATION = 1
+MINIMUM = slice(2, 2 + RATES)
+MEAN = slice(2 + RATES, 2 + 2 * RATES)
+MAXIMUM = slice(2 + 2 * RATES, 2 + 3 * RATES)
+COLUMNS = 2 + 3 * RATES
+
+# times, measurement times, minimum, mean and maximum rates of a time range
+# and the slot length of the level they were taken from
+RateSeries = namedtuple("RateSeries", ["times", "durations", "minimum",
+                                       "mean", "maximum", "step"])
+
+
+class _ArchiveLevel(object):
+    """
+    One level of the archive, a ring of consolidated entries on disk.
+
+    Raises ValueError if an existing file does not match the level.
+
+    :param filename: file of the level
+    :type filename: str
+    :param step: slot length in seconds, 0 keeps every entry
+    :type step: float
+    :param size: number of entries
+    :type size: int
+    :raises: ValueError
+    """
+
+    def __init__(self, filename, step, size):
+        self.filename = filename
+        self.step = step
+        self.size = size
+
+        if os.path.exists(filename):
+            self.data = np.lib.format.open_memmap(filename, mode="r+")
+
+            if self.data.shape != (size, COLUMNS):
+                raise ValueError("archive file '%s' has shape %s instead " %
+                                 (filename, self.data.shape) +
+                                 "of %s" % ((size, COLUMNS),))
+
+            # unused entries have no time, the newest entry is the one
+            # with the largest time
+            times = self.data[:, TIME]
+            self.length = int(np.count_nonzero(~np.isnan(times)))
+            self.index = 0
+
+            if self.length:
+                self.index = (int(np.nanargmax(times)) + 1) % size
+        else:
+            self.data = np.lib.format.open_memmap(filename, mode="w+",
+                                                  dtype=np.float64,
+                                                  shape=(size, COLUMNS))
+            self.data[:] = np.nan
+            self.length = 0
+            self.index = 0
+
+        self._pending = None
+
+    def add(self, time, duration, rates):
+        """
+        Add measured rates.
+
+        :param time: end of the measurement
+        :type time: float
+        :param duration: measurement time in seconds
+        :type duration: float
+        :param rates: rates of the channels and the trigger
+        :type rates: numpy.ndarray
+        :returns: None
+        """
+        if not self.step:
+            self._write(time, duration, rates, rates * duration, rates)
+            return
+
+        start = np.floor(time / self.step) * self.step
+
+        if self._pending is not None and self._pending[0] != start:
+            self._write(*self._pending)
+            self._pending = None
+
+        if self._pending is None:
+            self._pending = [start, duration, rates.copy(),
+                             rates * duration, rates.copy()]
+        else:
+            pending = self._pending
+            pending[1] += duration
+            np.minimum(pending[2], rates, pending[2])
+            pending[3] += rates * duration
+            np.maximum(pending[4], rates, pending[4])
+
+    def _write(self, time, duration, minimum, counts, maximum):
+        """
+        Write an entry over the oldest one.
+
+        :returns: None
+        """
+        row = self.data[self.index]
+        row[TIME] = time
+        row[DURATION] = duration
+        row[MINIMUM] = minimum
+        row[MEAN] = counts / duration if duration > 0 else maximum
+        row[MAXIMUM] = maximum
+
+        self.index = (self.index + 1) % self.size
+        self.length = min(self.length + 1, self.size)
+
+    def _pending_row(self):
+        """
+        Get the slot which is still being filled as an entry.
+
+        :returns: numpy.ndarray or None
+        """
+        if self._pending is None:
+            return None
+
+        time, duration, minimum, counts, maximum = self._pending
+        row = np.empty(COLUMNS)
+        row[TIME] = time
+        row[DURATION] = duration
+        row[MINIMUM] = minimum
+        row[MEAN] = counts / duration if duration > 0 else maximum
+        row[MAXIMUM] = maximum
+        return row
+
+    def _segments(self):
+        """
+        Get the stored entries as up to two slices of the array,
+        oldest first.
+
+        :returns: list of numpy.ndarray
+        """
+        if self.length < self.size:
+            return [self.data[:self.length]]
+        return [self.data[self.index:], self.data[:self.index]]
+
+    def oldest(self):
+        """
+        Time of the oldest entry.
+
+        :returns: float or None
+        """
+        if self.length:
+            return float(self._segments()[0][0, TIME])
+        if self._pending is not None:
+            return self._pending[0]
+        return None
+
+    def newest(self):
+        """
+        Time of the newest entry.
+
+        :returns: float or None
+        """
+        if self._pending is not None:
+            return self._pending[0]
+        if self.length:
+            return float(self.data[self.index - 1, TIME])
+        return None
+
+    def covers(self, start):
+        """
+        Check if the level holds all entries since start, which is the
+        case if it did not overwrite entries yet.
+
+        :param start: earliest time
+        :type start: float
+        :returns: bool
+        """
+        if self.length < self.size:
+            return True
+        return self.oldest() <= start
+
+    def select(self, start, end):
+        """
+        Get the entries between start and end, oldest first. For
+        consolidated levels this includes the slot start is in.
+
+        :param start: earliest time
+        :type start: float
+        :param end: latest time
+        :type end: float
+        :returns: numpy.ndarray
+        """
+        parts = []
+
+        for segment in self._segments():
+            low, high = np.searchsorted(segment[:, TIME],
+                                        (start - self.step, end),
+                                        side="right")
+            parts.append(segment[low:high])
+
+        pending = self._pending_row()
+
+        if pending is not None and start - self.step < pending[TIME] <= end:
+            parts.append(pending[np.newaxis])
+
+        return np.concatenate(parts)
+
+    def count(self, start, end):
+        """
+        Number of entries between start and end.
+
+        :param start: earliest time
+        :type start: float
+        :param end: latest time
+        :type end: float
+        :returns: int
+        """
+        count = 0
+
+        for segment in self._segments():
+            low, high = np.searchsorted(segment[:, TIME],
+                                        (start - self.step, end),
+                                        side="right")
+            count += high - low
+        return int(count)
+
+    def flush(self):
+        """
+        Write the entries to disk.
+
+        :returns: None
+        """
+        self.data.flush()
+
+
+class RateArchive(object):
+    """
+    Archive of the rates in levels of different resolution.
+
+    Raises ValueError if existing files in the directory do not match the
+    levels.
+
+    :param directory: directory of the archive, created if needed
+    :type directory: str
+    :param levels: name, slot length in seconds and number of entries
+                   of the levels, finest first
+    :type levels: tuple of tuples
+    :raises: ValueError
+    """
+
+    def __init__(self, directory, levels=DEFAULT_LEVELS):
+        self.directory = directory
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.levels = [_ArchiveLevel(os.path.join(directory, name + ".npy"),
+                                     step, size)
+                       for name, step, size in levels]
+
+    def add(self, time, duration, rates):
+        """
+        Add the rates of the channels and the trigger to all levels.
+
+        :param time: end of the measurement as unix timestamp
+        :type time: float
+        :param duration: measurement time in seconds
+        :type duration: float
+        :param rates: rates of the four channels and the trigger
+        :type rates: list of floats
+        :returns: None
+        """
+        rates = np.asarray(rates[:RATES], dtype=np.float64)
+
+        for level in self.levels:
+            level.add(time, duration, rates)
+
+    def time_range(self):
+        """
+        Get the time of the oldest and the newest entry.
+
+        :returns: tuple of floats or None -- None if the archive is empty
+        """
+        oldest = [level.oldest() for level in self.levels]
+        oldest = [time for time in oldest if time is not None]
+
+        if not oldest:
+            return None
+
+        return (min(oldest),
+                max(level.newest() for level in self.levels
+                    if level.newest() is not None))
+
+    def fetch(self, start=None, end=None, max_points=2000):
+        """
+        Get the rates between start and end from the finest level which
+        holds the whole range with not more than max_points entries.
+        If there is none, the coarsest level is used.
+
+        :param start: earliest time, defaults to the oldest entry
+        :type start: float
+        :param end: latest time, defaults to the newest entry
+        :type end: float
+        :param max_points: maximum number of entries
+        :type max_points: int
+        :returns: RateSeries or None -- None if the archive is empty
+        """
+        time_range = self.time_range()
+
+        if time_range is None:
+            return None
+
+        if start is None:
+            start = time_range[0]
+        if end is None:
+            end = time_range[1]
+
+        selected = self.levels[-1]
+
+        for level in self.levels:
+            if level.covers(start) and level.count(start, end) <= max_points:
+                selected = level
+                break
+
+        rows = selected.select(start, end)
+        return RateSeries(rows[:, TIME], rows[:, DURATION],
+                          rows[:, MINIMUM], rows[:, MEAN], rows[:, MAXIMUM],
+                          selected.step)
+
+    def flush(self):
+        """
+        Write all levels to disk, the slots still being filled are not
+        written.
+
+        :returns: None
+        """
+        for level in self.levels:
+            level.flush()
+
+    def close(self):
+        """
+        Write the consolidated slots still being filled and all
+        levels to disk.
+
+        :returns: None
+        """
+        for level in self.levels:
+            if level._pending is not None:
+                level._write(*level._pending)
+                level._pending = None
+        self.flush()
+
+
+def read_rate_file(filename):
+    """
+    Read the rates from a rate file written by muonic.
+
+    :param filename: rate file
+    :type filename: str
+    :returns: tuple of numpy.ndarray -- unix timestamps, measurement
+              times and rates of the channels and the trigger
+    """
+    times = []
+    durations = []
+    rates = []
+
+    with open(filename) as rate_file:
+        for line in rate_file:
+            fields = line.split()
+
+            if len(fields) != 13 or line.startswith("#"):
+                continue
+
+            try:
+                utcdt = datetime.datetime.strptime(" ".join(fields[:2]),
+                                                   "%Y-%m-%d %H:%M:%S.%f")
+                values = [float(field) for field in fields[2:]]
+            except ValueError:
+                continue
+
+            times.append(calendar.timegm(utcdt.timetuple()) +
+                         utcdt.microsecond * 1e-6)
+            rates.append(values[:RATES])
+            durations.append(values[-1])
+
+    return (np.array(times), np.array(durations),
+            np.array(rates).reshape(-1, RATES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="Add rate files to a rate archive and show the " +
+                        "consolidated rates")
+    parser.add_argument("archive", help="archive directory")
+    parser.add_argument("files", nargs="*", help="rate files")
+    parser.add_argument("-n", "--max-points", type=int, default=50,
+                        help="maximum number of entries shown")
+    args = parser.parse_args()
+
+    archive = RateArchive(args.archive)
+
+    for rate_filename in args.files:
+        for entry in zip(*read_rate_file(rate_filename)):
+            archive.add(*entry)
+
+    archive.close()
+
+    series = archive.fetch(max_points=args.max_points)
+
+    if series is None:
+        print("the archive is empty")
+    else:
+        print("%d entries of %d seconds" % (len(series.times), series.step))
+
+        for i, time in enumerate(series.times):
+            print(datetime.datetime.utcfromtimestamp(time).strftime(
+                    "%Y-%m-%d %H:%M:%S") + " " +
+                  " ".join("%.2f" % rate for rate in series.mean[i]))
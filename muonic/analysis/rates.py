@@ -0,0 +1,254 @@
+"""
+Rates of the channels and the trigger from the scalars of the DAQ card.
+
+The scalars are queried with the 'DS' command every time window. The
+RateRecorder turns the differences of the scalars between two queries
+into rates and writes them to the rate file ("R" file), one line per time
+window with the rates, the counts and the length of the time window.
+"""
+from __future__ import print_function
+import datetime
+import os
+import time
+
+from muonic.util import WrappedFile, get_setting
+from muonic.util import rename_muonic_file, get_hours_from_duration
+
+__all__ = ["RateRecorder"]
+
+
+class RateRecorder(object):
+    """
+    Calculates the rates from the scalar messages of the DAQ and writes
+    them to the rate file while a measurement is running.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param filename: filename of the rate file
+    :type filename: str
+    """
+    # number of scalars, channel 0 to 3 and the trigger
+    SCALAR_BUF_SIZE = 5
+
+    COINCIDENCES = ["Single", "Twofold", "Threefold", "Fourfold"]
+
+    def __init__(self, logger, filename):
+        self.logger = logger
+        self.data_file = WrappedFile(filename)
+        self.active = False
+
+        # measurement start and duration
+        self.measurement_duration = datetime.timedelta()
+        self.start_time = datetime.datetime.utcnow()
+
+        # define the begin of the time interval for the rate calculation
+        self.last_query_time = 0
+        self.query_time = time.time()
+
+        self.previous_scalars = self.new_scalar_buffer()
+
+        # we will write the column headers of the data into
+        # data_file in the first run
+        self.first_run = True
+
+        # are we in first cycle after the measurement was started?
+        self.first_cycle = False
+
+    def new_scalar_buffer(self):
+        """
+        Return new zeroed list of self.SCALAR_BUF_SIZE
+
+        :returns: list of int
+        """
+        return [0] * self.SCALAR_BUF_SIZE
+
+    def query_scalars(self, daq_put):
+        """
+        Query the DAQ for the scalars, this ends the current time window.
+
+        :param daq_put: function sending a message to the DAQ
+        :type daq_put: callable
+        :returns: None
+        """
+        self.last_query_time = self.query_time
+        daq_put("DS")
+        self.query_time = time.time()
+
+    def extract_scalars(self, msg):
+        """
+        Extracts the scalar values for channel 0-3 and
+        the trigger channel from daq message
+
+        :param msg: DAQ message
+        :type: str
+        :return: list of ints
+        """
+        scalars = self.new_scalar_buffer()
+
+        for item in msg.split():
+            for i in range(self.SCALAR_BUF_SIZE):
+                if item.startswith("S%d" % i) and len(item) == 11:
+                    scalars[i] = int(item[3:], 16)
+        return scalars
+
+    def calculate(self, msg):
+        """
+        Get the rates from the scalar message by dividing the observed
+        counts by the time window and write them to the rate file.
+
+        Returns None for the first scalars after the start, they only
+        begin the first time window.
+
+        :param msg: scalar message of the DAQ
+        :type msg: str
+        :returns: list or None -- rates of the channels and the trigger,
+                  the time window and the counts of the channels and the
+                  trigger
+        """
+        scalars = self.extract_scalars(msg)
+
+        # if this is the first time calculate is called, we want to set all
+        # counters to zero. This is the beginning of the first bin.
+        if self.first_cycle:
+            self.logger.debug("Buffering muon counts for the first bin " +
+                              "of the rate plot.")
+            self.previous_scalars = scalars
+            self.first_cycle = False
+            return None
+
+        # calculate differences and store current scalars for reuse
+        # in the next cycle
+        scalar_diffs = self.new_scalar_buffer()
+
+        for i in range(self.SCALAR_BUF_SIZE):
+            scalar_diffs[i] = scalars[i] - self.previous_scalars[i]
+            self.previous_scalars[i] = scalars[i]
+
+        time_window = self.query_time - self.last_query_time
+
+        # rates for scalars of channels and trigger, current time window
+        # and scalars for channels and trigger
+        rates = [(_scalar / time_window) for _scalar in scalar_diffs]
+        rates += [time_window]
+        rates += scalar_diffs
+
+        # write the rates to data file. we have to catch IOErrors, can occur
+        # if program is exited
+        if self.active:
+            try:
+                utcdt = datetime.datetime.utcfromtimestamp(self.query_time)
+                self.data_file.write(
+                    "%s %f %f %f %f %f %f %f %f %f %f %f \n" %
+                    (utcdt.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+                     rates[0], rates[1], rates[2], rates[3], rates[4],
+                     scalar_diffs[0], scalar_diffs[1], scalar_diffs[2],
+                     scalar_diffs[3], scalar_diffs[4], time_window))
+                self.logger.debug("Rate plot data was written to %s" %
+                                  repr(self.data_file))
+            except ValueError:
+                self.logger.warning("ValueError, Rate plot data was not " +
+                                    "written to %s" % repr(self.data_file))
+        return rates
+
+    def write_settings(self):
+        """
+        Write the distances, thresholds, channel and coincidence settings
+        to the rate file.
+
+        :returns: None
+        """
+        self.data_file.write("#Settings: \n")
+        self.data_file.write("\n")
+
+        for i in range(4):
+            self.data_file.write("# Distance %d cm channel %d to channel %d\n"
+                                 % (get_setting("distance_ch%d" % i), i,
+                                    i + 1))
+        for i in range(4):
+            self.data_file.write("# Thresholds %d mV chan%d\n" %
+                                 (get_setting("threshold_ch%d" % i), i))
+        for i in range(4):
+            self.data_file.write("# Actine Channels %d  channel %d\n" %
+                                 (get_setting("active_ch%d" % i), i))
+        for i, value in enumerate(self.COINCIDENCES):
+            if get_setting("coincidence%d" % i):
+                self.data_file.write("# Coincidenes %s \n" % value)
+
+        self.data_file.write("\n")
+
+    def start(self, measurement_type="rate"):
+        """
+        Start a measurement and open the rate file.
+
+        :param measurement_type: kind of measurement for the file comment
+        :type measurement_type: str
+        :returns: None
+        """
+        if self.active:
+            return
+
+        self.start_time = datetime.datetime.utcnow()
+        self.first_cycle = True
+        self.data_file.open("a")
+
+        # write column headers if this is the first run
+        if self.first_run:
+            self.write_settings()
+            self.data_file.write(
+                    "year month day hour minutes second milliseconds" +
+                    " | R0 | R1 | R2 | R3 | R trigger | " +
+                    " chan0 | chan1 | chan2 | chan3 | trigger | Delta_time\n")
+            self.first_run = False
+
+        self.data_file.write("# new %s measurement run from: %s\n" %
+                             (measurement_type, self.start_time.strftime(
+                                     "%a %d %b %Y %H:%M:%S UTC")))
+        self.data_file.write("\n")
+        self.active = True
+
+    def stop(self):
+        """
+        Stop the measurement, append the settings and close the rate file.
+
+        :returns: None
+        """
+        if not self.active:
+            return
+
+        self.active = False
+        stop_time = datetime.datetime.utcnow()
+        self.measurement_duration += stop_time - self.start_time
+
+        self.data_file.write("# stopped run on: %s\n" %
+                             stop_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
+        self.data_file.write("\n")
+        self.write_settings()
+        self.data_file.close()
+
+    def finish(self):
+        """
+        Cleanup, close and rename the rate file
+
+        :returns: None
+        """
+        if self.active:
+            self.active = False
+            stop_time = datetime.datetime.utcnow()
+            self.measurement_duration += stop_time - self.start_time
+
+            self.data_file.write("# stopped run on: %s\n" %
+                                 stop_time.strftime(
+                                         "%a %d %b %Y %H:%M:%S UTC"))
+            self.data_file.close()
+
+        # only rename if file actually exists
+        if os.path.exists(self.data_file.get_filename()):
+            try:
+                self.logger.info(("The rate measurement was active " +
+                                  "for %f hours") %
+                                 get_hours_from_duration(
+                                         self.measurement_duration))
+                rename_muonic_file(self.measurement_duration,
+                                   self.data_file.get_filename())
+            except (OSError, IOError):
+                pass
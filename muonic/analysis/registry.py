@@ -0,0 +1,560 @@
+"""
+Registry of analyses which run on the extracted pulses.
+
+Every analysis declares the channels and the features of these channels it
+needs, e.g. the first rising edge or the pulse widths. For each event the
+registry computes the features requested by all registered analyses once,
+passes them to every analysis and hands the results to the subscribers of
+that analysis. This way new analyses can be added without a GUI widget and
+the same analyses can be run by the GUI and by headless tools.
+
+Channels are addressed like in the event tuples returned by
+PulseExtractor.extract, index 1 to 4 for channel 0 to 3.
+
+The registry can be changed from one thread while another one processes
+the events, e.g. by the analysis worker of muonic.analysis.pipeline.
+"""
+import threading
+
+import numpy as np
+
+from muonic.analysis.batch import ACCEPTED
+from muonic.analysis.batch import REJECT_PULSE_WIDTH, REJECT_DECAY_TIME
+from muonic.analysis.cuts import pulse_width, decay_cuts, velocity_cuts
+from muonic.analysis.cuts import rejection_reason
+from muonic.analysis.decay_finder import StreamingDecayFinder
+from muonic.util.tracing import get_tracer
+
+__all__ = ["MULTIPLICITY", "FIRST_PULSE", "LAST_PULSE", "FIRST_RISING_EDGE",
+           "PULSE_WIDTHS", "PULSES", "EVENT_TIME", "FEATURES", "BaseAnalysis",
+           "PulseWidthAnalysis", "VelocityAnalysis", "DecayAnalysis",
+           "StreamingDecayAnalysis", "AnalysisRegistry",
+           "AnalysisWithNameExistsError"]
+
+# features of a channel
+MULTIPLICITY = "multiplicity"
+FIRST_PULSE = "first_pulse"
+LAST_PULSE = "last_pulse"
+FIRST_RISING_EDGE = "first_rising_edge"
+PULSE_WIDTHS = "pulse_widths"
+PULSES = "pulses"
+
+# key of the trigger time of the event in the features, it is
+# always present and not bound to a channel
+EVENT_TIME = "event_time"
+
+TRACER = get_tracer("analysis")
+
+
+def _pulse_widths(pulses):
+    """
+    Widths of the pulses of a channel, pulses without
+    falling edge have a width of 0.
+
+    :param pulses: pulses of a channel
+    :type pulses: list of tuples
+    :returns: list of floats
+    """
+    return [fe - re if fe is not None else 0. for re, fe in pulses]
+
+
+# feature name -> function calculating the feature from the pulses
+# of a channel, channels without pulses yield None for single pulses
+FEATURES = {
+    MULTIPLICITY: len,
+    FIRST_PULSE: lambda pulses: pulses[0] if pulses else None,
+    LAST_PULSE: lambda pulses: pulses[-1] if pulses else None,
+    FIRST_RISING_EDGE: lambda pulses: pulses[0][0] if pulses else None,
+    PULSE_WIDTHS: _pulse_widths,
+    PULSES: lambda pulses: pulses
+}
+
+
+class AnalysisWithNameExistsError(Exception):
+    """
+    Exception which is raised if an analysis with the same name
+    is already registered.
+    """
+    pass
+
+
+class BaseAnalysis(object):
+    """
+    Base class for analyses run by the AnalysisRegistry.
+
+    :param name: name the results are published under
+    :type name: str
+    :param channels: channel indices the analysis looks at
+    :type channels: iterable of int
+    :param features: feature names the analysis needs for its channels
+    :type features: iterable of str
+    """
+    # the analysis finds nothing without the event times
+    NEEDS_EVENT_TIME = False
+
+    def __init__(self, name, channels=(1, 2, 3, 4), features=()):
+        self.name = name
+        self.channels = tuple(channels)
+        self.features = tuple(features)
+
+        for feature in self.features:
+            if feature not in FEATURES:
+                raise ValueError("unknown feature '%s'" % feature)
+
+    def requirements(self):
+        """
+        Get the (feature, channel) pairs needed by this analysis.
+
+        :returns: set of tuples
+        """
+        return set((feature, channel) for feature in self.features
+                   for channel in self.channels)
+
+    def analyze(self, features):
+        """
+        Analyze the features of an event.
+
+        :param features: the requested features keyed by feature name
+                         and channel index
+        :type features: dict
+        :returns: object or None -- result of the analysis, None if there
+                  is nothing to publish for this event
+        """
+        raise NotImplementedError("analyze has to be implemented " +
+                                  "by the subclass")
+
+
+class PulseWidthAnalysis(BaseAnalysis):
+    """
+    Publishes the pulse widths of every event.
+
+    :param name: name the results are published under
+    :type name: str
+    :param channels: channel indices
+    :type channels: iterable of int
+    """
+
+    def __init__(self, name="pulse", channels=(1, 2, 3, 4)):
+        BaseAnalysis.__init__(self, name, channels, (PULSE_WIDTHS,))
+
+    def analyze(self, features):
+        """
+        Get the pulse widths of an event.
+
+        :param features: event features
+        :type features: dict
+        :returns: dict -- lists of pulse widths keyed by channel index
+        """
+        return dict((channel, features[(PULSE_WIDTHS, channel)])
+                    for channel in self.channels)
+
+
+class VelocityAnalysis(BaseAnalysis):
+    """
+    Publishes flight times between two channels with the cuts
+    of muonic.analysis.cuts.velocity_cuts.
+
+    :param name: name the results are published under
+    :type name: str
+    :param upper_channel: index of the upper channel
+    :type upper_channel: int
+    :param lower_channel: index of the lower channel
+    :type lower_channel: int
+    """
+
+    def __init__(self, name="velocity", upper_channel=1, lower_channel=2):
+        BaseAnalysis.__init__(self, name, (upper_channel, lower_channel),
+                              (MULTIPLICITY, FIRST_PULSE))
+        self.upper_channel = upper_channel
+        self.lower_channel = lower_channel
+
+    def analyze(self, features):
+        """
+        Get the flight time t(lower_channel) - t(upper_channel) of an event.
+
+        :param features: event features
+        :type features: dict
+        :returns: float or None
+        """
+        upper = features[(FIRST_PULSE, self.upper_channel)]
+        lower = features[(FIRST_PULSE, self.lower_channel)]
+
+        width_diff = pulse_width(upper) - pulse_width(lower)
+        reason = rejection_reason(velocity_cuts(
+                features[(MULTIPLICITY, self.upper_channel)],
+                features[(MULTIPLICITY, self.lower_channel)], width_diff))
+
+        if reason != ACCEPTED:
+            if TRACER.enabled:
+                TRACER.record("velocity_rejected", features[EVENT_TIME],
+                              reason, width_diff
+                              if reason == REJECT_PULSE_WIDTH else
+                              (upper, lower))
+            return None
+
+        # always use rising edge since fe might be virtual
+        flight_time = lower[0] - upper[0]
+
+        if TRACER.enabled:
+            TRACER.record("velocity_found", features[EVENT_TIME], ACCEPTED,
+                          flight_time)
+        return flight_time
+
+
+class DecayAnalysis(BaseAnalysis):
+    """
+    Publishes decay times with the cuts of
+    muonic.analysis.cuts.decay_cuts.
+
+    :param name: name the results are published under
+    :type name: str
+    :param single_channel: channel index
+    :type single_channel: int
+    :param double_channel: channel index
+    :type double_channel: int
+    :param veto_channel: channel index
+    :type veto_channel: int
+    :param min_decay_time: minimum decay time
+    :type min_decay_time: int
+    :param min_single_pulse_width: minimum single pulse width
+    :type min_single_pulse_width: int
+    :param max_single_pulse_width: maximum single pulse width
+    :type max_single_pulse_width: int
+    :param min_double_pulse_width: minimum double pulse width
+    :type min_double_pulse_width: int
+    :param max_double_pulse_width: maximum double pulse width
+    :type max_double_pulse_width: int
+    :param trigger_window: trigger window in ns
+    :type trigger_window: int
+    """
+
+    def __init__(self, name="decay", single_channel=2, double_channel=3,
+                 veto_channel=4, min_decay_time=0,
+                 min_single_pulse_width=0, max_single_pulse_width=12000,
+                 min_double_pulse_width=0, max_double_pulse_width=12000,
+                 trigger_window=10000):
+        BaseAnalysis.__init__(self, name,
+                              (single_channel, double_channel, veto_channel),
+                              (MULTIPLICITY, FIRST_PULSE, LAST_PULSE))
+        self.single_channel = single_channel
+        self.double_channel = double_channel
+        self.veto_channel = veto_channel
+        self.min_decay_time = min_decay_time
+        self.min_single_pulse_width = min_single_pulse_width
+        self.max_single_pulse_width = max_single_pulse_width
+        self.min_double_pulse_width = min_double_pulse_width
+        self.max_double_pulse_width = max_double_pulse_width
+        self.trigger_window = trigger_window
+
+    def analyze(self, features):
+        """
+        Get the decay time of an event.
+
+        :param features: event features
+        :type features: dict
+        :returns: float or None
+        """
+        pulses1 = features[(MULTIPLICITY, self.single_channel)]
+        pulses2 = features[(MULTIPLICITY, self.double_channel)]
+        pulses3 = features[(MULTIPLICITY, self.veto_channel)]
+
+        first_double = features[(FIRST_PULSE, self.double_channel)]
+        last_double = features[(LAST_PULSE, self.double_channel)]
+
+        single_pulse_width = pulse_width(
+                features[(FIRST_PULSE, self.single_channel)])
+        double_pulse_width = pulse_width(last_double)
+
+        decay_time = np.nan
+        if first_double is not None:
+            # subtract rising edges, falling edges might be virtual
+            decay_time = last_double[0] - first_double[0]
+
+        reason = rejection_reason(decay_cuts(
+                pulses1, pulses2, pulses3, single_pulse_width,
+                double_pulse_width, decay_time,
+                self.single_channel == self.double_channel,
+                self.min_decay_time, self.min_single_pulse_width,
+                self.max_single_pulse_width, self.min_double_pulse_width,
+                self.max_double_pulse_width, self.trigger_window))
+
+        if reason == ACCEPTED:
+            if TRACER.enabled:
+                TRACER.record("decay_found", features[EVENT_TIME], ACCEPTED,
+                              decay_time)
+            return decay_time
+
+        if TRACER.enabled:
+            if reason == REJECT_PULSE_WIDTH:
+                value = (single_pulse_width, double_pulse_width)
+            elif reason == REJECT_DECAY_TIME:
+                value = decay_time
+            else:
+                value = (pulses1, pulses2, pulses3)
+            TRACER.record("decay_rejected", features[EVENT_TIME], reason,
+                          value)
+        return None
+
+
+class StreamingDecayAnalysis(BaseAnalysis):
+    """
+    Publishes the decay times found by a
+    muonic.analysis.decay_finder.StreamingDecayFinder across trigger
+    windows. Needs the event times to be passed to AnalysisRegistry.process.
+
+    :param name: name the results are published under
+    :type name: str
+    :param single_channel: channel index
+    :type single_channel: int
+    :param double_channel: channel index
+    :type double_channel: int
+    :param veto_channel: channel index
+    :type veto_channel: int
+    :param kwargs: cuts passed on to the decay finder
+    :type kwargs: dict
+    """
+    NEEDS_EVENT_TIME = True
+
+    def __init__(self, name="decay_stream", single_channel=2,
+                 double_channel=3, veto_channel=4, **kwargs):
+        BaseAnalysis.__init__(self, name,
+                              (single_channel, double_channel, veto_channel),
+                              (PULSES,))
+        self._decays = []
+        self.finder = StreamingDecayFinder(
+                single_channel=single_channel - 1,
+                double_channel=double_channel - 1,
+                veto_channel=veto_channel - 1,
+                callback=lambda decay, muon_time: self._decays.append(decay),
+                **kwargs)
+
+    def analyze(self, features):
+        """
+        Feed the pulses of an event to the decay finder.
+
+        :param features: event features
+        :type features: dict
+        :returns: list of floats or None -- decay times found
+        """
+        if features[EVENT_TIME] is None:
+            return None
+
+        pulses = [None] + [features.get((PULSES, channel), [])
+                           for channel in range(1, 5)]
+        self.finder.process_event(pulses, features[EVENT_TIME])
+
+        if not self._decays:
+            return None
+
+        decays = self._decays
+        self._decays = []
+        return decays
+
+
+class AnalysisRegistry(object):
+    """
+    Runs the registered analyses on extracted events and publishes
+    their results to the subscribers.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._analyses = []
+        self._subscribers = dict()
+        self._lock = threading.RLock()
+
+        # (feature, channel) pairs needed by the registered analyses
+        self._requirements = []
+
+        # analyses which need the event times, warned about once if
+        # events come without them
+        self._timed_analyses = []
+        self._missing_time_warned = set()
+
+    def _update_requirements(self):
+        """
+        Collect the features needed by the registered analyses.
+
+        :returns: None
+        """
+        requirements = set()
+        for analysis in self._analyses:
+            requirements |= analysis.requirements()
+        self._requirements = sorted(requirements)
+        self._timed_analyses = [analysis.name for analysis in self._analyses
+                                if analysis.NEEDS_EVENT_TIME]
+
+    def _warn_missing_event_time(self):
+        """
+        Warn once per analysis that needs the event times but
+        gets events without them.
+
+        :returns: None
+        """
+        for name in self._timed_analyses:
+            if name not in self._missing_time_warned:
+                self._missing_time_warned.add(name)
+                self.logger.warning("Analysis '%s' needs the event times, "
+                                    "it finds nothing in events without "
+                                    "them" % name)
+
+    def register(self, analysis):
+        """
+        Register an analysis.
+
+        Raises AnalysisWithNameExistsError if an analysis of that name is
+        already registered.
+
+        :param analysis: analysis object
+        :type analysis: BaseAnalysis
+        :returns: None
+        :raises: AnalysisWithNameExistsError
+        """
+        with self._lock:
+            if self.have_analysis(analysis.name):
+                raise AnalysisWithNameExistsError(
+                        "analysis with name '%s' already exists" %
+                        analysis.name)
+
+            self._analyses.append(analysis)
+            self._update_requirements()
+        self.logger.debug("Registered analysis '%s'" % analysis.name)
+
+    def unregister(self, name):
+        """
+        Remove an analysis, its subscribers stay subscribed.
+
+        :param name: analysis name
+        :type name: str
+        :returns: None
+        """
+        with self._lock:
+            self._analyses = [analysis for analysis in self._analyses
+                              if analysis.name != name]
+            self._update_requirements()
+        self.logger.debug("Unregistered analysis '%s'" % name)
+
+    def have_analysis(self, name):
+        """
+        Returns True if an analysis with name is registered, False otherwise.
+
+        :param name: analysis name
+        :type name: str
+        :returns: bool
+        """
+        return self.get_analysis(name) is not None
+
+    def get_analysis(self, name):
+        """
+        Get a registered analysis.
+
+        :param name: analysis name
+        :type name: str
+        :returns: BaseAnalysis or None
+        """
+        for analysis in self._analyses:
+            if analysis.name == name:
+                return analysis
+        return None
+
+    def active(self):
+        """
+        Returns True if there are registered analyses, False otherwise.
+
+        :returns: bool
+        """
+        return len(self._analyses) > 0
+
+    def subscribe(self, name, callback):
+        """
+        Subscribe to the results of an analysis. The callback gets called
+        with every result the analysis publishes.
+
+        :param name: analysis name
+        :type name: str
+        :param callback: function taking the result
+        :type callback: callable
+        :returns: None
+        """
+        with self._lock:
+            callbacks = self._subscribers.setdefault(name, [])
+
+            if callback not in callbacks:
+                callbacks.append(callback)
+
+    def unsubscribe(self, name, callback):
+        """
+        Remove a subscription.
+
+        :param name: analysis name
+        :type name: str
+        :param callback: subscribed function
+        :type callback: callable
+        :returns: None
+        """
+        with self._lock:
+            callbacks = self._subscribers.get(name, [])
+
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def compute_features(self, pulses, event_time=None):
+        """
+        Compute the features needed by the registered analyses for an event.
+
+        :param pulses: extracted pulses
+        :type pulses: tuple
+        :param event_time: trigger time of the event in seconds since day
+                           start, see PulseExtractor.last_event_time
+        :type event_time: float
+        :returns: dict -- features keyed by feature name and channel index
+        """
+        features = dict(((feature, channel),
+                         FEATURES[feature](pulses[channel]))
+                        for feature, channel in self._requirements)
+        features[EVENT_TIME] = event_time
+        return features
+
+    def process(self, pulses, event_time=None):
+        """
+        Run all registered analyses on an event and
+        publish the results to the subscribers.
+
+        :param pulses: extracted pulses
+        :type pulses: tuple
+        :param event_time: trigger time of the event in seconds since day
+                           start, see PulseExtractor.last_event_time
+        :type event_time: float
+        :returns: dict -- results keyed by analysis name, analyses without
+                  result for this event are left out
+        """
+        results = dict()
+
+        with self._lock:
+            if pulses is None or not self._analyses:
+                return results
+
+            if event_time is None and self._timed_analyses:
+                self._warn_missing_event_time()
+
+            features = self.compute_features(pulses, event_time)
+
+            for analysis in self._analyses:
+                result = analysis.analyze(features)
+
+                if result is None:
+                    continue
+
+                if TRACER.enabled:
+                    TRACER.record("analysis_result", event_time,
+                                  value=analysis.name)
+
+                results[analysis.name] = result
+
+                for callback in self._subscribers.get(analysis.name, []):
+                    callback(result)
+
+        return results
@@ -0,0 +1,391 @@
+"""
+Uncertainties of the lifetime and velocity fits from resampling.
+
+Two methods are offered:
+
+* bootstrap: the measured decay or flight times are drawn with replacement
+  and fitted again. The spread of the results is the uncertainty of the fit,
+  also if the covariance of the fit is not available.
+* toy Monte Carlo: samples of the same size are generated from the fitted
+  model and fitted again. The pulls, the deviation of the toy results from
+  the generating value divided by the fitted uncertainty, show whether the
+  uncertainty of the fit is right.
+
+The resamples are spread across a process pool. Every chunk of resamples
+gets its own random seed, so the results are reproducible for a given seed
+and number of processes.
+"""
+from __future__ import print_function
+from argparse import ArgumentParser
+import multiprocessing as mp
+
+import numpy as np
+
+from muonic.analysis.fit_engine import GaussianModel, poisson_fit
+from muonic.analysis.lifetime import fit_lifetime, read_decay_times
+
+__all__ = ["BOOTSTRAP", "TOY_MONTE_CARLO", "LifetimeFitter",
+           "GaussianFitter", "ResamplingResult", "resample"]
+
+BOOTSTRAP = "bootstrap"
+TOY_MONTE_CARLO = "toy"
+
+CHUNKS_PER_PROCESS = 4
+
+# one standard deviation of a gaussian
+ONE_SIGMA = 0.6827
+
+# state of the pool worker processes, set by _initialize_worker
+_worker = dict()
+
+
+class LifetimeFitter(object):
+    """
+    Unbinned lifetime fit of decay times, see
+    muonic.analysis.lifetime.fit_lifetime.
+
+    :param fit_range: lower and upper limit of the decay times used
+    :type fit_range: tuple of floats
+    :param window_end: end of the trigger window
+    :type window_end: float
+    :param background: fit a flat background
+    :type background: bool
+    """
+
+    def __init__(self, fit_range=(0.5, 10.), window_end=None,
+                 background=True):
+        self.fit_range = fit_range
+        self.window_end = window_end
+        self.background = background
+
+    def fit(self, sample):
+        """
+        Fit the lifetime.
+
+        :param sample: decay times
+        :type sample: numpy.ndarray
+        :returns: tuple or None -- lifetime, its uncertainty and the model
+                  parameters, None if the fit failed
+        """
+        result = fit_lifetime(sample, fit_range=self.fit_range,
+                              window_end=self.window_end,
+                              background=self.background)
+
+        if result is None:
+            return None
+        return (result.lifetime, result.error,
+                (result.lifetime, result.signal_fraction, result.decays))
+
+    def simulate(self, parameters, random_state):
+        """
+        Generate decay times in the fit range from the model.
+
+        :param parameters: model parameters returned by fit
+        :type parameters: tuple
+        :param random_state: random number generator
+        :type random_state: numpy.random.RandomState
+        :returns: numpy.ndarray
+        """
+        lifetime, fraction, decays = parameters
+        low, high = self.fit_range
+
+        if self.window_end is not None:
+            high = min(high, self.window_end)
+
+        size = random_state.poisson(decays)
+        signal = random_state.binomial(size, fraction)
+
+        # inverse of the cumulative truncated exponential
+        u = random_state.uniform(size=signal)
+        signal_times = -lifetime * np.log(
+                1. - u * (1. - np.exp(-(high - low) / lifetime)))
+        background_times = random_state.uniform(0., high - low,
+                                                size - signal)
+
+        return low + np.concatenate((signal_times, background_times))
+
+
+class GaussianFitter(object):
+    """
+    Gaussian fit to the histogram of flight times, like the fit of the
+    velocity measurement.
+
+    :param bin_edges: bin edges of the histogram
+    :type bin_edges: numpy.ndarray
+    :param fit_range: lower and upper limit of the fitted bin centers
+    :type fit_range: tuple of floats
+    """
+
+    def __init__(self, bin_edges, fit_range=None):
+        self.bin_edges = np.asarray(bin_edges, dtype=float)
+        self.fit_range = fit_range
+        self.model = GaussianModel()
+
+        centers = 0.5 * (self.bin_edges[:-1] + self.bin_edges[1:])
+        self._mask = np.ones(len(centers), dtype=bool)
+
+        if fit_range is not None:
+            self._mask = (centers >= fit_range[0]) & (centers <= fit_range[1])
+
+        self._centers = centers[self._mask]
+
+    def fit(self, sample):
+        """
+        Fit the mean flight time.
+
+        :param sample: flight times
+        :type sample: numpy.ndarray
+        :returns: tuple or None -- mean, its uncertainty and the model
+                  parameters, None if the fit failed
+        """
+        counts = np.histogram(sample, self.bin_edges)[0][self._mask]
+
+        if len(self._centers) < 3 or not counts.any():
+            return None
+
+        result = poisson_fit(self.model, self._centers, counts)
+        return result.value, result.error, result.parameters
+
+    def simulate(self, parameters, random_state):
+        """
+        Generate flight times from the fitted gaussian.
+
+        :param parameters: model parameters returned by fit
+        :type parameters: numpy.ndarray
+        :param random_state: random number generator
+        :type random_state: numpy.random.RandomState
+        :returns: numpy.ndarray
+        """
+        area, sigma, mean = parameters
+        bin_width = self.bin_edges[1] - self.bin_edges[0]
+        size = random_state.poisson(max(area / bin_width, 0.))
+        return random_state.normal(mean, sigma, size)
+
+
+class ResamplingResult(object):
+    """
+    Results of the fits to the resamples.
+
+    :param method: BOOTSTRAP or TOY_MONTE_CARLO
+    :type method: str
+    :param estimate: result of the fit to the data
+    :type estimate: float
+    :param error: uncertainty of the fit to the data
+    :type error: float
+    :param values: results of the fits to the resamples
+    :type values: numpy.ndarray
+    :param errors: uncertainties of the fits to the resamples
+    :type errors: numpy.ndarray
+    :param failed: number of failed fits
+    :type failed: int
+    """
+
+    def __init__(self, method, estimate, error, values, errors, failed):
+        self.method = method
+        self.estimate = estimate
+        self.error = error
+        self.values = values
+        self.errors = errors
+        self.failed = failed
+
+    @property
+    def standard_error(self):
+        """
+        Standard deviation of the resampled results.
+
+        :returns: float
+        """
+        if len(self.values) < 2:
+            return np.nan
+        return np.std(self.values, ddof=1)
+
+    @property
+    def bias(self):
+        """
+        Mean deviation of the resampled results from the estimate.
+
+        :returns: float
+        """
+        if not len(self.values):
+            return np.nan
+        return np.mean(self.values) - self.estimate
+
+    @property
+    def pulls(self):
+        """
+        Deviations of the resampled results from the estimate in units of
+        their fitted uncertainties. For toy Monte Carlo samples these should
+        follow a standard normal distribution.
+
+        :returns: numpy.ndarray
+        """
+        valid = np.isfinite(self.errors) & (self.errors > 0)
+        return ((self.values[valid] - self.estimate) /
+                self.errors[valid])
+
+    def interval(self, confidence=ONE_SIGMA):
+        """
+        Central confidence interval from the percentiles of the
+        resampled results.
+
+        :param confidence: confidence level
+        :type confidence: float
+        :returns: tuple of floats -- lower and upper limit
+        """
+        if not len(self.values):
+            return np.nan, np.nan
+
+        tail = 50. * (1. - confidence)
+        return (np.percentile(self.values, tail),
+                np.percentile(self.values, 100. - tail))
+
+
+def _initialize_worker(fitter, method, data, parameters):
+    """
+    Store the fit setup in a pool worker process.
+
+    :returns: None
+    """
+    _worker["fitter"] = fitter
+    _worker["method"] = method
+    _worker["data"] = data
+    _worker["parameters"] = parameters
+
+
+def _resample_chunk(args):
+    """
+    Fit a number of resamples.
+
+    :param args: number of resamples and random seed
+    :type args: tuple
+    :returns: tuple of lists and int -- results, their uncertainties
+              and the number of failed fits
+    """
+    count, seed = args
+    fitter = _worker["fitter"]
+    data = _worker["data"]
+    random_state = np.random.RandomState(seed)
+
+    values = []
+    errors = []
+    failed = 0
+
+    for _ in range(count):
+        if _worker["method"] == BOOTSTRAP:
+            sample = data[random_state.randint(0, len(data), len(data))]
+        else:
+            sample = fitter.simulate(_worker["parameters"], random_state)
+
+        try:
+            result = fitter.fit(sample)
+        except (ValueError, ArithmeticError, np.linalg.LinAlgError):
+            result = None
+
+        if result is None:
+            failed += 1
+        else:
+            values.append(result[0])
+            errors.append(result[1])
+
+    return values, errors, failed
+
+
+def resample(fitter, data, method=BOOTSTRAP, resamples=1000,
+             processes=None, seed=None):
+    """
+    Fit the data and a number of resamples of it.
+
+    Raises ValueError if the method is unknown.
+
+    :param fitter: fitter, e.g. LifetimeFitter or GaussianFitter
+    :type fitter: object
+    :param data: measured decay or flight times
+    :type data: numpy.ndarray
+    :param method: BOOTSTRAP or TOY_MONTE_CARLO
+    :type method: str
+    :param resamples: number of resamples
+    :type resamples: int
+    :param processes: number of worker processes, defaults to the number of
+                      cores, 1 fits the resamples in the calling process
+    :type processes: int
+    :param seed: random seed
+    :type seed: int
+    :returns: ResamplingResult or None -- None if the fit to the data failed
+    :raises: ValueError
+    """
+    if method not in (BOOTSTRAP, TOY_MONTE_CARLO):
+        raise ValueError("unknown resampling method '%s'" % method)
+
+    data = np.asarray(data, dtype=float)
+    result = fitter.fit(data)
+
+    if result is None:
+        return None
+
+    estimate, error, parameters = result
+
+    if processes is None:
+        processes = mp.cpu_count()
+
+    n_chunks = max(1, min(resamples, processes * CHUNKS_PER_PROCESS))
+    seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, n_chunks)
+    tasks = [(resamples * (i + 1) // n_chunks - resamples * i // n_chunks,
+              seeds[i]) for i in range(n_chunks)]
+    setup = (fitter, method, data, parameters)
+
+    if processes <= 1:
+        _initialize_worker(*setup)
+        chunks = [_resample_chunk(task) for task in tasks]
+    else:
+        pool = mp.Pool(processes, _initialize_worker, setup)
+
+        try:
+            chunks = pool.map(_resample_chunk, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    values = np.array([value for chunk in chunks for value in chunk[0]])
+    errors = np.array([value for chunk in chunks for value in chunk[1]])
+    failed = sum(chunk[2] for chunk in chunks)
+
+    return ResamplingResult(method, estimate, error, values, errors, failed)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Bootstrap and toy Monte Carlo " +
+                                        "uncertainties of the lifetime fit " +
+                                        "on decay files")
+    parser.add_argument("files", nargs="+", help="decay files")
+    parser.add_argument("-r", "--fit-range", nargs=2, type=float,
+                        default=(0.5, 10.), metavar=("LOW", "HIGH"),
+                        help="fit range in microseconds")
+    parser.add_argument("-w", "--window-end", type=float, default=None,
+                        help="end of the trigger window in microseconds")
+    parser.add_argument("-n", "--resamples", type=int, default=1000,
+                        help="number of resamples")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of processes, defaults to the " +
+                             "number of cores")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+                        help="random seed")
+    args = parser.parse_args()
+
+    decay_times = read_decay_times(args.files)
+    lifetime_fitter = LifetimeFitter(args.fit_range, args.window_end)
+
+    for resampling_method in (BOOTSTRAP, TOY_MONTE_CARLO):
+        resampled = resample(lifetime_fitter, decay_times, resampling_method,
+                             args.resamples, args.processes, args.seed)
+
+        if resampled is None:
+            print("not enough decays in the fit range")
+            break
+
+        pulls = resampled.pulls
+        print("%s: lifetime (%.4f +- %.4f) microseconds, " %
+              (resampling_method, resampled.estimate, resampled.error) +
+              "resampled standard error %.4f, " % resampled.standard_error +
+              "68%% interval [%.4f, %.4f], " % resampled.interval() +
+              "pulls %.2f +- %.2f, %d failed fits" %
+              (np.mean(pulls), np.std(pulls), resampled.failed))
@@ -7,4 +7,4 @@ from .simulation import DAQSimulationConnection, DAQSimulationServer
 from .connection import DAQConnection, DAQServer
 from .provider import DAQClient, DAQProvider
 
-__all__ = ["exceptions", "simulation", "connection", "provider"]
+__all__ = ["exceptions", "simulation", "connection", "provider", "messages"]
@@ -0,0 +1,228 @@
+"""
+Parse the answers of the DAQ card to configuration queries and store the
+configuration in the settings.
+"""
+import time
+
+from muonic.daq.exceptions import DAQIOError
+from muonic.util import update_setting, get_setting
+
+__all__ = ["parse_thresholds", "parse_distances", "parse_channel_config",
+           "parse_coincidence_times", "query_configuration"]
+
+
+def parse_thresholds(msg, logger):
+    """
+    Explicitly scan message for threshold information.
+
+    Return True if found, False otherwise.
+
+    :param msg: daq message
+    :type msg: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    :returns: bool
+    """
+    if msg.startswith('TL') and len(msg) > 9:
+        msg = msg.split('=')
+        update_setting("threshold_ch0", int(msg[1][:-2]))
+        update_setting("threshold_ch1", int(msg[2][:-2]))
+        update_setting("threshold_ch2", int(msg[3][:-2]))
+        update_setting("threshold_ch3", int(msg[4]))
+        logger.debug("Got Thresholds %d %d %d %d" %
+                     tuple([get_setting("threshold_ch%d" % i)
+                            for i in range(4)]))
+        return True
+    else:
+        return False
+
+
+def parse_distances(msg, logger):
+    """
+    Explicitly scan message for distance information.
+
+    Return True if found, False otherwise.
+
+    :param msg: daq message
+    :type msg: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    :returns: bool
+    """
+    if msg.startswith('DL') and len(msg) > 9:
+        msg = msg.split('=')
+        update_setting("distance_ch0", int(msg[1][:-2]))
+        update_setting("distance_ch1", int(msg[2][:-2]))
+        update_setting("distance_ch2", int(msg[3][:-2]))
+        update_setting("distance_ch3", int(msg[4]))
+        logger.debug("Got Distances %d %d %d %d" %
+                     tuple([get_setting("distance_ch%d" % i)
+                            for i in range(4)]))
+        return True
+    else:
+        return False
+
+
+def parse_channel_config(msg, logger):
+    """
+    Explicitly scan message for channel information.
+
+    Return True if found, False otherwise.
+
+    DC gives:
+
+    DC C0=23 C1=71 C2=0A C3=00
+
+    Which has the meaning:
+
+    MM - 00 -> 8bits for channel enable/disable, coincidence and veto
+
+    +---------------------------------------------------------------------+
+    |                              bits                                   |
+    +====+====+===========+===========+========+========+========+========+
+    |7   |6   |5          |4          |3       |2       |1       |0       |
+    +----+----+-----------+-----------+--------+--------+--------+--------+
+    |veto|veto|coincidence|coincidence|channel3|channel2|channel1|channel0|
+    +----+----+-----------+-----------+--------+--------+--------+--------+
+
+    +-----------------+
+    |Set bits for veto|
+    +=================+
+    |00 - ch0 is veto |
+    +-----------------+
+    |01 - ch1 is veto |
+    +-----------------+
+    |10 - ch2 is veto |
+    +-----------------+
+    |11 - ch3 is veto |
+    +-----------------+
+
+    +------------------------+
+    |Set bits for coincidence|
+    +========================+
+    |00 - singles            |
+    +------------------------+
+    |01 - twofold            |
+    +------------------------+
+    |10 - threefold          |
+    +------------------------+
+    |11 - fourfold           |
+    +------------------------+
+
+    :param msg: daq message
+    :type msg: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    :returns: bool
+    """
+    if msg.startswith('DC ') and len(msg) > 25:
+        msg = msg.split(' ')
+
+        coincidence_time = msg[4].split('=')[1] + msg[3].split('=')[1]
+        msg = bin(int(msg[1][3:], 16))[2:].zfill(8)
+        veto_config = msg[0:2]
+        coincidence_config = msg[2:4]
+        channel_config = msg[4:8]
+
+        update_setting("gate_width", int(coincidence_time, 16) * 10)
+
+        # set default veto config
+        for i in range(4):
+            if i == 0:
+                update_setting("veto", True)
+            else:
+                update_setting("veto_ch%d" % (i - 1), False)
+
+        # update channel config
+        for i in range(4):
+            update_setting("active_ch%d" % i,
+                           channel_config[3 - i] == '1')
+
+        # update coincidence config
+        for i, seq in enumerate(['00', '01', '10', '11']):
+            update_setting("coincidence%d" % i,
+                           coincidence_config == seq)
+
+        # update veto config
+        for i, seq in enumerate(['00', '01', '10', '11']):
+            if veto_config == seq:
+                if i == 0:
+                    update_setting("veto", False)
+                else:
+                    update_setting("veto_ch%d" % (i - 1), True)
+
+        logger.debug('gate width timew indow %d ns' %
+                     get_setting("gate_width"))
+        logger.debug("Got channel configurations: %d %d %d %d" %
+                     tuple([get_setting("active_ch%d" % i)
+                            for i in range(4)]))
+        logger.debug("Got coincidence configurations: %d %d %d %d" %
+                     tuple([get_setting("coincidence%d" % i)
+                            for i in range(4)]))
+        logger.debug("Got veto configurations: %d %d %d %d" %
+                     tuple([get_setting("veto")] +
+                           [get_setting("veto_ch%d" % i)
+                            for i in range(3)]))
+
+        return True
+    else:
+        return False
+
+
+def parse_coincidence_times(msg):
+    """
+    Get the coincidence time registers 03 and 02 from a channel
+    configuration message, see parse_channel_config.
+
+    Returns None if the message is no channel configuration.
+
+    :param msg: daq message
+    :type msg: str
+    :returns: tuple of str or None
+    """
+    if not msg.startswith('DC') or len(msg) <= 2:
+        return None
+
+    try:
+        split_msg = msg.split(" ")
+        return split_msg[4].split("=")[1], split_msg[3].split("=")[1]
+    except IndexError:
+        return None
+
+
+def query_configuration(daq, logger):
+    """
+    Get the threshold, distance and channel configuration from the DAQ
+    card and store it in the settings.
+
+    Returns the coincidence times of the channel configuration, see
+    parse_coincidence_times.
+
+    :param daq: daq card connection
+    :type daq: muonic.daq.provider.BaseDAQProvider
+    :param logger: logger object
+    :type logger: logging.Logger
+    :returns: tuple of str or None
+    """
+    coincidence_times = None
+
+    for command, parse in [("TL", parse_thresholds),
+                           ("DL", parse_distances),
+                           ("DC", parse_channel_config)]:
+        daq.put(command)
+        # give the daq some time to react
+        time.sleep(0.5)
+
+        while daq.data_available():
+            try:
+                msg = daq.get(0)
+            except DAQIOError:
+                logger.debug("Queue empty!")
+                continue
+
+            parse(msg, logger)
+
+            if command == "DC" and parse_coincidence_times(msg) is not None:
+                coincidence_times = parse_coincidence_times(msg)
+
+    return coincidence_times
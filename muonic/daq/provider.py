@@ -9,6 +9,7 @@ import logging
 import multiprocessing as mp
 import re
 import queue
+import threading
 
 try:
     import zmq
@@ -176,7 +177,10 @@ class DAQClient(BaseDAQProvider):
     :type logger: logging.Logger
     :raises: DAQMissingDependencyError
     """
-    
+    # timeout of data_available and the slices it polls in, in ms
+    POLL_TIMEOUT = 200
+    POLL_SLICE = 20
+
     def __init__(self, address='127.0.0.1', port=5556, logger=None):
         BaseDAQProvider.__init__(self, logger)
         try:
@@ -185,6 +189,10 @@ class DAQClient(BaseDAQProvider):
         except NameError:
             raise DAQMissingDependencyError("no zmq installed...")
 
+        # zmq sockets are not thread safe, but the analysis worker reads
+        # while the gui thread sends commands
+        self._socket_lock = threading.Lock()
+
     def get(self, *args):
         """
         Get something from the DAQ.
@@ -197,7 +205,8 @@ class DAQClient(BaseDAQProvider):
         :raises: DAQIOError
         """
         try:
-            line = self.socket.recv_string()
+            with self._socket_lock:
+                line = self.socket.recv_string()
         except Exception:
             raise DAQIOError("Socket error")
         
@@ -211,7 +220,8 @@ class DAQClient(BaseDAQProvider):
         :type args: list
         :returns: None
         """
-        self.socket.send_string(*args)
+        with self._socket_lock:
+            self.socket.send_string(*args)
 
     def data_available(self):
         """
@@ -219,4 +229,10 @@ class DAQClient(BaseDAQProvider):
 
         :returns: int or bool
         """
-        return self.socket.poll(200)
+        # poll in slices to not block senders for the whole timeout
+        for _ in range(self.POLL_TIMEOUT // self.POLL_SLICE):
+            with self._socket_lock:
+                events = self.socket.poll(self.POLL_SLICE)
+            if events:
+                return events
+        return 0
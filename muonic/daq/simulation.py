@@ -9,6 +9,8 @@ import numpy as np
 from os import path
 import queue
 from random import choice
+import signal
+import sys
 import time
 
 try:
@@ -18,6 +20,9 @@ except ImportError:
     pass
 
 from muonic.daq import DAQMissingDependencyError
+from muonic.util.tracing import get_tracer
+
+TRACER = get_tracer("daq")
 
 
 class DAQSimulation(object):
@@ -88,7 +93,9 @@ class DAQSimulation(object):
                                    format_scalar(self._scalars_ch[2]),
                                    format_scalar(self._scalars_ch[3]),
                                    format_scalar(self._scalars_trigger))
-        self.logger.debug("Scalars to return %s" % self._scalars_to_return)
+        if TRACER.enabled:
+            TRACER.record("simulated_scalars", self._scalars_trigger,
+                          value=tuple(self._scalars_ch))
 
     def readline(self):
         """
@@ -194,27 +201,40 @@ class DAQSimulationConnection(BaseDAQSimulationConnection):
 
         :returns: None
         """
-        while self.running:
-            try:
-                self.logger.debug("inqueue size is %d" % self.in_queue.qsize())
-                while self.in_queue.qsize():
-                    try:
-                        self.serial_port.write(str(self.in_queue.get(0)) +
-                                               "\r")
-                    except queue.Empty:
-                        self.logger.debug("Queue empty!")
-            except NotImplementedError:
-                self.logger.debug("Running Mac version of muonic.")
-                while True:
-                    try:
-                        self.serial_port.write(str(self.in_queue.get(
-                                timeout=0.01)) + "\r")
-                    except queue.Empty:
-                        pass
+        # the reader runs in its own process, so it dumps its traces
+        # itself when it stops. Daemon processes are terminated on exit,
+        # leave through the finally clause then.
+        if TRACER.enabled:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-            while self.serial_port.in_waiting():
-                self.out_queue.put(self.serial_port.readline().strip())
-            time.sleep(0.02)
+        try:
+            while self.running:
+                try:
+                    if TRACER.enabled:
+                        TRACER.record("in_queue_size",
+                                      value=self.in_queue.qsize())
+                    while self.in_queue.qsize():
+                        try:
+                            self.serial_port.write(str(self.in_queue.get(0)) +
+                                                   "\r")
+                        except queue.Empty:
+                            if TRACER.enabled:
+                                TRACER.record("in_queue_empty")
+                except NotImplementedError:
+                    self.logger.debug("Running Mac version of muonic.")
+                    while True:
+                        try:
+                            self.serial_port.write(str(self.in_queue.get(
+                                    timeout=0.01)) + "\r")
+                        except queue.Empty:
+                            pass
+
+                while self.serial_port.in_waiting():
+                    self.out_queue.put(self.serial_port.readline().strip())
+                time.sleep(0.02)
+        finally:
+            if TRACER.enabled:
+                self.logger.info("Trace written to %s" % TRACER.dump())
 
 
 class DAQSimulationServer(BaseDAQSimulationConnection):
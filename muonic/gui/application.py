@@ -4,6 +4,7 @@ Provides the main window for the gui part of muonic
 """
 from os import path
 import datetime
+import queue
 import time
 import webbrowser
 
@@ -12,9 +13,13 @@ from PyQt4 import QtCore
 
 from muonic import __version__, __source_location__
 from muonic import __docs_hosted_at__, __manual_hosted_at__
-from muonic.analysis import PulseExtractor
-from muonic.daq import DAQIOError
-from muonic.gui.helpers import set_large_plot_style
+from muonic.analysis import PulseExtractor, AnalysisRegistry
+from muonic.analysis.pipeline import AnalysisPipeline, AnalysisThread
+from muonic.analysis.pipeline import RawFileSink, WakeupPipe
+from muonic.daq.messages import parse_thresholds, parse_distances
+from muonic.daq.messages import parse_channel_config, parse_coincidence_times
+from muonic.daq.messages import query_configuration
+from muonic.gui.helpers import set_large_plot_style, RefreshScheduler
 from muonic.gui.dialogs import ThresholdDialog, DistanceDialog, ConfigDialog
 from muonic.gui.dialogs import HelpDialog, AdvancedDialog
 from muonic.gui.widgets import VelocityWidget, PulseAnalyzerWidget
@@ -22,7 +27,7 @@ from muonic.gui.widgets import DecayWidget, DAQWidget, RateWidget
 from muonic.gui.widgets import GPSWidget, StatusWidget
 from muonic.util import update_setting, get_setting
 from muonic.util import apply_default_settings, get_muonic_filename
-from muonic.util import get_data_directory
+from muonic.util import get_data_directory, get_memory_usage
 
 
 class Application(QtGui.QMainWindow):
@@ -36,11 +41,19 @@ class Application(QtGui.QMainWindow):
     :param opts: command line options
     :type opts: Namespace
     """
+    # time in seconds the gui thread spends on the batches of the analysis
+    # worker before it handles other events
+    BATCH_TIME_BUDGET = 0.05
+
+    # widgets with plots which are refreshed by the refresh scheduler
+    DYNAMIC_WIDGETS = ["rate", "pulse", "decay", "velocity"]
+
     def __init__(self, daq, logger, opts):
         QtGui.QMainWindow.__init__(self)
 
         # start time of the application
         self.start_time = datetime.datetime.utcnow()
+        setup_started = time.time()
 
         # apply default settings first
         apply_default_settings()
@@ -58,8 +71,13 @@ class Application(QtGui.QMainWindow):
         # tab widget to hold the different physics widgets
         self.tab_widget = QtGui.QTabWidget(self)
 
-        # widget store for the tab widgets to reference later
+        # widget store for the tab widgets to reference later and the
+        # factories and tab pages of the widgets not created yet
         self._widgets = dict()
+        self._lazy_widgets = dict()
+        QtCore.QObject.connect(self.tab_widget,
+                               QtCore.SIGNAL("currentChanged(int)"),
+                               self.on_tab_changed)
 
         # setup status bar
         self.status_bar = QtGui.QMainWindow.statusBar(self)
@@ -73,6 +91,8 @@ class Application(QtGui.QMainWindow):
         # generate filenames
         self.rate_filename = get_muonic_filename(self.start_time,
                                                  "R", opts.user)
+        self.rate_archive_dirname = get_muonic_filename(self.start_time,
+                                                        "RA", opts.user)
         self.raw_filename = get_muonic_filename(self.start_time,
                                                 "DAQ", opts.user)
         self.decay_filename = get_muonic_filename(self.start_time,
@@ -81,6 +101,8 @@ class Application(QtGui.QMainWindow):
                                                      "V", opts.user)
         self.pulse_filename = get_muonic_filename(self.start_time,
                                                   "P", opts.user)
+        self.pulse_sketch_filename = get_muonic_filename(self.start_time,
+                                                         "PW", opts.user)
 
         # store command line settings
         update_setting("write_pulses", opts.write_pulses)
@@ -104,47 +126,79 @@ class Application(QtGui.QMainWindow):
             self.daq.put('CE')
             self.pulse_extractor.write_pulses(True)
 
+        # analyses running on the extracted pulses, pulse widgets
+        # register their analyses when they are started
+        self.analysis_registry = AnalysisRegistry(logger)
+
+        # the analysis worker owns the pulse extractor, runs the analyses
+        # and writes the data files, the widgets get the results they
+        # subscribed to with subscribe_analysis in batches
+        self.analysis_pipeline = AnalysisPipeline(logger,
+                                                  self.pulse_extractor,
+                                                  self.analysis_registry)
+        self._analysis_subscribers = dict()
+
+        # handlers of the control messages keyed by message prefix and the
+        # widgets which get all control messages, the latter are updated
+        # whenever a widget gets activated or deactivated
+        self.message_handlers = dict()
+        self._gps_consumer = None
+        self._status_consumer = None
+        self._decay_consumer = None
+
+        # widgets with dynamic plots are refreshed by the scheduler, which
+        # spreads the refreshes and skips hidden and unchanged widgets
+        self.refresh_scheduler = RefreshScheduler(logger, opts.time_window,
+                                                  parent=self)
+
         # create tabbed widgets
         self.setup_tab_widgets()
+        self.setup_message_handlers()
 
-        self.setCentralWidget(self.tab_widget)
+        # the raw file is written by the analysis worker
+        self.analysis_pipeline.add_message_sink(
+                RawFileSink(self.get_widget("daq").output_file))
 
-        # widgets which should be calculated in process_incoming.
-        # The widget is only calculated when it is set to active (True)
-        # via widget.active(True). only widgets which need pulses go here
-        self.pulse_widgets = [self.get_widget("pulse"),
-                              self.get_widget("decay"),
-                              self.get_widget("velocity")]
-
-        # widgets which should be dynamically updated by the timer
-        # should be in this list
-        self.dynamic_widgets = [self.get_widget("rate"),
-                                self.get_widget("pulse"),
-                                self.get_widget("decay"),
-                                self.get_widget("velocity")]
-
-        # timer to periodically call processIncoming and check
-        # what is in the queue
-        self.timer = QtCore.QTimer()
-        QtCore.QObject.connect(self.timer,
-                               QtCore.SIGNAL("timeout()"),
-                               self.process_incoming)
+        self.setCentralWidget(self.tab_widget)
 
-        # time update widgets the have dynamic plots in them
-        self.widget_updater = QtCore.QTimer()
-        QtCore.QObject.connect(self.widget_updater,
+        # thread reading and analyzing the daq messages, it queues batches
+        # of results and wakes up the gui thread through a pipe
+        self.batches = queue.Queue()
+        self.wakeup_pipe = WakeupPipe()
+        self.wakeup_notifier = QtCore.QSocketNotifier(
+                self.wakeup_pipe.fileno(), QtCore.QSocketNotifier.Read, self)
+        QtCore.QObject.connect(self.wakeup_notifier,
+                               QtCore.SIGNAL("activated(int)"),
+                               self.process_batches)
+        self.analysis_thread = AnalysisThread(logger, self.daq,
+                                              self.analysis_pipeline,
+                                              self.publish_batch)
+
+        # timer querying the scalars for the rate measurement
+        self.scalar_timer = QtCore.QTimer()
+        QtCore.QObject.connect(self.scalar_timer,
                                QtCore.SIGNAL("timeout()"),
-                               self.update_dynamic)
+                               self.query_scalars)
 
         self.logger.info("Time window is %4.2f" % opts.time_window)
 
         self.setup_plot_style()
         self.setup_menus()
-        self.process_incoming()
 
-        # start update timers
-        self.timer.start(1000)
-        self.widget_updater.start(opts.time_window * 1000)
+        # start analysis worker, scalar timer and refresh scheduler
+        self.analysis_thread.start()
+        self.scalar_timer.start(opts.time_window * 1000)
+        self.refresh_scheduler.start()
+
+        memory_usage = get_memory_usage()
+
+        if memory_usage is not None:
+            self.logger.info("Startup took %.2f s, peak memory %.1f MB" %
+                             (time.time() - setup_started,
+                              memory_usage / 1048576.))
+        else:
+            self.logger.info("Startup took %.2f s" %
+                             (time.time() - setup_started))
 
     def get_configuration_from_daq_card(self):
         """
@@ -153,63 +207,35 @@ class Application(QtGui.QMainWindow):
 
         :returns: None
         """
-        # get the thresholds
-        self.daq.put('TL')
-        # give the daq some time to react
-        time.sleep(0.5)
-
-        while self.daq.data_available():
-            try:
-                msg = self.daq.get(0)
-                self.get_thresholds_from_msg(msg)
-
-            except DAQIOError:
-                self.logger.debug("Queue empty!")
-
-        # get the distanes
-        self.daq.put('DL')
-        # give the daq some time to react
-        time.sleep(0.5)
-
-        while self.daq.data_available():
-            try:
-                msg = self.daq.get(0)
-                self.get_distances_from_msg(msg)
-
-            except DAQIOError:
-                self.logger.debug("Queue empty!")
-        
-        # get the channel config
-        self.daq.put('DC')
-        # give the daq some time to react
-        time.sleep(0.5)
-
-        while self.daq.data_available():
-            try:
-                msg = self.daq.get(0)
-                self.get_channels_from_msg(msg)
-
-            except DAQIOError:
-                self.logger.debug("Queue empty!")
+        query_configuration(self.daq, self.logger)
 
     def setup_tab_widgets(self):
         """
-        Creates the widgets and adds tabs
+        Creates the widgets and adds tabs. The widgets with plots, except
+        for the rates shown on start, are created when they are needed.
 
         :returns: None
         """
         self.add_widget("rate", "Muon Rates",
                         RateWidget(self.logger, self.rate_filename,
-                                   parent=self))
-        self.add_widget("pulse", "Pulse Analyzer",
-                        PulseAnalyzerWidget(self.logger, self.pulse_extractor,
-                                            parent=self))
-        self.add_widget("decay", "Muon Decay",
-                        DecayWidget(self.logger, self.decay_filename,
-                                    self.pulse_extractor, parent=self))
-        self.add_widget("velocity", "Muon Velocity",
-                        VelocityWidget(self.logger, self.velocity_filename,
-                                       self.pulse_extractor, parent=self))
+                                   parent=self,
+                                   archive_dirname=self.rate_archive_dirname))
+        self.add_lazy_widget("pulse", "Pulse Analyzer",
+                             lambda: PulseAnalyzerWidget(
+                                     self.logger, self.pulse_extractor,
+                                     parent=self,
+                                     sketch_filename=(
+                                         self.pulse_sketch_filename)))
+        self.add_lazy_widget("decay", "Muon Decay",
+                             lambda: DecayWidget(self.logger,
+                                                 self.decay_filename,
+                                                 self.pulse_extractor,
+                                                 parent=self))
+        self.add_lazy_widget("velocity", "Muon Velocity",
+                             lambda: VelocityWidget(self.logger,
+                                                    self.velocity_filename,
+                                                    self.pulse_extractor,
+                                                    parent=self))
         self.add_widget("status", "Status",
                         StatusWidget(self.logger, parent=self))
         self.add_widget("daq", "DAQ Output",
@@ -217,6 +243,44 @@ class Application(QtGui.QMainWindow):
         self.add_widget("gps", "GPS Output",
                         GPSWidget(self.logger, parent=self))
 
+    def setup_message_handlers(self):
+        """
+        Registers the handlers of the control messages.
+
+        :returns: None
+        """
+        rate_widget = self.get_widget("rate")
+
+        self.message_handlers["TL"] = self.get_thresholds_from_msg
+        self.message_handlers["DL"] = self.get_distances_from_msg
+        self.message_handlers["DC"] = self.handle_channel_msg
+        self.message_handlers["DS"] = lambda msg: rate_widget.calculate()
+
+        self.update_message_consumers()
+
+    def update_message_consumers(self):
+        """
+        Caches the widgets which currently get all control messages. Gets
+        called whenever a widget is activated or deactivated.
+
+        :returns: None
+        """
+        gps_widget = self.get_widget("gps", create=False)
+        status_widget = self.get_widget("status", create=False)
+        decay_widget = self.get_widget("decay", create=False)
+
+        self._gps_consumer = None
+        self._status_consumer = None
+        self._decay_consumer = None
+
+        if (gps_widget is not None and gps_widget.active() and
+                gps_widget.isEnabled()):
+            self._gps_consumer = gps_widget.update
+        if status_widget is not None and status_widget.active():
+            self._status_consumer = status_widget.update
+        if decay_widget is not None and decay_widget.active():
+            self._decay_consumer = decay_widget
+
     def setup_plot_style(self):
         """
         Setup the plot style depending on screen size.
@@ -347,36 +411,113 @@ class Application(QtGui.QMainWindow):
                 self.tab_widget.addTab(widget, label)
                 self._widgets[name] = widget
 
+                if name in self.DYNAMIC_WIDGETS:
+                    self.refresh_scheduler.add(name, widget)
+
+    def add_lazy_widget(self, name, label, factory):
+        """
+        Adds a tab for a widget which is created when the tab is shown
+        or the widget is requested with get_widget for the first time.
+
+        Raises WidgetWithNameExistsError if a widget of that name already
+        exists.
+
+        :param name: widget name
+        :type name: str
+        :param label: the tab label
+        :type label: str
+        :param factory: function creating the widget
+        :type factory: callable
+        :returns: None
+        :raises: WidgetWithNameExistsError
+        """
+        if self.have_widget(name):
+            raise WidgetWithNameExistsError(
+                    "widget with name '%s' already exists" % name)
+
+        page = QtGui.QWidget(self)
+        page_layout = QtGui.QVBoxLayout(page)
+        page_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.tab_widget.addTab(page, label)
+        self._lazy_widgets[name] = (factory, page)
+
+    def _create_lazy_widget(self, name):
+        """
+        Creates a widget added with add_lazy_widget and puts it on its tab.
+
+        :param name: widget name
+        :type name: str
+        :returns: object
+        """
+        factory, page = self._lazy_widgets.pop(name)
+
+        created = time.time()
+        widget = factory()
+        page.layout().addWidget(widget)
+        self._widgets[name] = widget
+
+        if name in self.DYNAMIC_WIDGETS:
+            self.refresh_scheduler.add(name, widget)
+
+        self.logger.debug("Created widget '%s' in %.3f s" %
+                          (name, time.time() - created))
+        return widget
+
+    def on_tab_changed(self, index):
+        """
+        Creates the widget of the shown tab if it does not exist yet.
+
+        :param index: index of the shown tab
+        :type index: int
+        :returns: None
+        """
+        page = self.tab_widget.widget(index)
+
+        for name, (factory, lazy_page) in list(self._lazy_widgets.items()):
+            if lazy_page is page:
+                self._create_lazy_widget(name)
+                break
+
     def have_widget(self, name):
         """
         Returns true if widget with name exists, False otherwise.
+        Widgets which are not created yet exist as well.
 
         :param name: widget name
         :type name: str
         :returns: bool
         """
-        return name in self._widgets
+        return name in self._widgets or name in self._lazy_widgets
 
-    def get_widget(self, name):
+    def get_widget(self, name, create=True):
         """
-        Retrieved a widget from the store.
+        Retrieved a widget from the store. Widgets which are not created
+        yet are created, unless 'create' is False.
 
         :param name: widget name
         :type name: str
+        :param create: create the widget if needed
+        :type create: bool
         :returns: object
         """
+        if create and name in self._lazy_widgets:
+            return self._create_lazy_widget(name)
         return self._widgets.get(name)
 
     def is_widget_active(self, name):
         """
-        Returns True if the widget exists and is active, False otherwise
+        Returns True if the widget exists and is active, False otherwise.
+        Widgets which are not created yet are not active.
 
         :param name: widget name
         :type name: str
         :returns: bool
         """
-        if self.have_widget(name):
-            return self.get_widget(name).active()
+        widget = self.get_widget(name, create=False)
+
+        if widget is not None:
+            return widget.active()
         return False
 
     def threshold_menu(self):
@@ -614,7 +755,8 @@ class Application(QtGui.QMainWindow):
             self.daq.put("WC 02 %s" % gate_width_02)
 
             # adjust the update interval
-            self.widget_updater.start(time_window * 1000)
+            self.scalar_timer.start(time_window * 1000)
+            self.refresh_scheduler.set_interval(time_window)
 
             self.logger.debug("Writing gate width WC 02 %s WC 03 %s" %
                               (gate_width_02, gate_width_03))
@@ -672,7 +814,8 @@ class Application(QtGui.QMainWindow):
 
     def get_thresholds_from_msg(self, msg):
         """
-        Explicitly scan message for threshold information.
+        Explicitly scan message for threshold information, see
+        muonic.daq.messages.parse_thresholds.
 
         Return True if found, False otherwise.
 
@@ -680,246 +823,180 @@ class Application(QtGui.QMainWindow):
         :type msg: str
         :returns: bool
         """
-        if msg.startswith('TL') and len(msg) > 9:
-            msg = msg.split('=')
-            update_setting("threshold_ch0", int(msg[1][:-2]))
-            update_setting("threshold_ch1", int(msg[2][:-2]))
-            update_setting("threshold_ch2", int(msg[3][:-2]))
-            update_setting("threshold_ch3", int(msg[4]))
-            self.logger.debug("Got Thresholds %d %d %d %d" %
-                              tuple([get_setting("threshold_ch%d" % i)
-                                     for i in range(4)]))
-            return True
-        else:
-            return False
+        return parse_thresholds(msg, self.logger)
 
     def get_distances_from_msg(self, msg):
         """
-        Explicitly scan message for distance information.
+        Explicitly scan message for distance information, see
+        muonic.daq.messages.parse_distances.
 
         Return True if found, False otherwise.
+
         :param msg: daq message
         :type msg: str
         :returns: bool
         """
-        if msg.startswith('DL') and len(msg) > 9:
-            msg = msg.split('=')
-            update_setting("distance_ch0", int(msg[1][:-2]))
-            update_setting("distance_ch1", int(msg[2][:-2]))
-            update_setting("distance_ch2", int(msg[3][:-2]))
-            update_setting("distance_ch3", int(msg[4]))
-            self.logger.debug("Got Distances %d %d %d %d" %
-                              tuple([get_setting("distance_ch%d" % i)
-                                     for i in range(4)]))
-            print ("Got Distances %d %d %d %d" %
-                              tuple([get_setting("distance_ch%d" % i)
-                                     for i in range(4)]))
-
-            return True
-        else:
-            return False
-        
+        return parse_distances(msg, self.logger)
+
     def get_channels_from_msg(self, msg):
         """
-        Explicitly scan message for channel information.
+        Explicitly scan message for channel information, see
+        muonic.daq.messages.parse_channel_config.
 
         Return True if found, False otherwise.
 
-        DC gives:
-
-        DC C0=23 C1=71 C2=0A C3=00
-        
-        Which has the meaning:
-
-        MM - 00 -> 8bits for channel enable/disable, coincidence and veto
-
-        +---------------------------------------------------------------------+
-        |                              bits                                   |
-        +====+====+===========+===========+========+========+========+========+
-        |7   |6   |5          |4          |3       |2       |1       |0       |
-        +----+----+-----------+-----------+--------+--------+--------+--------+
-        |veto|veto|coincidence|coincidence|channel3|channel2|channel1|channel0|
-        +----+----+-----------+-----------+--------+--------+--------+--------+
-
-        +-----------------+
-        |Set bits for veto|
-        +=================+
-        |00 - ch0 is veto |
-        +-----------------+
-        |01 - ch1 is veto |
-        +-----------------+
-        |10 - ch2 is veto |
-        +-----------------+
-        |11 - ch3 is veto |
-        +-----------------+
-
-        +------------------------+
-        |Set bits for coincidence|
-        +========================+
-        |00 - singles            |
-        +------------------------+
-        |01 - twofold            |
-        +------------------------+
-        |10 - threefold          |
-        +------------------------+
-        |11 - fourfold           |
-        +------------------------+
-
         :param msg: daq message
         :type msg: str
         :returns: bool
         """
-        if msg.startswith('DC ') and len(msg) > 25:
-            msg = msg.split(' ')
+        return parse_channel_config(msg, self.logger)
 
-            coincidence_time = msg[4].split('=')[1] + msg[3].split('=')[1]
-            msg = bin(int(msg[1][3:], 16))[2:].zfill(8)
-            veto_config = msg[0:2]
-            coincidence_config = msg[2:4]
-            channel_config = msg[4:8]
+    def subscribe_analysis(self, name, callback):
+        """
+        Subscribe to the results of an analysis. The callback gets called
+        in the gui thread with every result the analysis published since
+        the last batch of the analysis worker.
 
-            update_setting("gate_width", int(coincidence_time, 16) * 10)
+        :param name: analysis name
+        :type name: str
+        :param callback: function taking the result
+        :type callback: callable
+        :returns: None
+        """
+        callbacks = self._analysis_subscribers.setdefault(name, [])
 
-            # set default veto config
-            for i in range(4):
-                if i == 0:
-                    update_setting("veto", True)
-                else:
-                    update_setting("veto_ch%d" % (i - 1), False)
+        if callback not in callbacks:
+            callbacks.append(callback)
 
-            # update channel config
-            for i in range(4):
-                update_setting("active_ch%d" % i,
-                               channel_config[3 - i] == '1')
-
-            # update coincidence config
-            for i, seq in enumerate(['00', '01', '10', '11']):
-                update_setting("coincidence%d" % i,
-                               coincidence_config == seq)
-
-            # update veto config
-            for i, seq in enumerate(['00', '01', '10', '11']):
-                if veto_config == seq:
-                    if i == 0:
-                        update_setting("veto", False)
-                    else:
-                        update_setting("veto_ch%d" % (i - 1), True)
-
-            self.logger.debug('gate width timew indow %d ns' %
-                              get_setting("gate_width"))
-            self.logger.debug("Got channel configurations: %d %d %d %d" %
-                              tuple([get_setting("active_ch%d" % i)
-                                     for i in range(4)]))
-            self.logger.debug("Got coincidence configurations: %d %d %d %d" %
-                              tuple([get_setting("coincidence%d" % i)
-                                     for i in range(4)]))
-            self.logger.debug("Got veto configurations: %d %d %d %d" %
-                              tuple([get_setting("veto")] +
-                                    [get_setting("veto_ch%d" % i)
-                                     for i in range(3)]))
-
-            return True
-        else:
-            return False
+        self.analysis_pipeline.publish(name)
 
-    def process_incoming(self):
+    def publish_batch(self, batch):
         """
-        This functions gets everything out of the daq.
+        Queues a batch of the analysis worker for the gui thread and wakes
+        it up. This is called from the analysis thread.
 
-        Handles all the messages currently in the daq
-        and passes the results to the corresponding widgets.
+        :param batch: results of the analysis worker
+        :type batch: muonic.analysis.pipeline.AnalysisBatch
+        :returns: None
+        """
+        self.batches.put(batch)
+        self.wakeup_pipe.notify()
+
+    def process_batches(self, *args):
+        """
+        Handles the queued batches of the analysis worker until the time
+        budget is used up. The remaining batches are handled after the
+        pending events, so repainting is not starved during bursts.
 
+        :param args: socket of the wakeup notifier
         :returns: None
         """
-        while self.daq.data_available():
+        self.wakeup_pipe.clear()
+        deadline = time.time() + self.BATCH_TIME_BUDGET
+
+        while time.time() < deadline:
             try:
-                msg = self.daq.get(0)
-            except DAQIOError:
-                self.logger.debug("Queue empty!")
-                return None
+                batch = self.batches.get_nowait()
+            except queue.Empty:
+                return
+            self.process_batch(batch)
 
-            # make daq msg public for child widgets
-            self.last_daq_msg = msg
+        if not self.batches.empty():
+            QtCore.QTimer.singleShot(0, self.process_batches)
 
-            # Check contents of message and do what it says
-            self.get_widget("daq").update()
-            
-            gps_widget = self.get_widget("gps")
-
-            # try to extract GPS information if widget is active and enabled
-            if gps_widget.active() and gps_widget.isEnabled():
-                gps_widget.update()
-                continue
-                
-            status_widget = self.get_widget("status")
-
-            # update status widget if active
-            if status_widget.isVisible() and status_widget.active():
-                status_widget.update()
-
-            decay_widget = self.get_widget("decay")
-
-            # update previous coincidence config on decay widget if active
-            if msg.startswith('DC') and len(msg) > 2 and decay_widget.active():
-                try:
-                    split_msg = msg.split(" ")
-                    t_03 = split_msg[4].split("=")[1]
-                    t_02 = split_msg[3].split("=")[1]
-                    decay_widget.set_previous_coincidence_times(t_03, t_02)
-                except Exception:
-                    self.logger.debug('Wrong DC command.')
-                continue
-
-            # check for threshold information
-            if self.get_thresholds_from_msg(msg):
-                continue
-
-            # check for distance information
-            if self.get_distances_from_msg(msg):
-                continue
-
-            # check for channel configuration
-            if self.get_channels_from_msg(msg):
-                continue
-
-            # ignore status messages
-            if msg.startswith('ST') or len(msg) < 50:
-                continue
-
-            # calculate rate
-            if self.get_widget("rate").calculate():
-                continue
-
-            # extract pulses if needed
-            if (get_setting("write_pulses") or
-                    self.is_widget_active("pulse") or
-                    self.is_widget_active("decay") or
-                    self.is_widget_active("velocity")):
-                self.pulses = self.pulse_extractor.extract(msg)
-
-            # trigger calculation on all pulse widgets
-            self.calculate_pulses()
-
-    def calculate_pulses(self):
-        """
-        Runs the calculate function of pulse widgets if they are active
-        and pulses are available.
+    def process_incoming(self):
+        """
+        Handles everything the analysis worker collected so far without
+        waiting for its next batch.
+
+        :returns: None
+        """
+        while not self.batches.empty():
+            self.process_batch(self.batches.get_nowait())
+        self.process_batch(self.analysis_pipeline.take_batch())
+
+    def process_batch(self, batch):
+        """
+        Passes a batch of the analysis worker to the corresponding widgets.
+
+        :param batch: results of the analysis worker
+        :type batch: muonic.analysis.pipeline.AnalysisBatch
+        :returns: None
+        """
+        self.get_widget("daq").update(batch.log)
+
+        for msg in batch.messages:
+            self.process_message(msg)
+
+        for name, results in batch.results.items():
+            for callback in self._analysis_subscribers.get(name, []):
+                for result in results:
+                    callback(result)
+
+        if batch.last_event is not None:
+            self.pulses = batch.last_event
+
+        if batch.events and self.is_widget_active("pulse"):
+            self.get_widget("pulse").add_events(batch.events)
+
+    def process_message(self, msg):
+        """
+        Handles a control message of the DAQ, e.g. the answer to a command
+        or the scalars.
 
+        :param msg: DAQ message
+        :type msg: str
         :returns: None
         """
-        for widget in self.pulse_widgets:
-            if widget.active() and (self.pulses is not None):
-                widget.calculate(self.pulses)
+        # make daq msg public for child widgets
+        self.last_daq_msg = msg
+
+        # the GPS widget reads all messages while it is active
+        if self._gps_consumer is not None:
+            self._gps_consumer()
+            return
+
+        if self._status_consumer is not None:
+            self._status_consumer()
 
-    def update_dynamic(self):
+        handler = self.message_handlers.get(msg[:2])
+
+        if handler is not None:
+            handler(msg)
+
+    def handle_channel_msg(self, msg):
         """
-        Update dynamic widgets.
+        Handles the channel configuration. While the decay widget is
+        active it only gets the coincidence times of the configuration.
 
+        :param msg: DAQ message
+        :type msg: str
         :returns: None
         """
-        for widget in self.dynamic_widgets:
-            if widget.active():
-                widget.update()
+        # update previous coincidence config on decay widget if active
+        if self._decay_consumer is not None:
+            coincidence_times = parse_coincidence_times(msg)
+
+            if coincidence_times is not None:
+                self._decay_consumer.set_previous_coincidence_times(
+                        *coincidence_times)
+            elif len(msg) > 2:
+                self.logger.debug('Wrong DC command.')
+            return
+
+        self.get_channels_from_msg(msg)
+
+    def query_scalars(self):
+        """
+        Query the scalars for the rate measurement, this ends the
+        current time window.
+
+        :returns: None
+        """
+        rate_widget = self.get_widget("rate")
+
+        if rate_widget.active():
+            rate_widget.query_daq_for_scalars()
 
     def closeEvent(self, ev):
         """
@@ -939,8 +1016,12 @@ class Application(QtGui.QMainWindow):
                                            QtGui.QMessageBox.No)
 
         if reply == QtGui.QMessageBox.Yes:
-            self.timer.stop()
-            self.widget_updater.stop()
+            # stop the analysis worker before closing the files
+            self.analysis_thread.stop()
+            self.wakeup_notifier.setEnabled(False)
+            self.wakeup_pipe.close()
+            self.scalar_timer.stop()
+            self.refresh_scheduler.stop()
 
             for key, widget in self._widgets.items():
                 # run finish hook on each widget, e.g. close and
@@ -1,11 +1,17 @@
 """
 Provides helper classes and function needed by the gui
 """
+from collections import deque, namedtuple
+import re
+import time
+
 from matplotlib.pylab import rc
 
 from PyQt4 import QtGui
 from PyQt4 import QtCore
 
+from muonic.analysis.pipeline import is_trigger_line
+
 
 class HistoryAwareLineEdit(QtGui.QLineEdit):
     """
@@ -58,6 +64,348 @@ class HistoryAwareLineEdit(QtGui.QLineEdit):
         self.hist_pointer = len(self.history)
 
 
+class DAQLogModel(QtCore.QAbstractListModel):
+    """
+    List model of the most recent DAQ messages. The messages are kept in a
+    ring of fixed size and the kinds of messages shown can be filtered.
+    New messages are collected and only passed on to the views on refresh,
+    so the views are not updated for every message.
+
+    :param capacity: maximum number of messages kept
+    :type capacity: int
+    :param parent: parent object
+    """
+    # kinds of messages
+    TRIGGER = "trigger"
+    STATUS = "status"
+    ERROR = "error"
+    OTHER = "other"
+
+    # prefixes of the periodic status messages
+    STATUS_PREFIXES = ("ST", "DS")
+
+    # answers of the DAQ reporting errors
+    ERROR_PATTERN = re.compile(r"error|invalid|unknown", re.IGNORECASE)
+
+    def __init__(self, capacity=10000, parent=None):
+        QtCore.QAbstractListModel.__init__(self, parent)
+        self.capacity = capacity
+
+        # messages and their kinds
+        self._ring = deque(maxlen=capacity)
+        self._pending = deque(maxlen=capacity)
+
+        # messages shown with the current filter
+        self._shown = deque()
+        self._kinds = set([self.TRIGGER, self.STATUS, self.ERROR,
+                           self.OTHER])
+
+    def classify(self, msg):
+        """
+        Get the kind of a message.
+
+        :param msg: DAQ message
+        :type msg: str
+        :returns: str
+        """
+        if msg.startswith(self.STATUS_PREFIXES):
+            return self.STATUS
+        if is_trigger_line(msg):
+            return self.TRIGGER
+        if self.ERROR_PATTERN.search(msg) is not None:
+            return self.ERROR
+        return self.OTHER
+
+    def add_messages(self, messages):
+        """
+        Collect new messages, they are shown on the next refresh.
+
+        :param messages: DAQ messages
+        :type messages: list of str
+        :returns: None
+        """
+        self._pending.extend(messages)
+
+    def has_pending(self):
+        """
+        Returns True if there are messages which are not shown yet.
+
+        :returns: bool
+        """
+        return len(self._pending) > 0
+
+    def refresh(self):
+        """
+        Move the collected messages into the ring and update the views.
+
+        :returns: None
+        """
+        if not self._pending:
+            return
+
+        new = [(msg, self.classify(msg)) for msg in self._pending]
+        self._pending.clear()
+
+        # messages pushed out of the ring, counting the shown ones
+        overflow = len(self._ring) + len(new) - self.capacity
+        dropped = 0
+
+        if overflow > 0:
+            for i in range(min(overflow, len(self._ring))):
+                if self._ring[i][1] in self._kinds:
+                    dropped += 1
+
+        new = new[-self.capacity:]
+        self._ring.extend(new)
+        shown = [msg for msg, kind in new if kind in self._kinds]
+
+        # new messages which did not even fit into the ring are not shown
+        dropped = min(dropped, len(self._shown))
+
+        if dropped:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, dropped - 1)
+            for _ in range(dropped):
+                self._shown.popleft()
+            self.endRemoveRows()
+
+        if shown:
+            first = len(self._shown)
+            self.beginInsertRows(QtCore.QModelIndex(), first,
+                                 first + len(shown) - 1)
+            self._shown.extend(shown)
+            self.endInsertRows()
+
+    def set_kinds(self, kinds):
+        """
+        Select the kinds of messages shown.
+
+        :param kinds: message kinds
+        :type kinds: iterable of str
+        :returns: None
+        """
+        self.beginResetModel()
+        self._kinds = set(kinds)
+        self._shown = deque(msg for msg, kind in self._ring
+                            if kind in self._kinds)
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        """
+        Number of messages shown.
+
+        :param parent: parent index
+        :type parent: QtCore.QModelIndex
+        :returns: int
+        """
+        if parent.isValid():
+            return 0
+        return len(self._shown)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """
+        Get a message.
+
+        :param index: index of the message
+        :type index: QtCore.QModelIndex
+        :param role: item data role
+        :type role: int
+        :returns: QtCore.QVariant
+        """
+        if (role != QtCore.Qt.DisplayRole or not index.isValid() or
+                index.row() >= len(self._shown)):
+            return QtCore.QVariant()
+        return QtCore.QVariant(self._shown[index.row()])
+
+
+# name of a widget, number of refreshes, skipped and deferred refreshes,
+# mean and maximum time of a refresh in seconds and the current refresh
+# interval in seconds
+RefreshStats = namedtuple("RefreshStats", ["name", "refreshes", "skipped",
+                                           "deferred", "mean_cost",
+                                           "max_cost", "interval"])
+
+
+class _RefreshEntry(object):
+    """
+    Refresh state and timings of a widget.
+
+    :param name: widget name
+    :type name: str
+    :param widget: the widget
+    :type widget: muonic.gui.widgets.BaseWidget
+    :param next_due: time of the first refresh
+    :type next_due: float
+    """
+
+    def __init__(self, name, widget, next_due):
+        self.name = name
+        self.widget = widget
+        self.next_due = next_due
+        self.refreshes = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.cost = 0.
+        self.max_cost = 0.
+        self.slowdown = 1.
+
+
+class RefreshScheduler(object):
+    """
+    Refreshes widgets every interval, spread over the ticks of a timer.
+    Widgets which are inactive, hidden or have no new data are skipped.
+    The time of each refresh is measured and a tick only refreshes widgets
+    as long as the frame budget is not used up, the others follow on the
+    next tick. Widgets which take longer than the frame budget are
+    refreshed less often, up to MAX_SLOWDOWN times the interval.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param interval: refresh interval in seconds
+    :type interval: float
+    :param parent: parent object of the timer
+    """
+    # time between two ticks in milliseconds
+    TICK_INTERVAL = 100
+
+    # time in seconds the widgets may take per tick
+    FRAME_BUDGET = 0.04
+
+    # largest factor the interval of slow widgets is stretched by
+    MAX_SLOWDOWN = 8.
+
+    # weight of the last refresh time in the mean refresh time
+    SMOOTHING = 0.3
+
+    def __init__(self, logger, interval, parent=None):
+        self.logger = logger
+        self.interval = interval
+        self._entries = []
+
+        self.timer = QtCore.QTimer(parent)
+        QtCore.QObject.connect(self.timer, QtCore.SIGNAL("timeout()"),
+                               self.tick)
+
+    def add(self, name, widget):
+        """
+        Add a widget. The first refreshes of the widgets are spread
+        over the interval, also for widgets added later on.
+
+        :param name: widget name
+        :type name: str
+        :param widget: the widget
+        :type widget: muonic.gui.widgets.BaseWidget
+        :returns: None
+        """
+        # steps of the golden ratio keep the phases apart for any number
+        # of widgets
+        phase = (len(self._entries) * 0.618034) % 1.
+
+        self._entries.append(_RefreshEntry(
+                name, widget, time.time() + self.interval * phase))
+
+    def set_interval(self, interval):
+        """
+        Set the refresh interval.
+
+        :param interval: refresh interval in seconds
+        :type interval: float
+        :returns: None
+        """
+        self.interval = interval
+
+        for entry in self._entries:
+            entry.next_due = min(entry.next_due,
+                                 time.time() + interval * entry.slowdown)
+
+    def start(self):
+        """
+        Start refreshing.
+
+        :returns: None
+        """
+        self.timer.start(self.TICK_INTERVAL)
+
+    def stop(self):
+        """
+        Stop refreshing.
+
+        :returns: None
+        """
+        self.timer.stop()
+
+    def tick(self):
+        """
+        Refresh the widgets which are due, oldest first, until the frame
+        budget is used up.
+
+        :returns: None
+        """
+        now = time.time()
+        spent = 0.
+
+        due = [entry for entry in self._entries if entry.next_due <= now]
+        due.sort(key=lambda entry: entry.next_due)
+
+        for entry in due:
+            widget = entry.widget
+
+            if not widget.active():
+                entry.next_due = now + self.interval
+                continue
+
+            if not (widget.changed() and widget.isVisible()):
+                # the data is drawn with the next refresh
+                entry.skipped += 1
+                entry.next_due = now + self.interval
+                continue
+
+            if spent > 0 and spent + entry.cost > self.FRAME_BUDGET:
+                # keep it due, it is refreshed first on the next tick
+                entry.deferred += 1
+                continue
+
+            start = time.time()
+            widget.changed(False)
+
+            try:
+                widget.update()
+            except Exception:
+                self.logger.exception("Error refreshing widget '%s'" %
+                                      entry.name)
+
+            cost = time.time() - start
+            spent += cost
+
+            if entry.refreshes:
+                entry.cost += self.SMOOTHING * (cost - entry.cost)
+            else:
+                entry.cost = cost
+
+            entry.refreshes += 1
+            entry.max_cost = max(entry.max_cost, cost)
+
+            slowdown = min(self.MAX_SLOWDOWN,
+                           max(1., entry.cost / self.FRAME_BUDGET))
+
+            if slowdown != entry.slowdown:
+                self.logger.debug("Refreshing widget '%s' every %.1f s" %
+                                  (entry.name, self.interval * slowdown))
+                entry.slowdown = slowdown
+
+            entry.next_due = now + self.interval * entry.slowdown
+
+    def get_stats(self):
+        """
+        Get the refresh timings of the widgets.
+
+        :returns: list of RefreshStats
+        """
+        return [RefreshStats(entry.name, entry.refreshes, entry.skipped,
+                             entry.deferred, entry.cost, entry.max_cost,
+                             self.interval * entry.slowdown)
+                for entry in self._entries]
+
+
 def set_large_plot_style():
     """
     Large fonts for large screens
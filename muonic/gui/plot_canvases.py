@@ -1,8 +1,16 @@
 """
 Provides the canvases for plots in muonic
 """
+from collections import deque
+
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
 from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.transforms import blended_transform_factory
+from muonic.analysis.histogram import FineHistogram
 from muonic.util import get_setting
+from muonic.util.ring_buffer import RingBuffer
 from matplotlib.backends.backend_qt4agg \
     import FigureCanvasQTAgg as FigureCanvas
 try:
@@ -87,6 +95,12 @@ class BaseHistogramCanvas(BasePlotCanvas):
     """
     A base class for all canvases with a histogram
 
+    The entries are counted in a fine grained histogram covering the
+    binning, the displayed bins are derived from it. The bars and error
+    bars are created once and redrawn with blitting, so an update costs the
+    same no matter how many entries have been collected. The whole figure
+    is only drawn again if the y-axis has to grow.
+
     :param parent: parent widget
     :param logger: logger object
     :type logger: logging.Logger
@@ -94,261 +108,379 @@ class BaseHistogramCanvas(BasePlotCanvas):
     :type binning: list or tuple or numpy.ndarray
     :param hist_color: the color of the histogram
     :type hist_color: str
+    :param resolution: bin width of the fine grained histogram, defaults
+                       to the width of the first bin
+    :type resolution: float
     :param kwargs: additional keyword arguments
     :param kwargs: dict
     """
 
-    def __init__(self, parent, logger, binning, hist_color="b", **kwargs):
+    def __init__(self, parent, logger, binning, hist_color="b",
+                 resolution=None, **kwargs):
         BasePlotCanvas.__init__(self, parent, logger, **kwargs)
 
         # setup binning
         self.binning = np.asarray(binning)
-        self.bincontent = np.zeros(len(self.binning))
-        self.hist_patches = self.ax.hist(np.array([self.binning[0] - 1]),
-                                         self.binning, fc=hist_color,
-                                         alpha=0.25)[2]
+        self.hist_color = hist_color
+
+        if resolution is None:
+            resolution = self.binning[1] - self.binning[0]
+
+        self.histogram = FineHistogram(self.binning[0], self.binning[-1],
+                                       resolution)
         self.heights = []
         self.dimension = r"$\mu$s"
 
-        # FIXME the current implementation does not know about outliers
-        self.underflow = 0
-        # FIXME the current implementation does not know about outliers
-        self.overflow = 0
-
         # fixed xrange for histogram
         self.xmin = self.binning[0]
         self.xmax = (self.binning[-1] +
                      (self.binning[:-1] - self.binning[1:])[-1])
+        self.ax.set_xlim(xmin=self.xmin, xmax=self.xmax)
+
+        self.hist_patches = []
+        self.error_lines = None
+        self._create_artists()
+
+        # background of the axes without bars and error bars, taken
+        # after each full draw
+        self.background = None
+        self.mpl_connect("draw_event", self._on_draw)
+
+    def _create_artists(self):
+        """
+        Create bars and error bars for the binning, they are
+        drawn by blitting only.
+
+        :returns: None
+        """
+        self.hist_patches = self.ax.hist(np.array([self.binning[0] - 1]),
+                                         self.binning, fc=self.hist_color,
+                                         alpha=0.25)[2]
+        self.error_lines = LineCollection([], colors="b")
+        self.ax.add_collection(self.error_lines)
+
+        for artist in self._animated_artists():
+            artist.set_animated(True)
+
+    def _animated_artists(self):
+        """
+        Artists changing with every update.
+
+        :returns: list
+        """
+        return list(self.hist_patches) + [self.error_lines]
+
+    def _on_draw(self, event):
+        """
+        Take the background after a full draw and draw the bars on it.
+
+        :param event: draw event
+        :type event: matplotlib.backend_bases.DrawEvent
+        :returns: None
+        """
+        self.background = self.copy_from_bbox(self.ax.bbox)
+
+        for artist in self._animated_artists():
+            self.ax.draw_artist(artist)
+
+    @property
+    def underflow(self):
+        """
+        Number of entries below the histogram range
+
+        :returns: int
+        """
+        return self.histogram.underflow
+
+    @property
+    def overflow(self):
+        """
+        Number of entries above the histogram range
+
+        :returns: int
+        """
+        return self.histogram.overflow
+
+    def get_bins(self):
+        """
+        Get the contents and edges of the displayed bins
+
+        :returns: tuple of numpy.ndarray
+        """
+        return self.histogram.rebin(self.binning), self.binning
+
+    def set_binning(self, binning):
+        """
+        Change the displayed binning, the bins are derived from the
+        collected entries. The edges should lie on the grid of the
+        fine grained histogram.
+
+        :param binning: bin edges
+        :type binning: list or tuple or numpy.ndarray
+        :returns: None
+        """
+        self.binning = np.asarray(binning)
+
+        for artist in self._animated_artists():
+            artist.remove()
+
+        self._create_artists()
+        self.background = None
+        self.update_plot([])
 
     def update_plot(self, data):
         """
         Update the plot
 
-        :param data: the data to plot
-        :type data: list of lists
+        :param data: the data to add to the histogram
+        :type data: list of floats
         :return: None
         """
-        if not data:
+        self.histogram.fill(data)
+
+        if not self.histogram.entries:
             return
 
-        # avoid memory leak
-        self.ax.clear()
-        if self.title is not None:
-            self.ax.set_title(self.title)
-
-        # we have to do some bad hacking here,
-        # because the p histogram is rather
-        # simple and it is not possible to add two of them...
-        # however, since we do not want to run into a memory leak
-        # and we also be not dependent on dashi (but maybe
-        # sometimes in the future?) we have to do it
-        # by manipulating rectangles...
-
-        # we want to find the non-empty bins
-        # tmp_hist is compatible with the decay_time hist...
-        tmp_hist = self.ax.hist(data, self.binning, fc="b", alpha=0.25)[0]
-
-        for hist_bin in enumerate(tmp_hist):
-            if hist_bin[1]:
-                self.hist_patches[hist_bin[0]].set_height(
-                        self.hist_patches[hist_bin[0]].get_height() +
-                        hist_bin[1])
-
-        # we want to get the maximum for the ylims
-        # self.heights contains the bincontent!
+        # the displayed bins are derived from the fine grained histogram,
+        # bars and error bars are just resized
+        heights = self.histogram.rebin(self.binning)
+        errors = np.sqrt(heights)
+        self.heights = list(heights)
 
-        self.heights = []
-        for patch in self.hist_patches:
-            self.heights.append(patch.get_height())
+        for patch, height in zip(self.hist_patches, heights):
+            patch.set_height(height)
 
-        self.logger.debug("Histogram patch heights %s" % self.heights)
-        self.ax.set_ylim(ymax=max([h+np.sqrt(h) for h in self.heights]) * 1.1)
-        self.ax.set_ylim(ymin=0)
-        self.ax.set_xlabel(self.xlabel)
-        self.ax.set_ylabel(self.ylabel)
-        self.ax.set_xlim(xmin=self.xmin, xmax=self.xmax)
+        bincenters = (self.binning[1:] + self.binning[:-1]) / 2.
+        segments = np.empty((len(heights), 2, 2))
+        segments[:, :, 0] = bincenters[:, np.newaxis]
+        segments[:, 0, 1] = heights - errors
+        segments[:, 1, 1] = heights + errors
+        self.error_lines.set_segments(segments)
 
-        # always get rid of unused stuff
-        del tmp_hist
+        ymax = (heights + errors).max() * 1.1
 
-        # try to add errorbars
-        bincenters = (self.binning[1:]+self.binning[:-1])/2.
-        for i, height in enumerate(self.heights):
-            self.ax.errorbar(bincenters[i], height,
-                     yerr=np.sqrt(height), color='b')
+        if self.background is None or ymax > self.ax.get_ylim()[1]:
+            # leave some room, so the axis does not grow with every update
+            self.ax.set_ylim(ymin=0, ymax=ymax * 1.2)
+            self.fig.canvas.draw()
+            return
 
-        # some beautification
-        self.ax.grid()
+        self.restore_region(self.background)
 
-        # we now have to pass our new patches
-        # to the figure we created..
-        self.ax.patches = self.hist_patches
-        self.fig.canvas.draw()
+        for artist in self._animated_artists():
+            self.ax.draw_artist(artist)
 
-    def show_fit(self, bin_centers, bincontent, fitx, decay, p, covar,
-                 chisquare, nbins):
+        self.blit(self.ax.bbox)
+
+    def show_fit(self, fit_result):
         """
         Plot the fit onto the diagram
 
-        :param bin_centers: bin centers
-        :param bincontent: bincontents
-        :param fitx: the fit
-        :type fitx: numpy.ndarray
-        :param decay: decay function
-        :type decay: function
-        :param p: fit parameters
-        :type p: list
-        :param covar: covariance matrix
-        :type covar: matrix
-        :param chisquare: chi-squared
-        :type chisquare: float
-        :param nbins: number of bins
-        :type nbins: int
+        :param fit_result: the result of the fit
+        :type fit_result: muonic.analysis.fit_engine.FitResult
         :returns: None
         """
+        fitx, fity = fit_result.curve()
 
         # clears a previous fit from the canvas
         self.ax.lines = []
-        self.ax.plot(bin_centers, bincontent, "b^", fitx, decay(p, fitx), "b-")
-
-        ## print fit function formula start
-        #x = bin_centers
-        #y = bincontent
-        #poly = pl.polyfit(x, y, 2)
-
-        #def poly2latex(poly, variable="x", width=2):
-        #  t = ["{0:0.{width}f}"]
-        #  t.append(t[-1] + " {variable}")
-        #  t.append(t[-1] + "^{1}")
-
-        #  def f():
-        #    for i, v in enumerate(reversed(poly)):
-        #      idx = i if i < 2 else 2
-        #      yield t[idx].format(v, i, variable=variable, width=width)
-
-        #  return "${}$".format("+".join(f()))
-
-        #self.ax.plot(x, y, "o", alpha=0.4)
-        #x2 = np.linspace(-2, 2, 100)
-        #y2 = np.polyval(poly, x2)
-        #self.ax.plot(x2, y2, lw=2, color="r")
-        #self.ax.text(x2[5], y2[5], poly2latex(poly), fontsize=16)
-        # print fit function formula end
+        self.ax.plot(fit_result.bin_centers, fit_result.bincontent, "b^",
+                     fitx, fity, "b-")
 
         # FIXME: this seems to crop the histogram
         # self.ax.set_ylim(0,max(bincontent)*1.2)
         self.ax.set_xlabel(self.xlabel)
         self.ax.set_ylabel(self.ylabel)
 
-        # compute the errors on the fit, nb that this calculation assumes that
-        # scipy.optimize.leastsq was used
-        error = []
-        for i in range(len(p)):
-            try:
-                error.append(np.absolute(covar[i][i]) ** 0.5)
-            except Exception:
-                error.append(0.00)
+        chisquare_format = "%4.2f"
+        if fit_result.reduced_chisquare > 10000:
+            chisquare_format = "%.4g"
 
-        perr_leastsq = np.array(error)
-
-        try:
-            if chisquare / (nbins-len(p)) > 10000:
-                self.ax.legend(("Data", ("Fit: (%4.2f $\pm$ %4.2f) %s \n" +
-                                     " chisq/ndf=%.4g") %
-                            (p[2], perr_leastsq[2], self.dimension,
-                             chisquare / (nbins-len(p)))), loc=1)
-            self.ax.legend(("Data", ("Fit: (%4.2f $\pm$ %4.2f) %s \n" +
-                                     " chisq/ndf=%4.2f") %
-                            (p[2], perr_leastsq[2], self.dimension,
-                             chisquare / (nbins-len(p)))), loc=1)
-        except TypeError:
-            if chisquare / (nbins-len(p)) > 10000:
-                self.ax.legend(("Data", ("Fit: (%4.2f $\pm$ %4.2f) %s \n" +
-                                     " chisq/ndf=%.4g") %
-                            (p[2], perr_leastsq[2], self.dimension,
-                             chisquare / (nbins-len(p)))), loc=1)
+        if np.isfinite(fit_result.error):
+            label = ("Fit: (%4.2f $\\pm$ %4.2f) %s \n chisq/ndf=" +
+                     chisquare_format) % (fit_result.value, fit_result.error,
+                                          self.dimension,
+                                          fit_result.reduced_chisquare)
+        else:
             self.logger.warn("Covariance Matrix is 'None', could " +
                              "not calculate fit error!")
-            self.ax.legend(("Data", ("Fit: (%4.2f) %s \n " +
-                                     " chisq/ndf=%4.2f") %
-                            (p[2], self.dimension,
-                             chisquare / (nbins-len(p)))), loc=1)
+            label = ("Fit: (%4.2f) %s \n chisq/ndf=" +
+                     chisquare_format) % (fit_result.value, self.dimension,
+                                          fit_result.reduced_chisquare)
 
+        self.ax.legend(("Data", label), loc=1)
         self.fig.canvas.draw()
 
 
 class PulseCanvas(BasePlotCanvas):
     """
-    Canvas to display pulses
+    Canvas to display pulses like an oscilloscope with persistence
+
+    The pulses of the last events are drawn on top of each other, older
+    events fade out. Each channel is drawn by one line collection which
+    is created once, on updates only its segments and colors are replaced.
 
     :param parent: parent widget
     :param logger: logger object
     :type logger: logging.Logger
+    :param persistence: number of events shown
+    :type persistence: int
     """
-    def __init__(self, parent, logger):
-        BasePlotCanvas.__init__(self, parent, logger, ymin=0, ymax=1.2,
-                                xmin=0, xmax=40, xlabel="Time (ns)",
+    CHANNEL_COLORS = ['b', 'g', 'r', 'c']
+    CHANNEL_LABELS = ['c0', 'c1', 'c2', 'c3']
+
+    # we have only the information that the pulse is over the threshold,
+    # besides that we do not have any information about its height
+    PULSE_HEIGHT = 1.0
+
+    # fraction of the latest falling edge added to the time axis
+    HEADROOM = 0.2
+
+    # opacity of the oldest event shown
+    MIN_ALPHA = 0.1
+
+    def __init__(self, parent, logger, persistence=20):
+        BasePlotCanvas.__init__(self, parent, logger, ymin=0, ymax=1.5,
+                                xmin=0, xmax=100, xlabel="Time (ns)",
                                 ylabel="ylabel", grid=True)
         self.ax.set_title("Oscilloscope")
         self.ax.yaxis.set_visible(False)
 
-    def update_plot(self, pulses):
-        # do a complete redraw of the plot to avoid memory leak!
-        self.ax.clear()
+        # pulses of the last events, newest last
+        self.events = deque(maxlen=persistence)
 
-        # set specific limits for x and y axes
-        self.ax.set_xlim(0, 100)
-        self.ax.set_ylim(ymax=1.5)
-        self.ax.grid()
-        self.ax.set_xlabel('Time (ns)')
-        self.ax.yaxis.set_visible(False)
-        self.ax.set_title("Oscilloscope")
+        # opacity and line width by age of the event, newest first
+        self.alphas = np.linspace(1., self.MIN_ALPHA, persistence)
+        self.widths = np.ones(persistence)
+        self.widths[0] = 2.
 
-        # and disable figure-wide auto scale
-        self.ax.set_autoscale_on(False)
+        self.base_colors = [np.array(to_rgba(color))
+                            for color in self.CHANNEL_COLORS]
+        self.collections = []
+
+        for color, label in zip(self.CHANNEL_COLORS, self.CHANNEL_LABELS):
+            collection = LineCollection([], colors=color, label=label)
+            self.ax.add_collection(collection)
+            self.collections.append(collection)
 
-        # we have only the information that the pulse is over the threshold,
-        # besides that we do not have any information about its height
-        # TODO: It would be nice to implement the thresholds as scaling factors
+        # the legend is created once from proxy lines
+        self.ax.legend([Line2D([], [], color=color, lw=2)
+                        for color in self.CHANNEL_COLORS],
+                       self.CHANNEL_LABELS, loc=1, ncol=5, mode="expand",
+                       borderaxespad=0., handlelength=1)
+        self.fig.canvas.draw()
+
+    def reset(self):
+        """
+        Remove all events.
 
-        colors = ['b', 'g', 'r', 'c']
-        labels = ['c0', 'c1', 'c2', 'c3']
+        :returns: None
+        """
+        self.events.clear()
+        self.redraw()
 
-        pulse_height = 1.0
-        pulse_max = []
+    def add_events(self, events):
+        """
+        Add events, they are shown on the next redraw.
+
+        :param events: pulses of the events, newest last
+        :type events: list
+        :returns: None
+        """
+        self.events.extend(event for event in events if event is not None)
 
+    def update_plot(self, pulses):
+        """
+        Add the pulses of an event and show them.
+
+        :param pulses: pulses of the event
+        :type pulses: tuple
+        :returns: None
+        """
         if pulses is None:
             self.logger.warning("Pulses have no value - " +
                                 "channels not connected?")
-        else:
-            for chan in enumerate(pulses[1:]):
-                for pulse in chan[1]:
-                    self.ax.plot([pulse[0], pulse[0], pulse[1], pulse[1]],
-                                 [0, pulse_height, pulse_height, 0],
-                                 colors[chan[0]], label=labels[chan[0]], lw=2)
-                    pulse_max.append(pulse[0])
-                    pulse_max.append(pulse[1])
-
-            pulse_max = max(pulse_max)*1.2
-            # TODO: the trick below does not really work as expected.
-            # if pulse_max < self.ax.get_xlim()[1]:
-            #    pulse_max = self.ax.get_xlim()[0]
-            self.ax.set_xlim(0, pulse_max)
-
-            try:
-                self.ax.legend(loc=1, ncol=5, mode="expand",
-                               borderaxespad=0., handlelength=1)
-            except Exception as e:
-                self.logger.info("An error with the legend occurred: %s" % e)
-                self.ax.legend(loc=2)
+            return
 
-            self.fig.canvas.draw()
+        self.add_events([pulses])
+        self.redraw()
+
+    def _channel_segments(self, channel):
+        """
+        Get the line segments of the pulses of a channel in all events,
+        oldest event first, and the age of their events.
+
+        :param channel: channel index
+        :type channel: int
+        :returns: tuple of numpy.ndarray
+        """
+        segments = []
+        ages = []
+
+        for age, event in enumerate(reversed(self.events)):
+            pulses = event[channel + 1]
+
+            if not pulses:
+                continue
+
+            # rising edge up, over the threshold until the falling edge
+            edges = np.asarray(pulses, dtype=float)
+            segment = np.empty((len(edges), 4, 2))
+            segment[:, :, 0] = edges[:, [0, 0, 1, 1]]
+            segment[:, :, 1] = [0, self.PULSE_HEIGHT, self.PULSE_HEIGHT, 0]
+            segments.append(segment)
+            ages.append(np.full(len(edges), age, dtype=int))
+
+        if not segments:
+            return np.empty((0, 4, 2)), np.empty(0, dtype=int)
+
+        # the newest event is drawn last, on top of the others
+        return np.concatenate(segments[::-1]), np.concatenate(ages[::-1])
+
+    def redraw(self):
+        """
+        Show the pulses of the stored events.
+
+        :returns: None
+        """
+        pulse_max = 0.
+
+        for channel, collection in enumerate(self.collections):
+            segments, ages = self._channel_segments(channel)
+
+            colors = np.tile(self.base_colors[channel], (len(ages), 1))
+            colors[:, 3] = self.alphas[ages]
+
+            collection.set_segments(segments)
+            collection.set_color(colors)
+            collection.set_linewidths(self.widths[ages])
+
+            if len(segments):
+                pulse_max = max(pulse_max, segments[:, :, 0].max())
+
+        # keep the time axis while the pulses fit
+        xmax = self.ax.get_xlim()[1]
+
+        if pulse_max > xmax or 0 < pulse_max * (1 + self.HEADROOM) < xmax / 2:
+            self.ax.set_xlim(0, pulse_max * (1 + self.HEADROOM))
+
+        self.fig.canvas.draw()
 
 
 class ScalarsCanvas(BasePlotCanvas):
     """
     A plot canvas to display scalars
 
+    The rates are kept in a ring buffer and shown by lines which are created
+    once. On updates only the line data is replaced and the lines are
+    redrawn with blitting. The axes are drawn again only if the lines leave
+    the axis limits, which are extended with some headroom.
+
+    Instead of the recent rates the canvas can show the whole run from a
+    rate archive, with the mean rates as lines and bands between the minimum
+    and maximum rates. Zooming in with the navigation toolbar fetches the
+    rates from finer levels of the archive.
+
     :param parent: parent widget
     :param logger: logger object
     :type logger: logging.Logger
@@ -359,7 +491,13 @@ class ScalarsCanvas(BasePlotCanvas):
     CHANNEL_COLORS = ['y', 'm', 'c', 'b']
     TRIGGER_COLOR = 'g'
 
-    def __init__(self, parent, logger, max_length=40):
+    # fraction of the shown range added to the axis limits
+    HEADROOM = 0.2
+
+    # maximum number of points fetched from the rate archive
+    ARCHIVE_POINTS = 2000
+
+    def __init__(self, parent, logger, max_length=1000):
 
         BasePlotCanvas.__init__(self, parent, logger, ymin=0, ymax=20,
                                 xlabel="Time (s)", ylabel="Rate (1/s)")
@@ -373,12 +511,78 @@ class ScalarsCanvas(BasePlotCanvas):
                    self.show_trigger = True
                 
         self.max_length = max_length
-        self.channel_data = [[], [], [], []]
-        self.trigger_data = []
-        self.time_data = []
+
+        # columns: time, rates of the four channels and trigger rate
+        self.history = RingBuffer(max_length, 6)
         self.time_window = 0
+
+        self.channel_lines = []
+        self.trigger_line = None
+        self.pending_text = None
+        self.line_config = None
+
+        # rate archive shown instead of the recent rates
+        self.archive = None
+        self.archive_origin = None
+        self.archive_zoomed = False
+        self.bands = []
+        self.xlim_callback = None
+        self._setting_limits = False
+
+        # background of the axes without the lines, taken after each
+        # full draw
+        self.background = None
+        self.mpl_connect("draw_event", self._on_draw)
         self.reset()
 
+    @property
+    def time_data(self):
+        """
+        Times of the buffered rates.
+
+        :returns: numpy.ndarray
+        """
+        return self.history.column(0)
+
+    @property
+    def channel_data(self):
+        """
+        Buffered rates of the four channels.
+
+        :returns: list of numpy.ndarray
+        """
+        return [self.history.column(ch + 1) for ch in range(4)]
+
+    @property
+    def trigger_data(self):
+        """
+        Buffered trigger rates.
+
+        :returns: numpy.ndarray
+        """
+        return self.history.column(5)
+
+    def _lines(self):
+        """
+        All lines of the plot.
+
+        :returns: list of matplotlib.lines.Line2D
+        """
+        return self.channel_lines + [self.trigger_line]
+
+    def _on_draw(self, event):
+        """
+        Take the background after a full draw and draw the lines on it.
+
+        :param event: draw event
+        :type event: matplotlib.backend_bases.DrawEvent
+        :returns: None
+        """
+        self.background = self.copy_from_bbox(self.ax.bbox)
+
+        for line in self._lines():
+            self.ax.draw_artist(line)
+
     def reset(self, show_pending=False):
         """
         Reset all cached plot data
@@ -387,6 +591,9 @@ class ScalarsCanvas(BasePlotCanvas):
         :type show_pending: bool
         :returns: None
         """
+        if self.xlim_callback is not None:
+            self.ax.callbacks.disconnect(self.xlim_callback)
+
         self.ax.clear()
         self.ax.grid()
         self.ax.set_xlabel(self.xlabel)
@@ -394,32 +601,216 @@ class ScalarsCanvas(BasePlotCanvas):
         self.ax.set_xlim((self.xmin, self.xmax))
         self.ax.set_ylim((self.ymin, self.ymax))
 
-        self.channel_data = [[], [], [], []]
-        self.trigger_data = []
-        self.time_data = []
+        self.history.clear()
         self.time_window = 0
+        self.line_config = None
+        self.bands = []
+
+        self.channel_lines = [
+            self.ax.plot([], [], c=self.CHANNEL_COLORS[ch],
+                         label=("ch%d" % ch), lw=2, marker='v',
+                         animated=True)[0] for ch in range(4)]
+        self.trigger_line = self.ax.plot([], [], c=self.TRIGGER_COLOR,
+                                         label='trg', lw=2, marker='x',
+                                         animated=True)[0]
+        self.trigger_line.set_visible(self.show_trigger)
+
+        self.xlim_callback = self.ax.callbacks.connect(
+                "xlim_changed", self._on_xlim_changed)
 
-        for ch in range(4):
-            self.ax.plot(self.time_data, self.channel_data[ch],
-                         c=self.CHANNEL_COLORS[ch],
-                         label=("ch%d" % ch), lw=3)
-        if self.show_trigger:
-            self.ax.plot(self.time_data, self.trigger_data, c='g',
-                         label='trigger', lw=3)
+        if self.archive is not None:
+            self.ax.set_xlabel("Time (h)")
+            for line in self._lines():
+                line.set_marker("None")
+
+        self.pending_text = None
 
         if show_pending:
             left, width = .25, .5
             bottom, height = .35, .8
             right = left + width
             top = bottom + height
-            self.ax.text(0.5 * (left + right), 0.5 * (bottom + top),
-                         'Measuring...', horizontalalignment='center',
-                         verticalalignment='center', fontsize=56, color='red',
-                         fontweight="heavy", alpha=.8, rotation=30,
-                         transform=self.fig.transFigure)
+            self.pending_text = self.ax.text(
+                    0.5 * (left + right), 0.5 * (bottom + top),
+                    'Measuring...', horizontalalignment='center',
+                    verticalalignment='center', fontsize=56, color='red',
+                    fontweight="heavy", alpha=.8, rotation=30,
+                    transform=self.fig.transFigure)
+
+        self.fig.canvas.draw()
+
+    def _update_legend(self, enabled_channels, show_trigger):
+        """
+        Show the enabled lines and their legend.
+
+        :param enabled_channels: enabled channels
+        :type enabled_channels: list of bool
+        :param show_trigger: show trigger in plot
+        :type show_trigger: bool
+        :returns: None
+        """
+        for ch, line in enumerate(self.channel_lines):
+            line.set_visible(enabled_channels[ch])
+        self.trigger_line.set_visible(show_trigger)
+
+        lines = [line for line in self._lines() if line.get_visible()]
+
+        try:
+            self.ax.legend(lines, [line.get_label() for line in lines],
+                           bbox_to_anchor=(0., 1.02, 1., .102), loc=3,
+                           ncol=max(len(lines), 1), mode="expand",
+                           borderaxespad=0., handlelength=2)
+        except Exception as e:
+            self.logger.info("An error with the legend occurred: %s" % e)
+            self.ax.legend(lines, [line.get_label() for line in lines],
+                           loc=2)
+
+    def _rescale(self):
+        """
+        Set the axis limits to the buffered data with some headroom.
+
+        :returns: None
+        """
+        times = self.time_data
+        rates = self.history.values()[:, 1:]
+
+        if not len(times):
+            return
+
+        ymax = rates.max() * 1.1
+
+        if ymax > 0:
+            self.ax.set_ylim(0, ymax * (1. + self.HEADROOM))
 
+        # do not set x-range if time_data consists of only one item to
+        # avoid matlibplot UserWarning
+        if len(times) > 1:
+            self.ax.set_xlim(times[0], times[-1] + self.HEADROOM *
+                             (times[-1] - times[0]))
+
+    def set_archive(self, archive):
+        """
+        Show the whole run from the rate archive instead of the recent
+        rates. None shows the recent rates again.
+
+        :param archive: rate archive
+        :type archive: muonic.analysis.rate_archive.RateArchive or None
+        :returns: None
+        """
+        self.archive = archive
+        self.archive_zoomed = False
+        self._remove_bands()
+
+        if archive is not None:
+            self.ax.set_xlabel("Time (h)")
+
+            for line in self._lines():
+                line.set_marker("None")
+
+            self._plot_archive()
+            return
+
+        self.ax.set_xlabel(self.xlabel)
+
+        for line in self.channel_lines:
+            line.set_marker("v")
+        self.trigger_line.set_marker("x")
+
+        times = self.time_data
+
+        for ch, line in enumerate(self.channel_lines):
+            line.set_data(times, self.history.column(ch + 1))
+        self.trigger_line.set_data(times, self.trigger_data)
+
+        self._setting_limits = True
+        self._rescale()
+        self._setting_limits = False
         self.fig.canvas.draw()
 
+    def _remove_bands(self):
+        """
+        Remove the bands between minimum and maximum rates.
+
+        :returns: None
+        """
+        for band in self.bands:
+            band.remove()
+        self.bands = []
+
+    def _plot_archive(self, start=None, end=None):
+        """
+        Show the rates between start and end from the archive. Without
+        start and end the whole run is shown and the axis limits are set.
+
+        :param start: earliest time as unix timestamp
+        :type start: float
+        :param end: latest time as unix timestamp
+        :type end: float
+        :returns: None
+        """
+        series = self.archive.fetch(start, end, self.ARCHIVE_POINTS)
+
+        if series is None or not len(series.times):
+            return
+
+        if start is None:
+            self.archive_origin = self.archive.time_range()[0]
+
+        # consolidated rates are shown in the middle of their slot
+        hours = (series.times + 0.5 * series.step -
+                 self.archive_origin) / 3600.
+
+        self._remove_bands()
+
+        for index, line in enumerate(self._lines()):
+            line.set_data(hours, series.mean[:, index])
+
+            if line.get_visible():
+                self.bands.append(self.ax.fill_between(
+                        hours, series.minimum[:, index],
+                        series.maximum[:, index], color=line.get_color(),
+                        alpha=0.2, lw=0))
+
+        if start is None:
+            visible = [index for index, line in enumerate(self._lines())
+                       if line.get_visible()]
+            ymax = series.maximum[:, visible].max() if visible else 0
+
+            self._setting_limits = True
+
+            if ymax > 0:
+                self.ax.set_ylim(0, ymax * 1.1)
+            if hours[-1] > hours[0]:
+                self.ax.set_xlim(hours[0], hours[-1])
+
+            self._setting_limits = False
+
+        self.draw_idle()
+
+    def _on_xlim_changed(self, ax):
+        """
+        Fetch the rates of the shown time range from the archive after
+        zooming or panning.
+
+        :param ax: the axes
+        :type ax: matplotlib.axes.Axes
+        :returns: None
+        """
+        if (self.archive is None or self._setting_limits or
+                self.archive_origin is None):
+            return
+
+        self.archive_zoomed = True
+
+        xmin, xmax = ax.get_xlim()
+        self._setting_limits = True
+
+        try:
+            self._plot_archive(self.archive_origin + xmin * 3600.,
+                               self.archive_origin + xmax * 3600.)
+        finally:
+            self._setting_limits = False
+
     #def update_plot(self, data, show_trigger=True,
     #                enabled_channels=DEFAULT_CHANNEL_CONFIG):
     def update_plot(self, data, show_trigger,
@@ -435,64 +826,92 @@ class ScalarsCanvas(BasePlotCanvas):
         :type enabled_channels: list of bool
         :returne: None
         """
-        # do a complete redraw of the plot to avoid memory leak!
-        self.ax.clear()
-        self.show_trigger = show_trigger
+        self.add_rates(data)
+        self.redraw(show_trigger, enabled_channels)
 
-        self.ax.grid()
-        self.ax.set_xlabel(self.xlabel)
-        self.ax.set_ylabel(self.ylabel)
+    def add_rates(self, data):
+        """
+        Add rates to the ring buffer, they are shown on the next redraw.
 
+        :param data: rates of the channels and the trigger followed by
+                     the time window
+        :type data: list
+        :returns: None
+        """
         self.logger.debug("result : %s" % data)
 
-        # update lines data using the lists with new data
         self.time_window += data[5]
-        self.time_data.append(self.time_window)
+        self.history.append([self.time_window] + list(data[:5]))
 
-        for ch in range(4):
-            self.channel_data[ch].append(data[ch])
-            if enabled_channels[ch]:
-                self.ax.plot(self.time_data, self.channel_data[ch],
-                             c=self.CHANNEL_COLORS[ch],
-                             label=("ch%d" % ch), lw=2, marker='v')
+    def redraw(self, show_trigger, enabled_channels=DEFAULT_CHANNEL_CONFIG):
+        """
+        Show the rates in the ring buffer.
 
-        self.trigger_data.append(data[4])
+        :param show_trigger: show trigger in plot
+        :type show_trigger: bool
+        :param enabled_channels: enabled channels
+        :type enabled_channels: list of bool
+        :returns: None
+        """
+        self.show_trigger = show_trigger
+
+        if not len(self.history):
+            return
 
-        if self.show_trigger:
-            self.ax.plot(self.time_data, self.trigger_data,
-                         c=self.TRIGGER_COLOR,
-                         label='trg', lw=2, marker='x')
+        if self.archive is not None:
+            line_config = tuple(enabled_channels) + (show_trigger,)
 
-        try:
-            # get count of active cannels
-            channels = enabled_channels + [show_trigger]
-            active_count = sum(channels)
+            if line_config != self.line_config:
+                self.line_config = line_config
+                self._update_legend(enabled_channels, show_trigger)
 
-            self.ax.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3,
-                           ncol=active_count, mode="expand", borderaxespad=0.,
-                           handlelength=2)
-        except Exception as e:
-            self.logger.info("An error with the legend occurred: %s" % e)
-            self.ax.legend(loc=2)
+            if self.pending_text is not None:
+                self.pending_text.remove()
+                self.pending_text = None
 
-        if len(self.channel_data[0]) > self.max_length:
-            for ch in range(4):
-                self.channel_data[ch].remove(self.channel_data[ch][0])
-            self.trigger_data.remove(self.trigger_data[0])
-            self.time_data.remove(self.time_data[0])
+            # the run is followed until the user zooms in
+            if not self.archive_zoomed:
+                self._plot_archive()
+            return
 
-        ma = max(max(self.channel_data[0]), max(self.channel_data[1]),
-                 max(self.channel_data[2]), max(self.channel_data[3]),
-                 max(self.trigger_data))
+        times = self.time_data
 
-        self.ax.set_ylim(0, ma * 1.1)
+        for ch, line in enumerate(self.channel_lines):
+            line.set_data(times, self.history.column(ch + 1))
+        self.trigger_line.set_data(times, self.trigger_data)
 
-        # do not set x-range if time_data consists of only one item to
-        # avoid matlibplot UserWarning
-        if len(self.time_data) > 1:
-            self.ax.set_xlim(self.time_data[0], self.time_data[-1])
+        redraw = self.background is None
 
-        self.fig.canvas.draw()
+        line_config = tuple(enabled_channels) + (show_trigger,)
+
+        if line_config != self.line_config:
+            self.line_config = line_config
+            self._update_legend(enabled_channels, show_trigger)
+            redraw = True
+
+        if self.pending_text is not None:
+            self.pending_text.remove()
+            self.pending_text = None
+            redraw = True
+
+        xmax = self.ax.get_xlim()[1]
+        ymax = self.ax.get_ylim()[1]
+
+        if (len(times) > 1 and times[-1] > xmax) or \
+                self.history.last()[1:].max() * 1.1 > ymax:
+            redraw = True
+
+        if redraw:
+            self._rescale()
+            self.fig.canvas.draw()
+            return
+
+        self.restore_region(self.background)
+
+        for line in self._lines():
+            self.ax.draw_artist(line)
+
+        self.blit(self.ax.bbox)
 
 
 class LifetimeCanvas(BaseHistogramCanvas):
@@ -510,6 +929,7 @@ class LifetimeCanvas(BaseHistogramCanvas):
         BaseHistogramCanvas.__init__(
                 self, parent, logger,
                 np.linspace(binning[0], binning[1], binning[2]),
+                resolution=0.01,
                 xlabel="Time between Pulses ($\mu$s)", ylabel="Events")
 
 
@@ -527,7 +947,7 @@ class VelocityCanvas(BaseHistogramCanvas):
         BaseHistogramCanvas.__init__(
                 self, parent, logger,
                 np.linspace(binning[0], binning[1], binning[2]),
-                xmin=0., xmax=30, ymin=0, ymax=2,
+                resolution=0.25, xmin=0., xmax=30, ymin=0, ymax=2,
                 ylabel="Events", xlabel="Flight Time (ns)")
         self.dimension = r"$ns$"
 
@@ -536,24 +956,79 @@ class PulseWidthCanvas(BaseHistogramCanvas):
     """
     A simple histogram for the use with pulse width measurement
 
+    The median and the 5% and 95% quantiles of the pulse widths can be
+    marked by vertical lines, they are redrawn with the histogram.
+
     :param parent: parent widget
     :param logger: logger object
     :type logger: logging.Logger
     :param hist_color: the color of the histogram
     :type hist_color: str
     """
+    # quantiles shown, kept when the binning changes
+    quantile_summary = None
+
     def __init__(self, parent, logger, hist_color="r", title=None):
         BaseHistogramCanvas.__init__(
-                self, parent, logger, np.linspace(0., 100, 30),
-                hist_color=hist_color, xmin=0., xmax=100, ymin=0, ymax=2,
+                self, parent, logger, np.linspace(0., 100, 26),
+                hist_color=hist_color, resolution=1., xmin=0., xmax=100,
+                ymin=0, ymax=2,
                 ylabel="Events", xlabel="Pulse Width (ns)")
         self.ax_title = title if title is not None else "Pulse Widths"
         self.ax.set_title(self.ax_title)
         self.ax.figure.tight_layout()
         self.fig.canvas.draw()
 
-    def update_plot(self, data):
-        BaseHistogramCanvas.update_plot(self, data)
-        self.ax.set_title(self.ax_title)
-        self.ax.figure.tight_layout()
-        self.fig.canvas.draw()
+    def _create_artists(self):
+        """
+        Create bars, error bars and the quantile lines and label.
+
+        :returns: None
+        """
+        # vertical lines spanning the axes at x positions in data units
+        self.quantile_lines = LineCollection(
+                [], colors="k", linestyles=["dotted", "dashed", "dotted"],
+                transform=blended_transform_factory(self.ax.transData,
+                                                    self.ax.transAxes))
+        self.ax.add_collection(self.quantile_lines)
+        self.quantile_text = self.ax.text(0.98, 0.95, "",
+                                          horizontalalignment="right",
+                                          verticalalignment="top",
+                                          transform=self.ax.transAxes)
+
+        if self.quantile_summary is not None:
+            self.set_quantiles(self.quantile_summary)
+
+        BaseHistogramCanvas._create_artists(self)
+
+    def _animated_artists(self):
+        """
+        Artists changing with every update.
+
+        :returns: list
+        """
+        return (BaseHistogramCanvas._animated_artists(self) +
+                [self.quantile_lines, self.quantile_text])
+
+    def set_quantiles(self, summary):
+        """
+        Mark the median and the 5% and 95% quantiles with the next update.
+
+        :param summary: summary of a quantile sketch, see
+                        muonic.analysis.quantiles.QuantileSketch.summary
+        :type summary: dict
+        :returns: None
+        """
+        self.quantile_summary = summary
+
+        if not summary["count"]:
+            self.quantile_lines.set_segments([])
+            self.quantile_text.set_text("")
+            return
+
+        self.quantile_lines.set_segments(
+                [[(summary[key], 0), (summary[key], 1)]
+                 for key in ("p5", "median", "p95")])
+        self.quantile_text.set_text(
+                "median %.1f ns\n90%% in [%.1f, %.1f] ns" %
+                (summary["median"], summary["p5"], summary["p95"]))
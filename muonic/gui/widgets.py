@@ -19,16 +19,22 @@ from PyQt4 import QtGui
 from PyQt4 import QtCore
 
 from muonic.daq.provider import BaseDAQProvider
-from muonic.gui.helpers import HistoryAwareLineEdit
+from muonic.gui.helpers import HistoryAwareLineEdit, DAQLogModel
 from muonic.gui.plot_canvases import ScalarsCanvas, LifetimeCanvas
 from muonic.gui.plot_canvases import PulseCanvas, PulseWidthCanvas
 from muonic.gui.plot_canvases import VelocityCanvas
 from muonic.gui.dialogs import DecayConfigDialog, DistanceDialog
 from muonic.gui.dialogs import VelocityConfigDialog, FitRangeConfigDialog
-from muonic.analysis import fit, gaussian_fit
-from muonic.analysis import VelocityTrigger, DecayTriggerThorough
+from muonic.analysis import FitEngine, ExponentialModel, GaussianModel
+from muonic.analysis import BackgroundFitter
+from muonic.analysis import PulseWidthAnalysis, VelocityAnalysis
+from muonic.analysis import DecayAnalysis, StreamingDecayAnalysis
+from muonic.analysis import OnlineLifetimeEstimator, UnbinnedFitWorker
+from muonic.analysis import RateArchive, RateRecorder, QuantileSketch
 from muonic.util import rename_muonic_file, get_hours_from_duration
-from muonic.util import get_setting, WrappedFile
+from muonic.analysis.pipeline import DecayFileSink, VelocityFileSink
+from muonic.analysis.pipeline import StreamDecayFileSink
+from muonic.util import get_setting, WrappedFile, LockedFile
 
 
 class BaseWidget(QtGui.QWidget):
@@ -45,6 +51,7 @@ class BaseWidget(QtGui.QWidget):
         self.logger = logger
         self.parent = parent
         self._active = False
+        self._changed = False
 
     def update(self, *args):
         """
@@ -66,16 +73,34 @@ class BaseWidget(QtGui.QWidget):
 
     def active(self, value=None):
         """
-        Getter and setter for active state.
+        Getter and setter for active state. The parent is told about
+        changes of the state, so it can update the consumers of the DAQ
+        messages.
 
         :param value: value for the new state
         :type value: bool or None
         :returns: bool
         """
-        if value is not None:
+        if value is not None and value != self._active:
             self._active = value
+
+            if hasattr(self.parent, "update_message_consumers"):
+                self.parent.update_message_consumers()
         return self._active
 
+    def changed(self, value=None):
+        """
+        Getter and setter for the changed state. Widgets set it when they
+        got new data to show, it is reset when the widget gets refreshed.
+
+        :param value: value for the new state
+        :type value: bool or None
+        :returns: bool
+        """
+        if value is not None:
+            self._changed = value
+        return self._changed
+
     def start(self):
         """
         Perform setup here like resetting variables when the
@@ -143,48 +168,50 @@ class RateWidget(BaseWidget):
     :param filename: filename for the rate data file
     :type filename: str
     :param parent: parent widget
+    :param archive_dirname: directory of the rate archive, no archive
+                            is kept if None
+    :type archive_dirname: str
     """
-    SCALAR_BUF_SIZE = 5
+    SCALAR_BUF_SIZE = RateRecorder.SCALAR_BUF_SIZE
 
-    def __init__(self, logger, filename, parent=None):
+    def __init__(self, logger, filename, parent=None, archive_dirname=None):
         BaseWidget.__init__(self, logger, parent)
 
-        # measurement start and duration
-        self.measurement_duration = datetime.timedelta()
-        self.start_time = datetime.datetime.utcnow()
+        # calculates the rates and writes the rate file
+        self.recorder = RateRecorder(logger, filename)
 
-        # define the begin of the time interval for the rate calculation
-        self.last_query_time = 0
-        self.query_time = time.time()
         self.time_window = 0
         self.show_trigger = True
 
         # lists of channel and trigger scalars
         # 0..3: channel 0-3
         # 4:    trigger
-        self.previous_scalars = self.new_scalar_buffer()
         self.scalar_buffer = self.new_scalar_buffer()
         
         # maximum and minimum seen rate across channels and trigger
         self.max_rate = 0
         self.min_rate = 0
 
-        # we will write the column headers of the data into
-        # data_file in the first run
-        self.first_run = True
-
-        # are we in first cycle after start button is pressed?
-        self.first_cycle = False
-
-        # data file options
-        self.data_file = WrappedFile(filename)
-
         # rates store
         self.rates = None
 
+        # multi-resolution archive of the rates of the whole run,
+        # opened on start
+        self.archive_dirname = archive_dirname
+        self.rate_archive = None
+
         # initialize plot canvas
         self.scalars_monitor = ScalarsCanvas(self, logger)
 
+        self.full_run_checkbox = QtGui.QCheckBox(self)
+        self.full_run_checkbox.setText("Show full run")
+        self.full_run_checkbox.setToolTip("Show the rates of the whole " +
+                                          "run from the rate archive")
+        self.full_run_checkbox.setEnabled(False)
+        QtCore.QObject.connect(self.full_run_checkbox,
+                               QtCore.SIGNAL("clicked()"),
+                               self.on_full_run_clicked)
+
         self.table = QtGui.QTableWidget(5, 2, self)
         self.table.setEnabled(False)
         self.table.setColumnWidth(0, 85)
@@ -238,7 +265,7 @@ class RateWidget(BaseWidget):
 
         :returns: list of int
         """
-        return [0] * self.SCALAR_BUF_SIZE
+        return self.recorder.new_scalar_buffer()
 
     def setup_layout(self):
         """
@@ -267,6 +294,7 @@ class RateWidget(BaseWidget):
         value_layout.addWidget(self.info_fields['daq_time'], 2, 1)
         value_layout.addWidget(QtGui.QLabel('max rate:'), 3, 0)
         value_layout.addWidget(self.info_fields['max_rate'], 3, 1)
+        value_layout.addWidget(self.full_run_checkbox, 4, 0, 1, 2)
 
         # bottom line layout
         bottom_line_box = QtGui.QGroupBox("")
@@ -286,26 +314,7 @@ class RateWidget(BaseWidget):
 
         :returns: None
         """
-        self.last_query_time = self.query_time
-        self.daq_put("DS")
-        self.query_time = time.time()
-
-    def extract_scalars_from_message(self, msg):
-        """
-        Extracts the scalar values for channel 0-3 and
-        the trigger channel from daq message
-
-        :param msg: DAQ message
-        :type: str
-        :return: list of ints
-        """
-        scalars = self.new_scalar_buffer()
-
-        for item in msg.split():
-            for i in range(self.SCALAR_BUF_SIZE):
-                if item.startswith("S%d" % i) and len(item) == 11:
-                    scalars[i] = int(item[3:], 16)
-        return scalars
+        self.recorder.query_scalars(self.daq_put)
 
     def calculate(self):
         """
@@ -321,35 +330,15 @@ class RateWidget(BaseWidget):
         if not (len(msg) >= 2 and msg.startswith("DS")):
             return False
 
-        # extract scalars from daq message
-        scalars = self.extract_scalars_from_message(msg)
+        # the recorder writes the rates to the data file
+        rates = self.recorder.calculate(msg)
 
-        # if this is the first time calculate is called, we want to set all
-        # counters to zero. This is the beginning of the first bin.
-        if self.first_cycle:
-            self.logger.debug("Buffering muon counts for the first bin " +
-                              "of the rate plot.")
-            self.previous_scalars = scalars
-            self.first_cycle = False
+        if rates is None:
             return True
 
-        # initialize temporary buffers for the scalar diffs
-        scalar_diffs = self.new_scalar_buffer()
-
-        # calculate differences and store current scalars for reuse
-        # in the next cycle
-        for i in range(self.SCALAR_BUF_SIZE):
-            scalar_diffs[i] = scalars[i] - self.previous_scalars[i]
-            self.previous_scalars[i] = scalars[i]
-
-        time_window = self.query_time - self.last_query_time
-
-        # rates for scalars of channels and trigger
-        self.rates = [(_scalar / time_window) for _scalar in scalar_diffs]
-        # current time window
-        self.rates += [time_window]
-        # scalars for channels and trigger
-        self.rates += [_scalar for _scalar in scalar_diffs]
+        self.rates = rates
+        time_window = rates[5]
+        scalar_diffs = rates[6:]
 
         self.time_window += time_window
 
@@ -367,25 +356,13 @@ class RateWidget(BaseWidget):
         if max_rate > self.max_rate:
             self.max_rate = max_rate
 
-        # write the rates to data file. we have to catch IOErrors, can occur
-        # if program is exited
-        if self.active():
-            try:
-                utcdt = datetime.datetime.utcfromtimestamp(self.query_time)
-                self.data_file.write(
-                    "%s %f %f %f %f %f %f %f %f %f %f %f \n" %
-                        (utcdt.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
-                         self.rates[0], self.rates[1], self.rates[2],
-                         self.rates[3], self.rates[4],
-                         scalar_diffs[0], scalar_diffs[1],
-                         scalar_diffs[2], scalar_diffs[3], scalar_diffs[4],
-                         self.rates[5]))
-
-                self.logger.debug("Rate plot data was written to %s" %
-                                  repr(self.data_file))
-            except ValueError:
-                self.logger.warning("ValueError, Rate plot data was not " +
-                                    "written to %s" % repr(self.data_file))
+        if self.rate_archive is not None and self.active():
+            self.rate_archive.add(self.recorder.query_time, time_window,
+                                  self.rates[:5])
+
+        # the rates are drawn on the next refresh
+        self.scalars_monitor.add_rates(self.rates)
+        self.changed(True)
         return True
 
     def update(self):
@@ -397,8 +374,6 @@ class RateWidget(BaseWidget):
         if not self.active():
             return
 
-        self.query_daq_for_scalars()
-
         if self.time_window == 0:
             return
 
@@ -411,8 +386,7 @@ class RateWidget(BaseWidget):
 
         channel_config = [get_setting("active_ch%d" % i) for i in range(4)]
 
-        self.scalars_monitor.update_plot(self.rates, self.show_trigger,
-                                         channel_config)
+        self.scalars_monitor.redraw(self.show_trigger, channel_config)
 
     def update_fields(self, channel, enabled, disable_only=False):
         """
@@ -471,52 +445,18 @@ class RateWidget(BaseWidget):
 
         self.active(True)
 
-        self.start_time = datetime.datetime.utcnow()
-
         self.start_button.setEnabled(False)
         self.stop_button.setEnabled(True)
         self.table.setEnabled(True)
 
         time.sleep(0.2)
 
-        self.first_cycle = True
         self.time_window = 0
 
         # reset scalar buffer
         self.scalar_buffer = self.new_scalar_buffer()
 
-        # open file for writing and add comment
-        self.data_file.open("a")
-
-        # write column headers if this is the first run
-        if self.first_run:
-            self.data_file.write("#Settings: \n")
-            self.data_file.write("\n")
-            for i in range(4):
-                     self.data_file.write("# Distance "   "%d cm" % get_setting("distance_ch%d" %i) +   " channel %d" % (i) + " to channel %d" % (i + 1) + '\n')
-
-            for i in range(4):
-                     #print("# Thresholds " "%d mV" % get_setting("threshold_ch%d" %i) + " chan%d" % (i))
-                     self.data_file.write("# Thresholds " "%d mV" % get_setting("threshold_ch%d" %i) + " chan%d" % (i) + "\n")
-
-            for i in range(4):
-                    #print("# Actine Channels %d " % get_setting("active_ch%d" % i) + " channel %d" % (i)) 
-                    self.data_file.write("# Actine Channels %d " % get_setting("active_ch%d" % i) + " channel %d" % (i) + "\n")
- 
-            for i, value in enumerate(["Single", "Twofold", "Threefold","Fourfold"]):
-                   if get_setting("coincidence%d" % i):
-                      self.data_file.write("# Coincidenes %s " % value + "\n")
-                      if value == 'Single':
-                          TRIGGER_COLOR = "w"
-                          self.show_trigger = False
-                   else:
-                          self.show_trigger = True
-            self.data_file.write("\n") 
-		
-            self.data_file.write("year month day hour minutes second milliseconds" +
-                                 " | R0 | R1 | R2 | R3 | R trigger | " +
-                           " chan0 | chan1 | chan2 | chan3 | trigger | Delta_time\n")
-            self.first_run = False
+        self.open_rate_archive()
 
         # determine type of measurement
         if self.parent.is_widget_active("decay"):
@@ -526,12 +466,9 @@ class RateWidget(BaseWidget):
         else:
             measurement_type = "rate"
 
-        self.data_file.write("# new %s measurement run from: %s\n" %
-                             (measurement_type,
-                              self.start_time.strftime("%a %d %b %Y %H:%M:%S UTC")))
-        
-	self.data_file.write("\n")
-		
+        # open file for writing and add comment
+        self.recorder.start(measurement_type)
+
         for i, value in enumerate(["Single", "Twofold", "Threefold","Fourfold"]):
             if get_setting("coincidence%d" % i):
                 if value == 'Single':
@@ -553,7 +490,8 @@ class RateWidget(BaseWidget):
         self.update_info_field("max_rate", enable=True)
 
         self.update_info_field("start_date",
-                               self.start_time.strftime("%d.%m.%Y %H:%M:%S"))
+                               self.recorder.start_time.strftime(
+                                       "%d.%m.%Y %H:%M:%S"))
         self.update_info_field("daq_time", "%.2f" % self.time_window)
         self.update_info_field("max_rate", "%.2f" % self.max_rate)
 
@@ -571,10 +509,6 @@ class RateWidget(BaseWidget):
 
         self.active(False)
 
-        stop_time = datetime.datetime.utcnow()
-
-        self.measurement_duration += stop_time - self.start_time
-
         self.start_button.setEnabled(True)
         self.stop_button.setEnabled(False)
         self.table.setEnabled(False)
@@ -583,32 +517,39 @@ class RateWidget(BaseWidget):
         self.update_info_field("daq_time", enable=False)
         self.update_info_field("max_rate", enable=False)
 
-        self.data_file.write("# stopped run on: %s\n" %
-                             stop_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
-        self.data_file.write("\n")
-        self.data_file.write("#Settings: \n")
-        self.data_file.write("\n")
-        for i in range(4):
-                 self.data_file.write("# Distance "   "%d cm" % get_setting("distance_ch%d" %i) +   " channel %d" % (i) + " to channel %d" % (i + 1) + '\n')
+        self.recorder.stop()
 
-        for i in range(4):
-         self.data_file.write("# Thresholds " "%d mV" % get_setting("threshold_ch%d" %i) + " chan%d" % (i) + "\n")
+        if self.rate_archive is not None:
+            self.rate_archive.flush()
 
-        for i in range(4):
-         self.data_file.write("# Actine Channels %d " % get_setting("active_ch%d" % i) + " channel %d" % (i) + "\n")
+    def open_rate_archive(self):
+        """
+        Open the rate archive if it is not open yet.
 
+        :returns: None
+        """
+        if self.archive_dirname is None or self.rate_archive is not None:
+            return
 
-        for i, value in enumerate(["Single", "Twofold", "Threefold","Fourfold"]):
-                if get_setting("coincidence%d" % i):
-                   self.data_file.write("# Coincidenes %s " % value + "\n")
-                   if value == 'Single':
-                      TRIGGER_COLOR = "w"
-                      self.show_trigger = False
-                else:
-                     self.show_trigger = True
-        self.data_file.write("\n")
+        try:
+            self.rate_archive = RateArchive(self.archive_dirname)
+        except (OSError, IOError, ValueError) as e:
+            self.logger.warning("Could not open rate archive %s: %s" %
+                                (self.archive_dirname, e))
+            return
+
+        self.full_run_checkbox.setEnabled(True)
+
+    def on_full_run_clicked(self):
+        """
+        Show the whole run from the rate archive or the recent rates.
 
-	self.data_file.close()
+        :returns: None
+        """
+        if self.full_run_checkbox.isChecked():
+            self.scalars_monitor.set_archive(self.rate_archive)
+        else:
+            self.scalars_monitor.set_archive(None)
 
     def finish(self):
         """
@@ -616,24 +557,14 @@ class RateWidget(BaseWidget):
 
         :returns: None
         """
-        if self.active():
-            stop_time = datetime.datetime.utcnow()
+        self.recorder.finish()
 
-            self.measurement_duration += stop_time - self.start_time
-
-            self.data_file.write("# stopped run on: %s\n" %
-                                 stop_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
-            self.data_file.close()
+        if self.rate_archive is not None:
+            self.rate_archive.close()
 
-        # only rename if file actually exists
-        if os.path.exists(self.data_file.get_filename()):
             try:
-                self.logger.info(("The rate measurement was active " +
-                                  "for %f hours") %
-                                 get_hours_from_duration(
-                                         self.measurement_duration))
-                rename_muonic_file(self.measurement_duration,
-                                   self.data_file.get_filename())
+                rename_muonic_file(self.recorder.measurement_duration,
+                                   self.archive_dirname)
             except (OSError, IOError):
                 pass
 
@@ -647,14 +578,22 @@ class PulseAnalyzerWidget(BaseWidget):
     :param pulse_extractor: pulse extractor object
     :type pulse_extractor: muonic.analysis.analyzer.PulseExtractor
     :param parent: parent widget
+    :param sketch_filename: file the pulse width sketches are saved to
+                            on exit, they are not saved if None
+    :type sketch_filename: str
     """
-    def __init__(self, logger, pulse_extractor, parent=None):
+    def __init__(self, logger, pulse_extractor, parent=None,
+                 sketch_filename=None):
         BaseWidget.__init__(self, logger, parent)
 
         self.pulses = None
         self.pulse_widths = {i : [] for i in range(4)}
         self.pulse_extractor = pulse_extractor
 
+        # quantiles of all pulse widths of the run in constant memory
+        self.pulse_width_sketches = [QuantileSketch() for _ in range(4)]
+        self.sketch_filename = sketch_filename
+
         # setup layout
         layout = QtGui.QGridLayout(self)
 
@@ -666,6 +605,9 @@ class PulseAnalyzerWidget(BaseWidget):
         QtCore.QObject.connect(self.checkbox, QtCore.SIGNAL("clicked()"),
                                self.on_checkbox_clicked)
 
+        self.pulse_canvas = PulseCanvas(self, logger)
+        self.pulse_toolbar = NavigationToolbar(self.pulse_canvas, self)
+
         self.pulse_width_canvases = []
         self.pulse_width_toolbars = []
         for i in range(4):
@@ -674,44 +616,48 @@ class PulseAnalyzerWidget(BaseWidget):
 
             self.pulse_width_toolbars.append(NavigationToolbar(self.pulse_width_canvases[-1], self))
 
-        layout.addWidget(self.checkbox, 0, 0, 1, 2)
+        layout.addWidget(self.checkbox, 0, 0, 1, 3)
+        layout.addWidget(self.pulse_canvas, 1, 0, 3, 1)
+        layout.addWidget(self.pulse_toolbar, 4, 0)
         for i in range(4):
-            cx = i/2 * 2 + 1
-            cy = i%2
+            cx = i // 2 * 2 + 1
+            cy = i % 2 + 1
 
             layout.addWidget(self.pulse_width_canvases[i], cx, cy)
             layout.addWidget(self.pulse_width_toolbars[i], cx+1, cy)
 
-    def calculate(self, pulses):
+    def calculate(self, pulse_widths):
         """
-        Calculates the pulse widths.
+        Collects the pulse widths published by the pulse width analysis.
 
-        :param pulses: extracted pulses
-        :type pulses: list
+        :param pulse_widths: pulse widths keyed by channel index
+        :type pulse_widths: dict
         :returns: None
         """
         if not self.active():
             return
 
-        self.pulses = pulses
+        for channel, widths in pulse_widths.items():
+            # channel index is shifted
+            self.pulse_widths[channel - 1].extend(widths)
+            self.pulse_width_sketches[channel - 1].extend(widths)
 
-        if self.pulses is None:
-            self.logger.debug("Not received any pulses")
-            return None
+        self.changed(True)
 
-        # pulse_widths changed because falling edge can be None.
-        # pulse_widths = [fe - le for chan in pulses[1:] for le,fe in chan]
+    def add_events(self, events):
+        """
+        Collects the pulses of the latest events for the oscilloscope.
 
+        :param events: pulses of the events, oldest first
+        :type events: list
+        :returns: None
+        """
+        if not self.active():
+            return
+
+        self.pulse_canvas.add_events(events)
+        self.changed(True)
 
-        for i,channel in enumerate(self.pulses[1:]):
-            pulse_widths = self.pulse_widths.get(i, [])
-            for le, fe in channel:
-                if fe is not None:
-                    pulse_widths.append(fe - le)
-                else:
-                    pulse_widths.append(0.)
-            self.pulse_widths[i] = pulse_widths
-        
     def update(self):
         """
         Update plot canvases
@@ -721,8 +667,10 @@ class PulseAnalyzerWidget(BaseWidget):
         if not self.active():
             return
 
-        #self.pulse_canvas.update_plot(self.pulses)
+        self.pulse_canvas.redraw()
         for i,pwc in enumerate(self.pulse_width_canvases):
+            if self.pulse_widths[i]:
+                pwc.set_quantiles(self.pulse_width_sketches[i].summary())
             pwc.update_plot(self.pulse_widths[i])
         self.pulse_widths = {i : [] for i in range(4)}
 
@@ -749,6 +697,12 @@ class PulseAnalyzerWidget(BaseWidget):
         self.logger.debug("switching on pulse analyzer.")
         self.active(True)
 
+        # do not show the events of the last run
+        self.pulse_canvas.reset()
+
+        self.parent.subscribe_analysis("pulse", self.calculate)
+        self.parent.analysis_registry.register(PulseWidthAnalysis("pulse"))
+
         self.daq_put("CE")
 
         # extract pulses to file
@@ -766,6 +720,8 @@ class PulseAnalyzerWidget(BaseWidget):
         self.logger.debug("switching off pulse analyzer.")
         self.active(False)
 
+        self.parent.analysis_registry.unregister("pulse")
+
         # stop extracting pulses to file if decay and velocity
         # measurements are inactive and global setting is also false
         if (not get_setting("write_pulses") and
@@ -773,6 +729,25 @@ class PulseAnalyzerWidget(BaseWidget):
                 not self.parent.is_widget_active("velocity")):
             self.pulse_extractor.write_pulses(False)
 
+    def finish(self):
+        """
+        Save the pulse width sketches, they can be merged with the
+        sketches of other runs by analysis_scripts/plot_pulses.py.
+
+        :returns: None
+        """
+        if (self.sketch_filename is None or
+                not any(self.pulse_width_sketches)):
+            return
+
+        try:
+            QuantileSketch.save(self.sketch_filename,
+                                dict(("ch%d" % i, sketch) for i, sketch
+                                     in enumerate(self.pulse_width_sketches)))
+        except (OSError, IOError) as e:
+            self.logger.warning("Could not save pulse width sketches to " +
+                                "%s: %s" % (self.sketch_filename, e))
+
 
 class StatusWidget(BaseWidget):
     """
@@ -811,6 +786,7 @@ class StatusWidget(BaseWidget):
         self.muonic_stats['measurements'] = self.TEXT_UNSET
         self.muonic_stats['refresh_time'] = self.TEXT_UNSET
         self.muonic_stats['open_files'] = self.TEXT_UNSET
+        self.muonic_stats['refresh_timings'] = self.TEXT_UNSET
         self.muonic_stats['start_params'] = \
             "\n".join(["%s=%s" % (k, v)
                        for k, v in vars(self.parent.opts).items()])
@@ -848,7 +824,7 @@ class StatusWidget(BaseWidget):
             self.daq_widgets[key].setText(self.daq_stats[key])
 
         # setup muonic widgets
-        for key in ['open_files', 'start_params']:
+        for key in ['open_files', 'start_params', 'refresh_timings']:
             self.muonic_widgets[key] = QtGui.QPlainTextEdit(self)
             self.muonic_widgets[key].setReadOnly(True)
             self.muonic_widgets[key].setDisabled(True)
@@ -894,6 +870,8 @@ class StatusWidget(BaseWidget):
         layout.addWidget(self.muonic_widgets['refresh_time'], 8, 4)
         layout.addWidget(self.muonic_widgets['start_params'], 9, 1, 2, 4)
         layout.addWidget(self.muonic_widgets['open_files'], 11, 1, 2, 4)
+        layout.addWidget(QtGui.QLabel("Refresh timings:"), 13, 0)
+        layout.addWidget(self.muonic_widgets['refresh_timings'], 13, 1, 2, 4)
 
         self.refresh_button = QtGui.QPushButton("Refresh")
         self.refresh_button.setDisabled(False)
@@ -901,7 +879,7 @@ class StatusWidget(BaseWidget):
                                QtCore.SIGNAL("clicked()"),
                                self.on_refresh_clicked)
 
-        layout.addWidget(self.refresh_button, 13, 0, 1, 6)
+        layout.addWidget(self.refresh_button, 15, 0, 1, 6)
 
     def on_refresh_clicked(self):
         """
@@ -985,6 +963,18 @@ class StatusWidget(BaseWidget):
 
         self.muonic_stats['open_files'] = "\n".join(open_files)
 
+        # time the plots of the widgets take to refresh
+        timings = []
+
+        for stats in self.parent.refresh_scheduler.get_stats():
+            timings.append(("%s: %.1f ms (max %.1f ms), every %.1f s, " +
+                            "%d refreshes, %d skipped, %d deferred") %
+                           (stats.name, stats.mean_cost * 1000.,
+                            stats.max_cost * 1000., stats.interval,
+                            stats.refreshes, stats.skipped, stats.deferred))
+
+        self.muonic_stats['refresh_timings'] = "\n".join(timings)
+
     def update(self):
         """
         Fill the status information in the widget.
@@ -1024,7 +1014,7 @@ class StatusWidget(BaseWidget):
             self.muonic_widgets[key].setText(self.muonic_stats[key])
             self.muonic_widgets[key].setEnabled(True)
 
-        for key in ['start_params', 'open_files']:
+        for key in ['start_params', 'open_files', 'refresh_timings']:
             self.muonic_widgets[key].setPlainText(self.muonic_stats[key])
             self.muonic_widgets[key].setEnabled(True)
 
@@ -1055,12 +1045,19 @@ class VelocityWidget(BaseWidget):
 
         # default fit range
         self.fit_range = (self.binning[0], self.binning[1])
+        self.fit_engine = FitEngine(GaussianModel())
+
+        # fits run in the background, results are cached
+        self.fitter = BackgroundFitter(self.fit_engine,
+                                       callback=self.fit_done)
 
         self.event_data = []
         self.last_event_time = None
         self.active_since = None
 
-        self.mu_file = WrappedFile(filename)
+        # the flight times are written by the analysis worker
+        self.mu_file = LockedFile(filename)
+        self.file_sink = VelocityFileSink(self.mu_file)
 
         # measurement duration and start time
         self.measurement_duration = datetime.timedelta()
@@ -1075,9 +1072,6 @@ class VelocityWidget(BaseWidget):
                 QtGui.QSizePolicy.Expanding,
                 QtGui.QSizePolicy.Expanding)
 
-        # velocity trigger
-        self.trigger = VelocityTrigger(logger)
-
         # checkbox and buttons
         self.checkbox = QtGui.QCheckBox(self)
         self.checkbox.setText("Measure Flight Time")
@@ -1093,6 +1087,8 @@ class VelocityWidget(BaseWidget):
                                self.on_checkbox_clicked)
         QtCore.QObject.connect(self.fit_button, QtCore.SIGNAL("clicked()"),
                                self.on_fit_clicked)
+        QtCore.QObject.connect(self, QtCore.SIGNAL("fit_done"),
+                               self.show_fit)
         QtCore.QObject.connect(self.fit_range_button,
                                QtCore.SIGNAL("clicked()"),
                                self.on_fit_range_clicked)
@@ -1122,12 +1118,32 @@ class VelocityWidget(BaseWidget):
         :returns: None
         """
         self.logger.debug("Using fit range of %s" % repr(self.fit_range))
-        fit_results = gaussian_fit(
-                bincontent=np.asarray(self.plot_canvas.heights),
-                binning=self.binning, fitrange=self.fit_range)
+        bincontent, bin_edges = self.plot_canvas.get_bins()
+        self.fitter.submit(bincontent, bin_edges, self.fit_range)
+
+    def fit_done(self, fit_result):
+        """
+        Passes the result of a background fit to the main thread
 
-        if fit_results is not None:
-            self.plot_canvas.show_fit(*fit_results)
+        :param fit_result: the result, None if the fit failed
+        :type fit_result: muonic.analysis.fit_engine.FitResult
+        :returns: None
+        """
+        self.emit(QtCore.SIGNAL("fit_done"), fit_result)
+
+    def show_fit(self, fit_result):
+        """
+        Shows the result of a fit
+
+        :param fit_result: the result, None if the fit failed
+        :type fit_result: muonic.analysis.fit_engine.FitResult
+        :returns: None
+        """
+        if fit_result is not None:
+            self.plot_canvas.show_fit(fit_result)
+        else:
+            self.logger.warning("Not enough data to fit, try with a " +
+                                "larger fit range.")
 
     def on_fit_range_clicked(self):
         """
@@ -1143,6 +1159,7 @@ class VelocityWidget(BaseWidget):
             upper_limit = dialog.get_widget_value("upper_limit")
             lower_limit = dialog.get_widget_value("lower_limit")
             self.fit_range = (lower_limit, upper_limit)
+            self.fitter.cancel()
 
     def on_checkbox_clicked(self):
         """
@@ -1155,26 +1172,20 @@ class VelocityWidget(BaseWidget):
         else:
             self.stop()
 
-    def calculate(self, pulses):
+    def calculate(self, flight_time):
         """
-        Trigger muon flight
+        Collects the flight times published by the velocity analysis
 
-        :param pulses: extracted pulses
-        :type pulses: list
+        :param flight_time: flight time in ns
+        :type flight_time: float
         :returns: None
         """
-        if pulses is None:
-            return
-
-        flight_time = self.trigger.trigger(pulses,
-                                           upper_channel=self.upper_channel,
-                                           lower_channel=self.lower_channel)
-
-        if flight_time is not None and flight_time > 0:
+        if flight_time > 0:
             self.event_data.append(flight_time)
             self.muon_counter += 1
             self.last_event_time = datetime.datetime.utcnow()
             self.logger.info("measured flight time %s" % flight_time)
+            self.changed(True)
 
     def update(self):
         """
@@ -1194,11 +1205,6 @@ class VelocityWidget(BaseWidget):
         self.last_event_label.setText(
                 "The last muon was detected at %s" %
                 self.last_event_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
-        for flight_time in self.event_data:
-            self.mu_file.write("%s Flight time %s\n" % (
-                self.last_event_time.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
-                repr(flight_time)))
-
         self.event_data = []
 
     def start(self):
@@ -1246,6 +1252,14 @@ class VelocityWidget(BaseWidget):
 
             self.active(True)
 
+            # velocity trigger
+            registry = self.parent.analysis_registry
+            self.parent.subscribe_analysis("velocity", self.calculate)
+            registry.subscribe("velocity", self.file_sink)
+            registry.register(VelocityAnalysis(
+                    "velocity", upper_channel=self.upper_channel,
+                    lower_channel=self.lower_channel))
+
             # restart rate measurement
             self.parent.get_widget("rate").stop()
             self.parent.get_widget("rate").start()
@@ -1280,6 +1294,8 @@ class VelocityWidget(BaseWidget):
         self.logger.info("Muon velocity mode now deactivated, returning to " +
                          "previous setting (if available)")
 
+        self.parent.analysis_registry.unregister("velocity")
+
         self.mu_file.write("# stopped run on: %s\n" %
                            stop_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
         self.mu_file.close()
@@ -1303,6 +1319,8 @@ class VelocityWidget(BaseWidget):
 
         :returns: None
         """
+        self.fitter.close()
+
         if not self.mu_file.closed:
             stop_time = datetime.datetime.utcnow()
 
@@ -1355,6 +1373,9 @@ class DecayWidget(BaseWidget):
         self.veto_pulse_channel = 2
         self.decay_min_time = 0
 
+        # decays found across trigger windows
+        self.stream_counter = 0
+
         # ignore first bin because of after pulses,
         # see https://github.com/achim1/muonic/issues/39
         self.binning = (0, 10, 21)
@@ -1362,12 +1383,29 @@ class DecayWidget(BaseWidget):
         # default fit range
         #self.fit_range = (1.5, 10.)
         self.fit_range = (0.5, 10.)
+
+        # fits start from the previous result, the leading
+        # edge of the decay time distribution is not fitted
+        self.fit_engine = FitEngine(ExponentialModel(), cut_to_maximum=True)
+
+        # fits run in the background, results are cached
+        self.fitter = BackgroundFitter(self.fit_engine,
+                                       callback=self.fit_done)
+
+        # all decay times for the unbinned fit and the end of the trigger
+        # window, the gate width set in start() is in units of 10 ns
+        self.decay_times = []
+        self.window_end = 0x040A * 0.01
+        self.unbinned_fit_worker = None
         
         self.event_data = []
         self.last_event_time = None
         self.active_since = None
 
-        self.mu_file = WrappedFile(filename)
+        # the decay times are written by the analysis worker
+        self.mu_file = LockedFile(filename)
+        self.file_sink = DecayFileSink(self.mu_file)
+        self.stream_file_sink = StreamDecayFileSink(self.mu_file)
 
         # measurement duration and start time
         self.measurement_duration = datetime.timedelta()
@@ -1379,14 +1417,17 @@ class DecayWidget(BaseWidget):
         # lifetime plot canvas
         self.plot_canvas = LifetimeCanvas(self, logger)
 
+        # lifetime estimate on the histogram of the canvas, updated
+        # with every decay shown
+        self.lifetime_estimator = OnlineLifetimeEstimator(
+                fit_range=self.fit_range,
+                histogram=self.plot_canvas.histogram)
+
         # we want the plot canvas to fill as much space as possible
         self.plot_canvas.setSizePolicy(
                 QtGui.QSizePolicy.Expanding,
                 QtGui.QSizePolicy.Expanding)
 
-        # decay trigger
-        self.trigger = DecayTriggerThorough(logger)
-
         # checkbox and buttons
         self.checkbox = QtGui.QCheckBox(self)
         self.checkbox.setText("Check for Decayed Muons")
@@ -1397,17 +1438,30 @@ class DecayWidget(BaseWidget):
         self.fit_range_button = QtGui.QPushButton("Fit Range")
         self.fit_range_button.setEnabled(False)
 
+        self.unbinned_fit_button = QtGui.QPushButton("Unbinned Fit")
+        self.unbinned_fit_button.setEnabled(False)
+
         QtCore.QObject.connect(self.checkbox,
                                QtCore.SIGNAL("clicked()"),
                                self.on_checkbox_clicked)
         QtCore.QObject.connect(self.fit_button, QtCore.SIGNAL("clicked()"),
                                self.on_fit_clicked)
+        QtCore.QObject.connect(self, QtCore.SIGNAL("fit_done"),
+                               self.show_fit)
+        QtCore.QObject.connect(self.unbinned_fit_button,
+                               QtCore.SIGNAL("clicked()"),
+                               self.on_unbinned_fit_clicked)
+        QtCore.QObject.connect(self, QtCore.SIGNAL("unbinned_fit_done"),
+                               self.show_unbinned_fit)
         QtCore.QObject.connect(self.fit_range_button,
                                QtCore.SIGNAL("clicked()"),
                                self.on_fit_range_clicked)
 
         self.running_status = None
         self.muon_counter_label = QtGui.QLabel(self)
+        self.stream_counter_label = QtGui.QLabel(self)
+        self.lifetime_label = QtGui.QLabel(self)
+        self.unbinned_fit_label = QtGui.QLabel(self)
         self.last_event_label = QtGui.QLabel(self)
         self.active_since_label = QtGui.QLabel(self)
 
@@ -1415,14 +1469,18 @@ class DecayWidget(BaseWidget):
 
         # add widgets to layout
         layout = QtGui.QGridLayout(self)
-        layout.addWidget(self.checkbox, 0, 0, 1, 3)
+        layout.addWidget(self.checkbox, 0, 0, 1, 4)
         layout.addWidget(self.muon_counter_label, 1, 0)
+        layout.addWidget(self.stream_counter_label, 1, 1, 1, 3)
         layout.addWidget(self.last_event_label, 2, 0)
+        layout.addWidget(self.lifetime_label, 2, 1, 1, 3)
         layout.addWidget(self.active_since_label, 3, 0)
-        layout.addWidget(self.plot_canvas, 4, 0, 1, 3)
+        layout.addWidget(self.unbinned_fit_label, 3, 1, 1, 3)
+        layout.addWidget(self.plot_canvas, 4, 0, 1, 4)
         layout.addWidget(navigation_toolbar, 5, 0)
         layout.addWidget(self.fit_range_button, 5, 1)
         layout.addWidget(self.fit_button, 5, 2)
+        layout.addWidget(self.unbinned_fit_button, 5, 3)
 
     def set_previous_coincidence_times(self, time_03, time_02):
         """
@@ -1443,11 +1501,84 @@ class DecayWidget(BaseWidget):
 
         :returns: None
         """
-        fit_results = fit(bincontent=np.asarray(self.plot_canvas.heights),
-                          binning=self.binning, fitrange=self.fit_range)
+        bincontent, bin_edges = self.plot_canvas.get_bins()
+        self.fitter.submit(bincontent, bin_edges, self.fit_range)
+
+    def fit_done(self, fit_result):
+        """
+        Passes the result of a background fit to the main thread
+
+        :param fit_result: the result, None if the fit failed
+        :type fit_result: muonic.analysis.fit_engine.FitResult
+        :returns: None
+        """
+        self.emit(QtCore.SIGNAL("fit_done"), fit_result)
+
+    def show_fit(self, fit_result):
+        """
+        Shows the result of a fit
+
+        :param fit_result: the result, None if the fit failed
+        :type fit_result: muonic.analysis.fit_engine.FitResult
+        :returns: None
+        """
+        if fit_result is not None:
+            self.plot_canvas.show_fit(fit_result)
+        else:
+            self.logger.warning("Not enough data to fit, try with a " +
+                                "larger fit range.")
+
+    def on_unbinned_fit_clicked(self):
+        """
+        Fit the lifetime to all decay times in a background thread
+
+        :returns: None
+        """
+        if (self.unbinned_fit_worker is not None and
+                self.unbinned_fit_worker.is_alive()):
+            return
+
+        self.unbinned_fit_button.setEnabled(False)
+        self.unbinned_fit_label.setText("Unbinned fit running...")
 
-        if fit_results is not None:
-            self.plot_canvas.show_fit(*fit_results)
+        self.unbinned_fit_worker = UnbinnedFitWorker(
+                decay_times=np.array(self.decay_times),
+                fit_range=self.fit_range, window_end=self.window_end,
+                callback=self.unbinned_fit_done)
+        self.unbinned_fit_worker.start()
+
+    def unbinned_fit_done(self, worker):
+        """
+        Passes the finished unbinned fit to the main thread
+
+        :param worker: the finished worker
+        :type worker: muonic.analysis.lifetime.UnbinnedFitWorker
+        :returns: None
+        """
+        self.emit(QtCore.SIGNAL("unbinned_fit_done"), worker)
+
+    def show_unbinned_fit(self, worker):
+        """
+        Shows the result of the unbinned fit
+
+        :param worker: the finished worker
+        :type worker: muonic.analysis.lifetime.UnbinnedFitWorker
+        :returns: None
+        """
+        self.unbinned_fit_button.setEnabled(True)
+
+        if worker.error is not None:
+            self.logger.error("Unbinned fit failed: %s" % worker.error)
+            self.unbinned_fit_label.setText("Unbinned fit failed")
+        elif worker.result is None:
+            self.logger.warning("Not enough decays in the fit range for " +
+                                "the unbinned fit.")
+            self.unbinned_fit_label.setText("")
+        else:
+            self.logger.info("Unbinned lifetime fit: %s" % repr(worker.result))
+            self.unbinned_fit_label.setText(
+                    "Unbinned fit: (%.2f +- %.2f) microseconds" %
+                    worker.result[:2])
 
     def on_fit_range_clicked(self):
         """
@@ -1464,6 +1595,12 @@ class DecayWidget(BaseWidget):
             upper_limit = dialog.get_widget_value("upper_limit")
             lower_limit = dialog.get_widget_value("lower_limit")
             self.fit_range = (lower_limit, upper_limit)
+            self.fitter.cancel()
+
+            try:
+                self.lifetime_estimator.set_fit_range(self.fit_range)
+            except ValueError as e:
+                self.logger.warning("Cannot estimate the lifetime: %s" % e)
 
     def on_checkbox_clicked(self):
         """
@@ -1476,32 +1613,37 @@ class DecayWidget(BaseWidget):
         else:
             self.stop()
 
-    def calculate(self, pulses):
+    def calculate(self, decay):
         """
-        Trigger muon decay
+        Collects the decay times published by the decay analysis
 
-        :param pulses: extracted pulses
-        :type pulses: list
+        :param decay: decay time in ns
+        :type decay: float
         :returns: None
         """
-        decay = self.trigger.trigger(
-                pulses, single_channel=self.single_pulse_channel,
-                double_channel=self.double_pulse_channel,
-                veto_channel=self.veto_pulse_channel,
-                min_decay_time=self.decay_min_time,
-                min_single_pulse_width=self.min_single_pulse_width,
-                max_single_pulse_width=self.max_single_pulse_width,
-                min_double_pulse_width=self.min_double_pulse_width,
-                max_double_pulse_width=self.max_double_pulse_width)
-
         if decay is not None:
             when = datetime.datetime.utcnow()
             self.event_data.append((decay / 1000, 
                                     when.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]))
             self.muon_counter += 1
             self.last_event_time = when
+            self.decay_times.append(decay / 1000.)
             self.logger.info("We have found a decaying muon with a " +
                              "decay time of %f at %s" % (decay, when))
+            self.changed(True)
+
+    def calculate_stream(self, decays):
+        """
+        Counts the decays found across trigger windows by the
+        streaming decay analysis. They are written to the decay file
+        as 'StreamDecay' by the analysis worker, the histogram shows the
+        decays found within the trigger windows only.
+
+        :param decays: decay times in ns
+        :type decays: list of floats
+        :returns: None
+        """
+        self.stream_counter += len(decays)
 
     def update(self):
         """
@@ -1516,18 +1658,26 @@ class DecayWidget(BaseWidget):
 
         self.fit_button.setEnabled(True)
         self.fit_range_button.setEnabled(True)
+        if (self.unbinned_fit_worker is None or
+                not self.unbinned_fit_worker.is_alive()):
+            self.unbinned_fit_button.setEnabled(True)
         self.plot_canvas.update_plot(decay_times)
 
         self.muon_counter_label.setText("We have %d decayed muons " %
                                         self.muon_counter)
+        self.stream_counter_label.setText(
+                "%d decays found across trigger windows" %
+                self.stream_counter)
         self.last_event_label.setText(
                 "Last detected decay at time %s " %
                 self.last_event_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
 
-        for decay in self.event_data:
-            decay_time = decay[1]#.replace(' ', '_')
-            self.mu_file.write("%s Decay %s\n" % (repr(decay_time),
-                                                  repr(decay[0])))
+        estimate = self.lifetime_estimator.estimate()
+
+        if estimate is not None:
+            self.lifetime_label.setText(
+                    "Lifetime estimate: (%.2f +- %.2f) microseconds" %
+                    estimate[:2])
 
         self.event_data = []
 
@@ -1577,7 +1727,7 @@ class DecayWidget(BaseWidget):
 
             self.logger.info("Switching off velocity measurement if running!")
 
-            if self.parent.is_widget_active("decay"):
+            if self.parent.is_widget_active("velocity"):
                 self.parent.get_widget("velocity").stop()
 
             self.logger.warn("We now activate the muon decay mode!\n" +
@@ -1614,6 +1764,34 @@ class DecayWidget(BaseWidget):
 
             self.active(True)
 
+            # decay trigger
+            registry = self.parent.analysis_registry
+            self.parent.subscribe_analysis("decay", self.calculate)
+            registry.subscribe("decay", self.file_sink)
+            registry.register(DecayAnalysis(
+                    "decay", single_channel=self.single_pulse_channel,
+                    double_channel=self.double_pulse_channel,
+                    veto_channel=self.veto_pulse_channel,
+                    min_decay_time=self.decay_min_time,
+                    min_single_pulse_width=self.min_single_pulse_width,
+                    max_single_pulse_width=self.max_single_pulse_width,
+                    min_double_pulse_width=self.min_double_pulse_width,
+                    max_double_pulse_width=self.max_double_pulse_width))
+
+            # decay finder on the pulse stream, running alongside
+            self.parent.subscribe_analysis("decay_stream",
+                                           self.calculate_stream)
+            registry.subscribe("decay_stream", self.stream_file_sink)
+            registry.register(StreamingDecayAnalysis(
+                    "decay_stream", single_channel=self.single_pulse_channel,
+                    double_channel=self.double_pulse_channel,
+                    veto_channel=self.veto_pulse_channel,
+                    min_decay_time=self.decay_min_time,
+                    min_single_pulse_width=self.min_single_pulse_width,
+                    max_single_pulse_width=self.max_single_pulse_width,
+                    min_double_pulse_width=self.min_double_pulse_width,
+                    max_double_pulse_width=self.max_double_pulse_width))
+
             # restart rate measurement
             self.parent.get_widget("rate").stop()
             self.parent.get_widget("rate").start()
@@ -1645,6 +1823,9 @@ class DecayWidget(BaseWidget):
         self.logger.info("Muon decay mode now deactivated, returning to " +
                          "previous setting (if available)")
 
+        self.parent.analysis_registry.unregister("decay")
+        self.parent.analysis_registry.unregister("decay_stream")
+
         self.mu_file.write("# stopped run on: %s\n" %
                            stop_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
         self.mu_file.close()
@@ -1668,6 +1849,8 @@ class DecayWidget(BaseWidget):
 
         :returns: None
         """
+        self.fitter.close()
+
         if not self.mu_file.closed:
             stop_time = datetime.datetime.utcnow()
 
@@ -1702,11 +1885,14 @@ class DAQWidget(BaseWidget):
     :type filename: str
     :param parent: parent widget
     """
+    # interval of the log refreshs in ms
+    LOG_REFRESH_INTERVAL = 250
+
     def __init__(self, logger, filename, parent=None):
         BaseWidget.__init__(self, logger, parent)
 
-        # raw output file
-        self.output_file = WrappedFile(filename)
+        # raw output file, written by the analysis worker
+        self.output_file = LockedFile(filename)
         self.write_raw_file = False
         self.write_status = None
 
@@ -1714,12 +1900,37 @@ class DAQWidget(BaseWidget):
         self.measurement_duration = datetime.timedelta()
         self.start_time = datetime.datetime.utcnow()
 
-        # daq msg log
-        self.daq_msg_log = QtGui.QPlainTextEdit()
-        self.daq_msg_log.setReadOnly(True)
+        # daq msg log, the view only renders the visible lines
+        self.log_model = DAQLogModel(parent=self)
+        self.daq_msg_log = QtGui.QListView()
+        self.daq_msg_log.setModel(self.log_model)
+        self.daq_msg_log.setUniformItemSizes(True)
+        self.daq_msg_log.setEditTriggers(
+                QtGui.QAbstractItemView.NoEditTriggers)
         self.daq_msg_log.setFont(QtGui.QFont("monospace"))
-        # 500 lines history
-        self.daq_msg_log.document().setMaximumBlockCount(500)
+
+        # filters of the log
+        self.filter_checkboxes = dict()
+        filter_layout = QtGui.QHBoxLayout()
+        filter_layout.addWidget(QtGui.QLabel("Show"))
+
+        for kind, label in [(DAQLogModel.TRIGGER, "Trigger data"),
+                            (DAQLogModel.STATUS, "Status"),
+                            (DAQLogModel.ERROR, "Errors")]:
+            checkbox = QtGui.QCheckBox(label)
+            checkbox.setChecked(True)
+            QtCore.QObject.connect(checkbox,
+                                   QtCore.SIGNAL("stateChanged(int)"),
+                                   self.on_filter_changed)
+            filter_layout.addWidget(checkbox)
+            self.filter_checkboxes[kind] = checkbox
+        filter_layout.addStretch()
+
+        # the log is only refreshed while it is visible
+        self.log_timer = QtCore.QTimer(self)
+        QtCore.QObject.connect(self.log_timer,
+                               QtCore.SIGNAL("timeout()"),
+                               self.refresh_log)
 
         # input field and buttons
         self.label = QtGui.QLabel("Command")
@@ -1737,9 +1948,10 @@ class DAQWidget(BaseWidget):
         # add widgets to layout
         layout = QtGui.QGridLayout(self)
         layout.addWidget(self.daq_msg_log, 0, 0, 1, 3)
-        layout.addWidget(self.label, 1, 0)
-        layout.addWidget(self.hello_edit, 1, 1)
-        layout.addWidget(self.file_button, 1, 2)
+        layout.addLayout(filter_layout, 1, 0, 1, 3)
+        layout.addWidget(self.label, 2, 0)
+        layout.addWidget(self.hello_edit, 2, 1)
+        layout.addWidget(self.file_button, 2, 2)
 
     def on_hello_clicked(self):
         """
@@ -1788,37 +2000,69 @@ class DAQWidget(BaseWidget):
             self.output_file.close()
             self.parent.status_bar.removeWidget(self.write_status)
 
-    def update(self):
+    def update(self, messages=()):
         """
-        Update daq msg log
+        Add messages to the daq msg log, they are shown on the next refresh.
 
+        :param messages: daq messages
+        :type messages: list of str
         :returns: None
         """
-        msg = self.daq_get_last_msg()
-        self.daq_msg_log.appendPlainText(msg)
+        self.log_model.add_messages(messages)
 
-        if not self.output_file.closed:
-            self._write_to_file(msg)
+    def refresh_log(self):
+        """
+        Show the new messages, the log keeps following them if it was
+        scrolled to the end.
+
+        :returns: None
+        """
+        if not self.log_model.has_pending():
+            return
+
+        scroll_bar = self.daq_msg_log.verticalScrollBar()
+        at_end = scroll_bar.value() == scroll_bar.maximum()
 
-    def _write_to_file(self, msg):
+        self.log_model.refresh()
+
+        if at_end:
+            self.daq_msg_log.scrollToBottom()
+
+    def on_filter_changed(self, state):
         """
-        Write the "RAW" file
+        Show the kinds of messages selected by the filter checkboxes.
 
-        :param msg: daq message
-        :type msg: str
+        :param state: state of the changed checkbox
+        :type state: int
         :returns: None
         """
-        if get_setting("write_daq_status"):
-            self.output_file.write(str(msg) + "\n")
-        else:
-            # only write lines containing trigger data, discard status lines
-            fields = msg.rstrip("\n").split(" ")
-            if (len(fields) == 16) and (len(fields[0]) == 8):
-                self.output_file.write(str(msg) + "\n")
-            else:
-                self.logger.debug(("Not writing line '%s' to file " +
-                                   "because it does not contain " +
-                                   "trigger data") % msg)
+        kinds = [kind for kind, checkbox in self.filter_checkboxes.items()
+                 if checkbox.isChecked()]
+        self.log_model.set_kinds(kinds + [DAQLogModel.OTHER])
+        self.daq_msg_log.scrollToBottom()
+
+    def showEvent(self, event):
+        """
+        Start refreshing the log when the widget is shown.
+
+        :param event: show event
+        :type event: QtGui.QShowEvent
+        :returns: None
+        """
+        self.refresh_log()
+        self.log_timer.start(self.LOG_REFRESH_INTERVAL)
+        BaseWidget.showEvent(self, event)
+
+    def hideEvent(self, event):
+        """
+        Stop refreshing the log when the widget is hidden.
+
+        :param event: hide event
+        :type event: QtGui.QHideEvent
+        :returns: None
+        """
+        self.log_timer.stop()
+        BaseWidget.hideEvent(self, event)
 
     def finish(self):
         """
@@ -0,0 +1,370 @@
+"""
+Data acquisition without the gui.
+
+The HeadlessApplication runs the same analysis pipeline as the gui and
+writes the same data files: rates (R), pulses (P), raw DAQ data (DAQ),
+decay times (D) and flight times (V). Neither PyQt4 nor matplotlib are
+needed, so muonic can run on a machine without display, e.g. started
+from cron or a service manager. The measurement runs until the duration
+is over or the process gets SIGINT or SIGTERM, then the files are closed
+and renamed like on closing the gui.
+"""
+from __future__ import print_function
+import datetime
+import os
+import queue
+import signal
+import time
+
+from muonic.analysis import PulseExtractor, AnalysisRegistry
+from muonic.analysis import DecayAnalysis, VelocityAnalysis, RateRecorder
+from muonic.analysis.pipeline import AnalysisPipeline, AnalysisThread
+from muonic.analysis.pipeline import RawFileSink, DecayFileSink
+from muonic.analysis.pipeline import VelocityFileSink
+from muonic.daq.messages import parse_thresholds, parse_distances
+from muonic.daq.messages import parse_channel_config, query_configuration
+from muonic.util import update_setting, get_setting
+from muonic.util import apply_default_settings, get_muonic_filename
+from muonic.util import LockedFile, rename_muonic_file
+from muonic.util import get_hours_from_duration
+
+__all__ = ["HeadlessApplication"]
+
+
+class _RunFile(object):
+    """
+    Data file which is open during the whole measurement.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param filename: the filename
+    :type filename: str
+    :param description: measurement name for the log
+    :type description: str
+    """
+
+    def __init__(self, logger, filename, description):
+        self.logger = logger
+        self.data_file = LockedFile(filename)
+        self.description = description
+        self.start_time = None
+
+    def open(self, header):
+        """
+        Open the file and write the header line with the start time.
+
+        :param header: header with a placeholder for the start time
+        :type header: str
+        :returns: None
+        """
+        self.start_time = datetime.datetime.utcnow()
+        self.data_file.open("a")
+        self.data_file.write(header % self.start_time.strftime(
+                "%a %d %b %Y %H:%M:%S UTC"))
+
+    def finish(self):
+        """
+        Close and rename the file.
+
+        :returns: None
+        """
+        if self.data_file.closed:
+            return
+
+        stop_time = datetime.datetime.utcnow()
+        duration = stop_time - self.start_time
+
+        self.data_file.write("# stopped run on: %s\n" %
+                             stop_time.strftime("%a %d %b %Y %H:%M:%S UTC"))
+        self.data_file.close()
+
+        if os.path.exists(self.data_file.get_filename()):
+            try:
+                self.logger.info("The %s was active for %f hours" %
+                                 (self.description,
+                                  get_hours_from_duration(duration)))
+                rename_muonic_file(duration, self.data_file.get_filename())
+            except (OSError, IOError):
+                pass
+
+
+class HeadlessApplication(object):
+    """
+    Measurement without gui
+
+    :param daq: daq card connection
+    :type daq: muonic.daq.provider.BaseDAQProvider
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param opts: command line options
+    :type opts: Namespace
+    """
+
+    def __init__(self, daq, logger, opts):
+        # start time of the application
+        self.start_time = datetime.datetime.utcnow()
+
+        # apply default settings first
+        apply_default_settings()
+
+        self.daq = daq
+        self.logger = logger
+        self.opts = opts
+
+        # store command line settings
+        update_setting("write_pulses", opts.write_pulses)
+        update_setting("write_daq_status", opts.write_daq_status)
+        update_setting("time_window", opts.time_window)
+
+        if not opts.write_daq_status:
+            # disable status reporting
+            self.daq.put('ST 0')
+
+        # get the last configuration from the card, the coincidence
+        # times are restored after a decay measurement
+        self.coincidence_times = query_configuration(daq, logger)
+
+        self.pulse_extractor = PulseExtractor(
+                logger, get_muonic_filename(self.start_time, "P", opts.user))
+        self.analysis_registry = AnalysisRegistry(logger)
+        self.analysis_pipeline = AnalysisPipeline(logger,
+                                                  self.pulse_extractor,
+                                                  self.analysis_registry)
+
+        self.rate_recorder = RateRecorder(
+                logger, get_muonic_filename(self.start_time, "R", opts.user))
+
+        self.raw_file = None
+        self.decay_file = None
+        self.velocity_file = None
+
+        if opts.write_raw:
+            self.raw_file = _RunFile(logger, get_muonic_filename(
+                    self.start_time, "DAQ", opts.user), "raw data taking")
+            self.analysis_pipeline.add_message_sink(
+                    RawFileSink(self.raw_file.data_file))
+
+        if opts.decay:
+            self.decay_file = _RunFile(logger, get_muonic_filename(
+                    self.start_time, "D", opts.user), "muon decay measurement")
+        elif opts.velocity:
+            self.velocity_file = _RunFile(logger, get_muonic_filename(
+                    self.start_time, "V", opts.user),
+                    "muon velocity measurement")
+
+        self.message_handlers = {
+            "TL": lambda msg: parse_thresholds(msg, self.logger),
+            "DL": lambda msg: parse_distances(msg, self.logger),
+            "DC": lambda msg: parse_channel_config(msg, self.logger),
+            "DS": self.rate_recorder.calculate
+        }
+
+        # the analysis thread hands its batches over to the main loop
+        self.batches = queue.Queue()
+        self.analysis_thread = AnalysisThread(logger, self.daq,
+                                              self.analysis_pipeline,
+                                              self.batches.put)
+        self._running = False
+
+    def setup_decay(self):
+        """
+        Configure the DAQ card for the muon decay measurement and
+        register the decay analysis.
+
+        :returns: None
+        """
+        opts = self.opts
+
+        self.logger.warning("We now activate the muon decay mode!\n" +
+                            "All other Coincidence/Veto settings will " +
+                            "be overridden!")
+        self.logger.info("Looking for single pulse in Channel %d" %
+                         opts.single_channel)
+        self.logger.info("Looking for double pulse in Channel %d" %
+                         opts.double_channel)
+        self.logger.info("Using veto pulses in Channel %d" %
+                         opts.veto_channel)
+
+        # configure DAQ card with coincidence/veto settings
+        self.daq.put("CE")
+        self.daq.put("WC 03 04")
+        self.daq.put("WC 02 0A")
+
+        # this should set the veto to none (because we have a
+        # software veto) and the coincidence to single,
+        # so we take all pulses
+        self.daq.put("WC 00 0F")
+
+        self.decay_file.open("# new decay measurement run from: %s\n")
+        self.analysis_registry.subscribe(
+                "decay", DecayFileSink(self.decay_file.data_file))
+
+        # channel index is shifted in the analysis
+        self.analysis_registry.register(DecayAnalysis(
+                "decay", single_channel=opts.single_channel + 1,
+                double_channel=opts.double_channel + 1,
+                veto_channel=opts.veto_channel + 1,
+                min_decay_time=opts.min_decay_time,
+                min_single_pulse_width=0, max_single_pulse_width=100000,
+                min_double_pulse_width=0, max_double_pulse_width=100000))
+
+    def setup_velocity(self):
+        """
+        Register the velocity analysis.
+
+        :returns: None
+        """
+        opts = self.opts
+
+        self.logger.info("Measuring the flight time from channel %d to "
+                         "channel %d" % (opts.upper_channel,
+                                         opts.lower_channel))
+
+        # enable counter
+        self.daq.put("CE")
+
+        self.velocity_file.open("# new velocity measurement run from: %s\n")
+        self.analysis_registry.subscribe(
+                "velocity", VelocityFileSink(self.velocity_file.data_file))
+
+        # channel index is shifted in the analysis
+        self.analysis_registry.register(VelocityAnalysis(
+                "velocity", upper_channel=opts.upper_channel + 1,
+                lower_channel=opts.lower_channel + 1))
+
+    def start(self):
+        """
+        Start the measurements and the analysis thread.
+
+        :returns: None
+        """
+        if self.raw_file is not None:
+            self.daq.put("CE")
+            self.raw_file.open("# daq data run from: %s\n")
+
+        if self.decay_file is not None:
+            self.setup_decay()
+            measurement_type = "rate+decay"
+        elif self.velocity_file is not None:
+            self.setup_velocity()
+            measurement_type = "rate+velocity"
+        else:
+            measurement_type = "rate"
+
+        if (get_setting("write_pulses") or self.decay_file is not None or
+                self.velocity_file is not None):
+            self.daq.put("CE")
+            self.pulse_extractor.write_pulses(True)
+
+        self.rate_recorder.start(measurement_type)
+        self.analysis_thread.start()
+        self._running = True
+
+    def process_batch(self, batch):
+        """
+        Handle the control messages of a batch.
+
+        :param batch: batch of the analysis thread
+        :type batch: muonic.analysis.pipeline.AnalysisBatch
+        :returns: None
+        """
+        for msg in batch.messages:
+            handler = self.message_handlers.get(msg[:2])
+
+            if handler is not None:
+                handler(msg)
+
+    def run(self, duration=None):
+        """
+        Run the measurement until stop is called or the duration is over.
+        The scalars are queried every time window.
+
+        :param duration: duration of the measurement in seconds, run until
+                         stopped if None
+        :type duration: float
+        :returns: None
+        """
+        time_window = get_setting("time_window")
+        end_time = None
+
+        if duration is not None:
+            end_time = time.time() + duration
+
+        self.start()
+
+        # the first scalars begin the first time window
+        self.rate_recorder.query_scalars(self.daq.put)
+        next_query = time.time() + time_window
+
+        while self._running:
+            now = time.time()
+
+            if end_time is not None and now >= end_time:
+                break
+
+            if now >= next_query:
+                self.rate_recorder.query_scalars(self.daq.put)
+                next_query += time_window
+                continue
+
+            try:
+                batch = self.batches.get(timeout=min(next_query - now, 1.))
+            except queue.Empty:
+                continue
+
+            self.process_batch(batch)
+
+        self.finish()
+
+    def stop(self, *args):
+        """
+        Stop the measurement, can be used as signal handler.
+
+        :returns: None
+        """
+        self._running = False
+
+    def finish(self):
+        """
+        Stop the analysis thread, restore the DAQ card configuration and
+        close and rename the data files.
+
+        :returns: None
+        """
+        self.logger.info("Finishing measurement")
+
+        # stop the analysis thread before closing the files
+        self.analysis_thread.stop()
+
+        # handle the control messages of the last batches
+        while not self.batches.empty():
+            self.process_batch(self.batches.get())
+
+        if self.decay_file is not None:
+            self.analysis_registry.unregister("decay")
+
+            # reset coincidence times
+            if self.coincidence_times is not None:
+                self.daq.put("WC 03 " + self.coincidence_times[0])
+                self.daq.put("WC 02 " + self.coincidence_times[1])
+
+            self.decay_file.finish()
+
+        if self.velocity_file is not None:
+            self.analysis_registry.unregister("velocity")
+            self.velocity_file.finish()
+
+        if self.raw_file is not None:
+            self.raw_file.finish()
+
+        self.rate_recorder.finish()
+        self.pulse_extractor.finish()
+
+    def install_signal_handlers(self):
+        """
+        Stop the measurement on SIGINT and SIGTERM.
+
+        :returns: None
+        """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
@@ -3,5 +3,7 @@ Utility module
 """
 from .settings_store import *
 from .helpers import *
+from .ring_buffer import *
+from .tracing import *
 
-__all__ = ["helpers", "settings_store"]
+__all__ = ["helpers", "ring_buffer", "settings_store", "tracing"]
@@ -4,6 +4,14 @@ Utility functions
 from __future__ import print_function
 import os
 import shutil
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
 
 from muonic import DATA_PATH
 
@@ -121,6 +129,25 @@ def format_date(date, fmt="%Y-%m-%d_%H-%M-%S"):
     return date.strftime(fmt)
 
 
+def get_memory_usage():
+    """
+    Get the peak resident set size of the process in bytes.
+
+    Returns None if it can not be determined on this platform.
+
+    :returns: int or None
+    """
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes, linux kilobytes
+    if sys.platform == "darwin":
+        return max_rss
+    return max_rss * 1024
+
+
 class WrappedFile(object):
     """
     A file wrapper which keeps track of open files.
@@ -242,3 +269,57 @@ class WrappedFile(object):
         :returns: set of str
         """
         return WrappedFile.open_files
+
+
+class LockedFile(WrappedFile):
+    """
+    A WrappedFile which can be written from a worker thread while another
+    thread opens and closes it. Writes to the closed file are dropped.
+
+    Raises ValueError if filename is None.
+
+    :param filename: the filename
+    :type filename: str
+    :raises: ValueError
+    """
+
+    def __init__(self, filename):
+        WrappedFile.__init__(self, filename)
+        self._lock = threading.RLock()
+
+    def open(self, mode='w'):
+        """
+        Open file and track it.
+
+        :param mode: the file mode
+        :type mode: str
+        :returns: None
+        """
+        with self._lock:
+            return WrappedFile.open(self, mode)
+
+    def close(self):
+        """
+        Close file and un-track it.
+
+        Raises IOError if file is not open.
+
+        :raises: IOError
+        :returns: None
+        """
+        with self._lock:
+            WrappedFile.close(self)
+
+    def write(self, data):
+        """
+        Write data if the file is open.
+
+        :param data: the data
+        :type data: str
+        :returns: bool -- False if the file was closed
+        """
+        with self._lock:
+            if self._file is None:
+                return False
+            self._file.write(data)
+            return True
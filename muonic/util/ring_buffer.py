@@ -0,0 +1,104 @@
+"""
+Fixed size ring buffer of numeric rows backed by a numpy array.
+
+Every row is written twice, at its position and one capacity further, so
+the buffered rows in insertion order are always a contiguous slice of the
+array. Appending a row and getting the buffered rows both take constant
+time, no matter how many rows the buffer holds.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+__all__ = ["RingBuffer"]
+
+
+class RingBuffer(object):
+    """
+    Holds the last 'capacity' rows of 'columns' values each.
+
+    Raises ValueError if capacity or columns are not positive.
+
+    :param capacity: maximum number of rows
+    :type capacity: int
+    :param columns: number of values per row
+    :type columns: int
+    :param dtype: type of the values
+    :type dtype: numpy.dtype
+    :raises: ValueError
+    """
+
+    def __init__(self, capacity, columns=1, dtype=float):
+        if capacity < 1 or columns < 1:
+            raise ValueError("capacity and number of columns have to be " +
+                             "positive")
+
+        self.capacity = int(capacity)
+        self.columns = int(columns)
+        self._data = np.zeros((2 * self.capacity, self.columns), dtype=dtype)
+        self._start = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def clear(self):
+        """
+        Remove all rows.
+
+        :returns: None
+        """
+        self._start = 0
+        self._length = 0
+
+    def append(self, row):
+        """
+        Add a row, the oldest row is dropped if the buffer is full.
+
+        :param row: values of the row
+        :type row: sequence of numbers
+        :returns: None
+        """
+        if self._length < self.capacity:
+            index = self._start + self._length
+            self._length += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.capacity
+
+        index %= self.capacity
+        self._data[index] = row
+        self._data[index + self.capacity] = row
+
+    def values(self):
+        """
+        Get the buffered rows, oldest first. The returned array is a view,
+        which is changed by later appends.
+
+        :returns: numpy.ndarray -- array of shape (len(self), columns)
+        """
+        return self._data[self._start:self._start + self._length]
+
+    def column(self, index):
+        """
+        Get the buffered values of a column, oldest first. The returned
+        array is a view, which is changed by later appends.
+
+        :param index: column index
+        :type index: int
+        :returns: numpy.ndarray
+        """
+        return self.values()[:, index]
+
+    def last(self):
+        """
+        Get the most recent row.
+
+        Raises IndexError if the buffer is empty.
+
+        :returns: numpy.ndarray
+        :raises: IndexError
+        """
+        if not self._length:
+            raise IndexError("ring buffer is empty")
+        return self._data[self._start + self._length - 1]
@@ -0,0 +1,284 @@
+"""
+Lightweight tracing for the hot paths of the analysis and the DAQ reader.
+
+A tracer records structured events (timestamp, event name, event id, reason
+code and a value) into a fixed size ring buffer. Only every n-th event is
+recorded according to the sample rate. Call sites check the 'enabled'
+attribute before recording anything, so a disabled tracer costs a single
+attribute lookup:
+
+    if TRACER.enabled:
+        TRACER.record("decay_rejected", code=REJECT_VETO)
+
+The ring buffer can be dumped to a file on demand or when an error occurs.
+Every process dumps its own tracers, e.g. the DAQ reader process writes the
+'daq' trace when it stops. dump_traces_on_signal passes the signal on to
+the child processes, so 'kill -USR1 <pid>' dumps the traces of all
+processes of muonic.
+"""
+from __future__ import print_function
+from contextlib import contextmanager
+import datetime
+import multiprocessing as mp
+import os
+import time
+
+from muonic.util.helpers import get_data_directory
+
+__all__ = ["Tracer", "get_tracer", "configure_tracing", "dump_traces",
+           "dump_traces_on_signal"]
+
+DEFAULT_BUFFER_SIZE = 10000
+
+# configuration applied to tracers created later on
+_config = {"enabled": False, "sample_rate": 1.0,
+           "size": DEFAULT_BUFFER_SIZE}
+
+_tracers = dict()
+
+
+class Tracer(object):
+    """
+    Records structured events into a ring buffer.
+
+    Raises ValueError if the buffer size or the sample rate are invalid.
+
+    :param name: tracer name, e.g. the module name
+    :type name: str
+    :param size: number of events kept
+    :type size: int
+    :param sample_rate: fraction of events recorded, between 0 and 1
+    :type sample_rate: float
+    :param enabled: record events
+    :type enabled: bool
+    :raises: ValueError
+    """
+
+    def __init__(self, name, size=DEFAULT_BUFFER_SIZE, sample_rate=1.0,
+                 enabled=False):
+        self.name = name
+        self.enabled = enabled
+        self._size = 0
+        self._sample_every = 1
+        self.configure(size, sample_rate)
+
+    def configure(self, size=None, sample_rate=None):
+        """
+        Change buffer size and sample rate. Changing the buffer size clears
+        the recorded events.
+
+        Raises ValueError if the buffer size or the sample rate are invalid.
+
+        :param size: number of events kept
+        :type size: int
+        :param sample_rate: fraction of events recorded, between 0 and 1
+        :type sample_rate: float
+        :returns: None
+        :raises: ValueError
+        """
+        if sample_rate is not None:
+            if not 0 < sample_rate <= 1:
+                raise ValueError("sample rate has to be in (0, 1]")
+            self._sample_every = max(1, int(round(1. / sample_rate)))
+
+        if size is not None and size != self._size:
+            if size < 1:
+                raise ValueError("buffer size has to be positive")
+            self._size = size
+            self.clear()
+
+    def clear(self):
+        """
+        Remove all recorded events.
+
+        :returns: None
+        """
+        self._buffer = [None] * self._size
+        self._index = 0
+        self._recorded = 0
+        self._skipped = 0
+
+    def record(self, event, event_id=None, code=0, value=None):
+        """
+        Record an event, subject to sampling. Check 'enabled' before
+        calling this, the check is not repeated here.
+
+        :param event: event name
+        :type event: str
+        :param event_id: id of the event, e.g. a trigger count
+        :type event_id: object
+        :param code: reason code
+        :type code: int
+        :param value: payload, e.g. a time or a tuple of counts
+        :type value: object
+        :returns: None
+        """
+        self._skipped += 1
+
+        if self._skipped < self._sample_every:
+            return
+
+        self._skipped = 0
+        self._buffer[self._index] = (time.time(), event, event_id,
+                                     code, value)
+        self._index = (self._index + 1) % self._size
+        self._recorded += 1
+
+    def events(self):
+        """
+        Get the recorded events in the order they were recorded.
+
+        :returns: list of tuples -- timestamp, event name, event id,
+                  reason code and value
+        """
+        if self._recorded < self._size:
+            return self._buffer[:self._index]
+        return self._buffer[self._index:] + self._buffer[:self._index]
+
+    def get_filename(self, directory=None):
+        """
+        Get a file name for a dump, named after the tracer, the process id
+        and the current time, so that dumps do not overwrite each other.
+
+        :param directory: directory of the file, defaults to the data
+                          directory
+        :type directory: str
+        :returns: str
+        """
+        if directory is None:
+            directory = get_data_directory()
+
+        return os.path.join(directory, "trace_%s_%d_%s.txt" % (
+                self.name, os.getpid(), datetime.datetime.utcnow().strftime(
+                        "%Y-%m-%d_%H-%M-%S.%f")[:-3]))
+
+    def recorded(self):
+        """
+        Get the number of events recorded since the last clear.
+
+        :returns: int
+        """
+        return self._recorded
+
+    def dump(self, filename=None):
+        """
+        Write the recorded events to a file, one event per line.
+
+        :param filename: file to write, defaults to get_filename
+        :type filename: str
+        :returns: str -- the filename
+        """
+        if filename is None:
+            filename = self.get_filename()
+
+        events = self.events()
+
+        with open(filename, "w") as trace_file:
+            trace_file.write("# trace '%s' with %d of %d recorded events, " %
+                             (self.name, len(events), self._recorded) +
+                             "sampling every %d event(s)\n" %
+                             self._sample_every)
+            for timestamp, event, event_id, code, value in events:
+                trace_file.write("%.6f %s %s %d %s\n" % (
+                    timestamp, event, repr(event_id), code, repr(value)))
+
+        return filename
+
+    @contextmanager
+    def dump_on_error(self, filename=None):
+        """
+        Context manager dumping the recorded events if an exception is
+        raised in its block. The exception is re-raised.
+
+        :param filename: file to write, see dump
+        :type filename: str
+        """
+        try:
+            yield self
+        except Exception:
+            if self.enabled:
+                self.dump(filename)
+            raise
+
+
+def get_tracer(name):
+    """
+    Get the tracer of that name, it is created with the
+    current configuration if it does not exist yet.
+
+    :param name: tracer name
+    :type name: str
+    :returns: Tracer
+    """
+    if name not in _tracers:
+        _tracers[name] = Tracer(name, size=_config["size"],
+                                sample_rate=_config["sample_rate"],
+                                enabled=_config["enabled"])
+    return _tracers[name]
+
+
+def configure_tracing(enabled=None, sample_rate=None, size=None):
+    """
+    Configure all existing and future tracers. Processes started later on
+    inherit the configuration.
+
+    :param enabled: record events
+    :type enabled: bool
+    :param sample_rate: fraction of events recorded, between 0 and 1
+    :type sample_rate: float
+    :param size: number of events kept per tracer
+    :type size: int
+    :returns: None
+    """
+    if enabled is not None:
+        _config["enabled"] = enabled
+    if sample_rate is not None:
+        _config["sample_rate"] = sample_rate
+    if size is not None:
+        _config["size"] = size
+
+    for tracer in _tracers.values():
+        tracer.enabled = _config["enabled"]
+        tracer.configure(size, sample_rate)
+
+
+def dump_traces(directory=None):
+    """
+    Dump the events of all enabled tracers of this process. Tracers
+    without recorded events are skipped, e.g. the 'daq' tracer of the
+    gui process, the DAQ is traced in the reader process.
+
+    :param directory: directory to write the files to, defaults to the
+                      data directory
+    :type directory: str
+    :returns: list of str -- the filenames
+    """
+    filenames = []
+
+    for tracer in _tracers.values():
+        if not tracer.enabled or not tracer.recorded():
+            continue
+
+        filenames.append(tracer.dump(tracer.get_filename(directory)))
+
+    return filenames
+
+
+def dump_traces_on_signal(signum, frame):
+    """
+    Signal handler dumping the traces of this process and passing the
+    signal on to the child processes, e.g. the DAQ reader process. The
+    child processes inherit the handler and dump their own traces.
+
+    :param signum: signal number
+    :type signum: int
+    :param frame: current stack frame
+    :returns: None
+    """
+    dump_traces()
+
+    for child in mp.active_children():
+        try:
+            os.kill(child.pid, signum)
+        except OSError:
+            pass
@@ -32,7 +32,7 @@ setup(name=muonic.__name__,
       download_url=muonic.__download_url__,
       install_requires=["future", "matplotlib", "numpy", "pyserial", "scipy"],
       platforms=["Ubuntu 12.04"],
-      scripts=["bin/muonic", "bin/which_tty_daq"],
+      scripts=["bin/muonic", "bin/muonic-headless", "bin/which_tty_daq"],
       packages=["muonic", "muonic.analysis", "muonic.daq",
                 "muonic.gui", "muonic.util"],
       package_data={"muonic": ["daq/simdaq.txt", "gui/daq_commands_help.txt",